@@ -1,17 +1,31 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Flask, Blueprint, current_app, render_template, request, redirect, url_for, flash, session, jsonify, Response, stream_with_context, g, has_request_context, send_from_directory, abort
+from flask.cli import with_appcontext
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, table, column
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
 from werkzeug.security import generate_password_hash, check_password_hash
-from openai import OpenAI
-from fuzzywuzzy import fuzz, process
-import random, google.genai as genai, os, re, resend
+from rapidfuzz import fuzz, process, utils
+from routing import WalkwayGraph, IndoorGraph, BUILDING_IDS, BUILDING_NAMES, ROUTING_PROFILES
+from cachetools import TTLCache
+from providers import Provider, ProviderPool
+from outbox import OutboxWorker
+from datetime import datetime
+from metrics import Registry, COUNT_BUCKETS
+import sqlite_profile, marker_io, floorplans, assets
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+import random, os, re, hashlib, hmac, threading, json, logging, time, math, gzip, click
 
 os.environ["GRPC_VERBOSITY"] = "ERROR"
 os.environ["GLOG_minloglevel"] = "2"
 
-app = Flask(__name__)
-app.config["SECRET_KEY"] = "sixseven67"
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///cyberpath.db"
-db = SQLAlchemy(app)
+# All routes live on this blueprint; create_app() (bottom of the file) builds the app around it
+bp = Blueprint("main", __name__)
+db = SQLAlchemy()
+sqlite_profile.enable()
+
+log = logging.getLogger("cyberpath")
 
 
 #---------------------------------------------------------------------------------------------------------------------------------
@@ -23,7 +37,7 @@ class User(db.Model):
     email = db.Column(db.String(150), unique=True, nullable=False)
     password = db.Column(db.String(150), nullable=False)
     about_me = db.Column(db.String(500))
-    verified = db.Column(db.Boolean, default=False)
+    verified = db.Column(db.Boolean, default=False, index=True)
 
 class Marker(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -31,7 +45,7 @@ class Marker(db.Model):
     latitude = db.Column(db.Float, nullable=False)
     longitude = db.Column(db.Float, nullable=False)
     description = db.Column(db.Text)
-    category_id = db.Column(db.Integer, db.ForeignKey("category.id"), nullable=True)
+    category_id = db.Column(db.Integer, db.ForeignKey("category.id"), nullable=True, index=True)
     
 class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -48,12 +62,111 @@ class IndoorMarker(db.Model):
     longitude = db.Column(db.Float, nullable=False)
     latitude = db.Column(db.Float, nullable=False)
     description = db.Column(db.Text)
-    category_id = db.Column(db.Integer, db.ForeignKey("category.id"), nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey("category.id"), nullable=True, index=True)
+
+    __table_args__ = (
+        db.Index("ix_indoor_marker_building_floor", "building", "floor"),
+    )
+
+class EmailOutbox(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    to = db.Column(db.String(150), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="pending")  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    claim_token = db.Column(db.String(32), index=True)
+    claimed_at = db.Column(db.DateTime)
+    sent_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    __table_args__ = (
+        db.Index("ix_email_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
 
-with app.app_context():
+class WalkwayChange(db.Model):
+    """An admin change to the walkway network, applied on top of the GeoJSON until it is deleted"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # close, cost, detour
+    fid = db.Column(db.Integer)  # walkway feature, for close and cost
+    factor = db.Column(db.Float)  # cost multiplier, for cost
+    coordinates = db.Column(db.Text)  # JSON [[lng, lat], ...], for detour
+    accessible = db.Column(db.Boolean, default=False)
+    note = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+# create_all() only adds missing tables, so changes to existing tables go here.
+# Append new statements only; each database remembers how far it got in PRAGMA user_version.
+MIGRATIONS = [
+    "CREATE INDEX IF NOT EXISTS ix_indoor_marker_building_floor ON indoor_marker (building, floor)",
+    "CREATE INDEX IF NOT EXISTS ix_marker_category_id ON marker (category_id)",
+    "CREATE INDEX IF NOT EXISTS ix_indoor_marker_category_id ON indoor_marker (category_id)",
+    'CREATE INDEX IF NOT EXISTS ix_user_verified ON "user" (verified)',
+    # R*Tree over outdoor marker positions for /api/markers?bbox=. Triggers keep it in sync, so
+    # every write path (ORM, bulk import, raw SQL) updates it.
+    "CREATE VIRTUAL TABLE IF NOT EXISTS marker_rtree USING rtree(id, min_lng, max_lng, min_lat, max_lat)",
+    "INSERT OR REPLACE INTO marker_rtree SELECT id, longitude, longitude, latitude, latitude FROM marker",
+    "CREATE TRIGGER IF NOT EXISTS marker_rtree_insert AFTER INSERT ON marker BEGIN "
+    "INSERT OR REPLACE INTO marker_rtree VALUES (new.id, new.longitude, new.longitude, new.latitude, new.latitude); END",
+    "CREATE TRIGGER IF NOT EXISTS marker_rtree_update AFTER UPDATE OF latitude, longitude ON marker BEGIN "
+    "UPDATE marker_rtree SET min_lng = new.longitude, max_lng = new.longitude, "
+    "min_lat = new.latitude, max_lat = new.latitude WHERE id = new.id; END",
+    "CREATE TRIGGER IF NOT EXISTS marker_rtree_delete AFTER DELETE ON marker BEGIN "
+    "DELETE FROM marker_rtree WHERE id = old.id; END",
+    # Change counters shared by all worker processes, see shared_version()
+    "CREATE TABLE IF NOT EXISTS data_version (name TEXT PRIMARY KEY, version INTEGER NOT NULL)",
+    # Indoor markers may have no category, like outdoor ones. SQLite cannot drop a NOT NULL, so the
+    # table is copied; category ids that are blank or point at no category become NULL on the way.
+    "CREATE TABLE indoor_marker_new (id INTEGER NOT NULL, building VARCHAR(100) NOT NULL, floor VARCHAR(50) NOT NULL, "
+    "name VARCHAR(150) NOT NULL, longitude FLOAT NOT NULL, latitude FLOAT NOT NULL, description TEXT, "
+    "category_id INTEGER, PRIMARY KEY (id), FOREIGN KEY(category_id) REFERENCES category (id))",
+    "INSERT INTO indoor_marker_new SELECT id, building, floor, name, longitude, latitude, description, "
+    "CASE WHEN category_id IN (SELECT id FROM category) THEN category_id END FROM indoor_marker",
+    "DROP TABLE indoor_marker",
+    "ALTER TABLE indoor_marker_new RENAME TO indoor_marker",
+    "CREATE INDEX IF NOT EXISTS ix_indoor_marker_building_floor ON indoor_marker (building, floor)",
+    "CREATE INDEX IF NOT EXISTS ix_indoor_marker_category_id ON indoor_marker (category_id)",
+]
+
+# Not a model, so create_all() leaves it alone; it is created by the migrations above
+marker_rtree = table("marker_rtree", column("id"), column("min_lng"), column("max_lng"), column("min_lat"), column("max_lat"))
+data_version = table("data_version", column("name"), column("version"))
+
+
+def shared_version(name):
+    """A change counter from the data_version table, read once per request.
+
+    In-memory copies of database data (marker snapshots, the location index, the category registry)
+    are tagged with it, so a write made through any worker process invalidates them in all of them.
+    """
+    if "data_versions" not in g:
+        g.data_versions = dict(db.session.execute(db.select(data_version.c.name, data_version.c.version)).all())
+    return g.data_versions.get(name, 0)
+
+
+def bump_shared_version(*names, connection=None):
+    """Increment shared change counters, in connection's transaction if given, else in their own"""
+    for name in names:
+        statement = sqlite_insert(data_version).values(name=name, version=1).on_conflict_do_update(
+            index_elements=["name"], set_={"version": data_version.c.version + 1})
+        if connection is not None:
+            connection.execute(statement)
+        else:
+            db.session.execute(statement)
+    if connection is None:
+        db.session.commit()
+    g.pop("data_versions", None)
+
+def init_db():
+    """Create missing tables, apply migrations and seed the default categories"""
     #db.drop_all()
     db.create_all()
 
+    with db.engine.begin() as connection:
+        sqlite_profile.run_migrations(connection, MIGRATIONS)
+
     if not Category.query.first():
         db.session.add_all([
             Category(name="Classroom", indoor_only=True),
@@ -70,18 +183,142 @@ with app.app_context():
             Category(name="Others", indoor_only=False)
         ])
         db.session.commit()
-   
 
-@app.route("/")
+
+@click.command("init-db")
+@with_appcontext
+def init_db_command():
+    """Create or upgrade the database schema and seed it: flask --app app init-db"""
+    init_db()
+    click.echo("✅ Database ready")
+
+
+# Categories only change when the defaults are seeded, so they are read once and kept in memory.
+# Any Category write through the ORM bumps the shared version and the next read reloads them.
+category_registry = None  # (version, {id: {"id", "name", "indoor_only"}})
+
+
+@event.listens_for(Category, "after_insert")
+@event.listens_for(Category, "after_update")
+@event.listens_for(Category, "after_delete")
+def bump_category_version(mapper, connection, target):
+    bump_shared_version("categories", connection=connection)
+
+
+def get_categories():
+    """All categories as {id: {"id", "name", "indoor_only"}}, in id order"""
+    global category_registry
+    version = shared_version("categories")
+    if category_registry is None or category_registry[0] != version:
+        rows = db.session.execute(db.select(Category.id, Category.name, Category.indoor_only).order_by(Category.id))
+        category_registry = (version, {r.id: {"id": r.id, "name": r.name, "indoor_only": bool(r.indoor_only)} for r in rows})
+    return category_registry[1]
+
+
+def category_name(category_id):
+    category = get_categories().get(category_id)
+    return category["name"] if category else None
+
+
+# The page as seen by a visitor with no login and no flashed messages: (version, etag, html bytes)
+anonymous_index = None
+
+
+def render_index(user=None):
+    categories = get_categories().values()
+    return render_template("index.html", user=user,
+                           outdoor_categories=[c for c in categories if not c["indoor_only"]],
+                           indoor_categories=[c for c in categories if c["indoor_only"]])
+
+
+@bp.route("/")
 def index():
-    user = None
-    if "user_email" in session:
-        user_email = session["user_email"]
-        user = User.query.filter_by(email=user_email).first()
+    if "user_email" in session or session.get("admin_logged_in") or "_flashes" in session:
+        user = None
+        if "user_email" in session:
+            user = User.query.filter_by(email=session["user_email"]).first()
+        return render_index(user)
+
+    # Anonymous visitors all get the same page, so it is rendered once per category/asset version
+    global anonymous_index
+    version = (shared_version("categories"), tuple(sorted(get_asset_files().items())))
+    if anonymous_index is None or anonymous_index[0] != version:
+        body = render_index().encode()
+        anonymous_index = (version, f"{version[0]}-{hashlib.sha1(body).hexdigest()[:16]}", body)
+
+    response = Response(anonymous_index[2], mimetype="text/html")
+    response.set_etag(anonymous_index[1])
+    response.headers["Cache-Control"] = "no-cache"
+    response.vary.add("Cookie")
+    return response.make_conditional(request)
+
+
+#---------------------------------------------------------------------------------------------------------------------------------
+# Metrics
+#---------------------------------------------------------------------------------------------------------------------------------
+
+registry = Registry()
+
+request_latency = registry.histogram(
+    "cyberpath_http_request_duration_seconds", "Time until the response starts, by endpoint",
+    ["endpoint", "method", "status"])
+request_queries = registry.histogram(
+    "cyberpath_http_request_sql_queries", "SQL statements run per request, by endpoint",
+    ["endpoint"], buckets=COUNT_BUCKETS)
+sql_queries = registry.counter("cyberpath_sql_queries_total", "SQL statements run")
+location_match_latency = registry.histogram(
+    "cyberpath_location_match_seconds", "Time spent fuzzy-matching a chatbot message to a location")
+provider_latency = registry.histogram(
+    "cyberpath_ai_provider_duration_seconds", "AI provider call time (time to first chunk when streaming)",
+    ["provider", "outcome"])
+provider_failures = registry.counter(
+    "cyberpath_ai_provider_failures_total", "AI provider calls that failed or sent nothing", ["provider"])
+
+
+@bp.before_app_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.sql_queries = 0
+
+
+@bp.after_app_request
+def record_request_metrics(response):
+    if "request_started" in g:
+        endpoint = request.endpoint or "unmatched"
+        request_latency.observe(time.perf_counter() - g.request_started,
+                                endpoint=endpoint, method=request.method, status=response.status_code)
+        request_queries.observe(g.sql_queries, endpoint=endpoint)
+    return response
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def count_sql_query(*args):
+    sql_queries.inc()
+    if has_request_context() and "sql_queries" in g:
+        g.sql_queries += 1
+
+
+def record_provider_call(provider, ok, seconds):
+    provider_latency.observe(seconds, provider=provider.name, outcome="ok" if ok else "failed")
+    if not ok:
+        provider_failures.inc(provider=provider.name)
+
+
+LOOPBACK_ADDRESSES = {"127.0.0.1", "::1"}
+
 
-    outdoor_categories = Category.query.filter_by(indoor_only=False).all()
-    indoor_categories = Category.query.filter_by(indoor_only=True).all()
-    return render_template("index.html", outdoor_categories=outdoor_categories, indoor_categories=indoor_categories, user=user)
+@bp.route("/metrics")
+def metrics():
+    """Prometheus scrape endpoint. Closed by default: with METRICS_TOKEN set it needs
+    "Authorization: Bearer <token>", otherwise it only answers scrapes from this machine."""
+    token = current_app.config["METRICS_TOKEN"]
+    if token:
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            return Response("Unauthorized\n", status=401, mimetype="text/plain")
+    # A request relayed by a proxy on this machine also comes from loopback; X-Forwarded-For gives it away
+    elif request.remote_addr not in LOOPBACK_ADDRESSES or "X-Forwarded-For" in request.headers:
+        return Response("Forbidden: set METRICS_TOKEN to scrape from another host\n", status=403, mimetype="text/plain")
+    return Response(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 #---------------------------------------------------------------------------------------------------------------------------------
@@ -90,18 +327,48 @@ def index():
 
 referral_code = 961523
 
-resend.api_key = "pretend-this-is-a-real-resend-api-key"
+resend_api_key = "pretend-this-is-a-real-resend-api-key"
 
-def send_email(to, subject, body):
-    try:
-        resend.Emails.send({
+def send_email_batch(messages):
+    """Deliver a batch of outbox messages through Resend; raises if the batch failed"""
+    import resend  # only the outbox worker needs it, so it is not imported at startup
+    resend.api_key = resend_api_key
+    resend.Batch.send([
+        {
             "from": "CyberPath <no-reply@cyberpath.app>",
-            "to": to,
-            "subject": subject,
-            "text": body
-        })
-    except Exception as e:
-        print("Resend email failed:", e)
+            "to": message["to"],
+            "subject": message["subject"],
+            "text": message["body"]
+        }
+        for message in messages
+    ])
+
+
+outbox_start_lock = threading.Lock()
+
+
+def start_outbox_worker():
+    """Start the outbox worker on first use (first request or first email queued), so CLI commands never run it"""
+    worker = current_app.extensions["outbox_worker"]
+    if worker.ident is None and current_app.config["EMAIL_OUTBOX_WORKER"]:
+        with outbox_start_lock:
+            if worker.ident is None:
+                worker.start()
+                log.info("✅ Email outbox worker started")
+    return worker
+
+
+@bp.before_app_request
+def start_outbox_worker_on_first_request():
+    # Also delivers what was queued before a restart, without waiting for a new email
+    start_outbox_worker()
+
+
+def send_email(to, subject, body):
+    """Queue an email in the outbox; the outbox worker sends it in the background"""
+    db.session.add(EmailOutbox(to=to, subject=subject, body=body))
+    db.session.commit()
+    start_outbox_worker().wake()
 
 
 def is_valid_password(password):
@@ -117,7 +384,7 @@ def is_valid_password(password):
     return True
 
 
-@app.route("/signup", methods=["POST"])
+@bp.route("/signup", methods=["POST"])
 def signup():
     referral = request.form.get("referral")
     email = request.form["email"]
@@ -149,7 +416,7 @@ def signup():
     return jsonify({"success": True, "message": message})
 
 
-@app.route("/api/admins")
+@bp.route("/api/admins")
 def api_admins():
     verified_admins = User.query.filter_by(verified=True).all()
 
@@ -164,7 +431,7 @@ def api_admins():
     return jsonify(admins_list)
 
 
-@app.route("/signin", methods=["POST"])
+@bp.route("/signin", methods=["POST"])
 def signin():
     email = request.form["email"]
     password = request.form["password"]
@@ -173,23 +440,23 @@ def signin():
 
     if not user:
         flash("Invalid email or password!", "error")
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
 
     if not user.verified:
         flash("Your account is not yet verified by an admin.", "error")
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
 
     if check_password_hash(user.password, password):
         session["admin_logged_in"] = True
         session["user_email"] = user.email
         flash("Login successful!", "success")
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
     else:
         flash("Invalid email or password!", "error")
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
 
 
-@app.route("/admin/approve/<int:user_id>", methods=["POST"])
+@bp.route("/admin/approve/<int:user_id>", methods=["POST"])
 def approve_user(user_id):
     if not session.get("admin_logged_in"):
         return jsonify({"success": False, "message": "Not authorized"}), 403
@@ -215,7 +482,7 @@ CyberPath Team
     return jsonify({"success": True, "message": f"{user.email} approved!"})
 
 
-@app.route("/admin/reject/<int:user_id>", methods=["POST"])
+@bp.route("/admin/reject/<int:user_id>", methods=["POST"])
 def reject_user(user_id):
     if not session.get("admin_logged_in"):
         return jsonify({"success": False, "message": "Not authorized"}), 403
@@ -244,7 +511,7 @@ CyberPath Team
     return jsonify({"success": True, "message": f"{user.email} rejected!"})
 
 
-@app.route("/api/pending-approvals")
+@bp.route("/api/pending-approvals")
 def api_pending_users():
     if not session.get("admin_logged_in"):
         return jsonify([])
@@ -253,7 +520,7 @@ def api_pending_users():
     return jsonify([{"id": u.id, "email": u.email} for u in users])
 
 
-@app.route("/delete-admin/<int:user_id>", methods=["POST"])
+@bp.route("/delete-admin/<int:user_id>", methods=["POST"])
 def delete_admin(user_id):
     if session.get("user_email") != "hozhenxiang@gmail.com":
         return jsonify({"success": False, "message": "Unauthorized action."})
@@ -271,15 +538,15 @@ def delete_admin(user_id):
     return jsonify({"success": True, "message": f"Admin {user.email} deleted successfully."})
 
 
-@app.route("/signout", methods=["POST"])
+@bp.route("/signout", methods=["POST"])
 def signout():
     session.pop("admin_logged_in", None)
     session.pop("user_email", None)
     flash("Logged out successfully!", "success")
-    return redirect(url_for("index"))
+    return redirect(url_for("main.index"))
 
 
-@app.route("/forgot-password/send-otp", methods=["POST"])
+@bp.route("/forgot-password/send-otp", methods=["POST"])
 def send_forgot_otp():
     email = request.form["email"]
     user = User.query.filter_by(email=email).first()
@@ -302,7 +569,7 @@ def send_forgot_otp():
     return jsonify({"success": True})
 
 
-@app.route("/forgot-password/verify", methods=["POST"])
+@bp.route("/forgot-password/verify", methods=["POST"])
 def verify_forgot_otp():
     otp = request.form["otp"]
     new_password = request.form["password"]
@@ -337,7 +604,7 @@ def verify_forgot_otp():
     return jsonify({"success": True})
 
 
-@app.route("/forgot-password/reset", methods=["POST"])
+@bp.route("/forgot-password/reset", methods=["POST"])
 def reset_forgot_password_state():
     session.pop("forgot_otp", None)
     session.pop("forgot_email", None)
@@ -345,7 +612,7 @@ def reset_forgot_password_state():
     return "", 204
 
 
-@app.route("/update-about-me", methods=["POST"])
+@bp.route("/update-about-me", methods=["POST"])
 def update_about_me():
     if not session.get("admin_logged_in"):
         return jsonify({"success": False}), 403
@@ -361,7 +628,7 @@ def update_about_me():
 
     return jsonify({"success": True})
 
-@app.route("/api/admin/me")
+@bp.route("/api/admin/me")
 def get_my_admin_profile():
     if not session.get("admin_logged_in"):
         return jsonify({"success": False}), 403
@@ -376,7 +643,7 @@ def get_my_admin_profile():
     })
 
 
-@app.route("/api/admins")
+@bp.route("/api/admins")
 def get_admins():
     if not session.get("admin_logged_in"):
         return jsonify([]), 403
@@ -392,7 +659,7 @@ def get_admins():
     return jsonify(result)
 
 
-@app.route("/api/admin/<int:user_id>")
+@bp.route("/api/admin/<int:user_id>")
 def get_admin_profile(user_id):
     if not session.get("admin_logged_in"):
         return jsonify({"success": False, "message": "Not authorized"}), 403
@@ -408,10 +675,10 @@ def get_admin_profile(user_id):
     })
 
 
-@app.route("/change-email", methods=["POST"])
+@bp.route("/change-email", methods=["POST"])
 def change_email():
     if not session.get("admin_logged_in"):
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
 
     current_email = session.get("user_email")
     password = request.form["password"]
@@ -420,7 +687,7 @@ def change_email():
     existing = User.query.filter_by(email=new_email).first()
     if existing:
         flash("Email already in use!", "change_email_error")
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
 
     user = User.query.filter_by(email=current_email).first()
 
@@ -429,16 +696,16 @@ def change_email():
         db.session.commit()
         session["user_email"] = new_email
         flash("Email changed successfully!", "success")
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
     else:
         flash("Incorrect password!", "change_email_error")
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
 
 
-@app.route("/changepassword", methods=["POST"])
+@bp.route("/changepassword", methods=["POST"])
 def change_password():
     if not session.get("admin_logged_in"):
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
 
     email = session.get("user_email")
     current_password = request.form["current_password"]
@@ -449,75 +716,210 @@ def change_password():
 
     if not user or not check_password_hash(user.password, current_password):
         flash("Current password is incorrect!", "change_password_error")
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
 
     if not is_valid_password(new_password):
         flash("Password must be at least 8 characters long, contain at least one uppercase letter and one number.", "change_password_error")
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
 
     if new_password != confirm_password:
         flash("New passwords do not match!", "change_password_error")
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
 
     if check_password_hash(user.password, new_password):
         flash("New password cannot be the same as the current password!", "change_password_error")
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
 
     user.password = generate_password_hash(new_password)
     db.session.commit()
 
     flash("Password changed successfully!", "success")
-    return redirect(url_for("index"))
+    return redirect(url_for("main.index"))
 
 #---------------------------------------------------------------------------------------------------------------------------------
 # Location Management Functionality
 #---------------------------------------------------------------------------------------------------------------------------------
 
-@app.route("/api/markers")
+# Serialized marker lists are kept in memory and only rebuilt after a marker write (in any worker)
+MAX_MARKER_SNAPSHOTS = 256
+marker_snapshots = {}
+
+
+def bump_marker_version(*buildings):
+    """Call after every committed marker write, with the buildings of any indoor markers written,
+    so every worker rebuilds its snapshots (and those buildings' indoor graphs)"""
+    bump_shared_version("markers", *(f"indoor:{building}" for building in sorted(set(buildings))))
+
+
+def marker_version():
+    return shared_version("markers")
+
+
+def marker_snapshot(key, build):
+    """Return (etag, json bytes) for a marker list, serializing it at most once per version"""
+    version = marker_version()
+    snapshot = marker_snapshots.get(key)
+    if snapshot is None or snapshot[0] != version:
+        body = current_app.json.dumps(build()).encode()
+        # Content hash keeps the ETag right even if a database is swapped under the same counter
+        etag = f"{version}-{hashlib.sha1(body).hexdigest()[:16]}"
+        snapshot = (version, etag, body)
+        # Filter combinations come from the query string, so keep the table bounded
+        if len(marker_snapshots) >= MAX_MARKER_SNAPSHOTS:
+            marker_snapshots.clear()
+        marker_snapshots[key] = snapshot
+    return snapshot[1], snapshot[2]
+
+
+def snapshot_response(etag, body):
+    """JSON response that answers If-None-Match with 304 Not Modified"""
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+
+def serialize_marker(m):
+    return {
+        "id": m.id,
+        "name": m.name,
+        "latitude": m.latitude,
+        "longitude": m.longitude,
+        "description": m.description,
+        "category": category_name(m.category_id),
+        "category_id": m.category_id,
+        "is_indoor": False
+    }
+
+
+def serialize_indoor_marker(im):
+    return {
+        "id": im.id,
+        "building": im.building,
+        "floor": im.floor,
+        "name": im.name,
+        "latitude": im.latitude,
+        "longitude": im.longitude,
+        "description": im.description,
+        "category": category_name(im.category_id),
+        "category_id": im.category_id,
+        "is_indoor": True
+    }
+
+
+CLUSTER_BELOW_ZOOM = 18  # below this map zoom, bbox queries return grid clusters
+CLUSTER_CELL_PX = 60  # cluster grid cell size in screen pixels
+
+
+def parse_bbox(value):
+    """Parse a "minLng,minLat,maxLng,maxLat" query argument, returning None if it is malformed"""
+    try:
+        min_lng, min_lat, max_lng, max_lat = map(float, value.split(","))
+    except (AttributeError, ValueError):
+        return None
+    if min_lng > max_lng or min_lat > max_lat:
+        return None
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def markers_in_bbox(bbox):
+    """Marker filter for a bbox, using the R*Tree to find candidates"""
+    min_lng, min_lat, max_lng, max_lat = bbox
+    r = marker_rtree.c
+    candidates = db.select(r.id).where(
+        (r.max_lng >= min_lng) & (r.min_lng <= max_lng) & (r.max_lat >= min_lat) & (r.min_lat <= max_lat))
+    # The R*Tree stores rounded float32 boxes, so also check the exact position
+    return Marker.id.in_(candidates) & Marker.longitude.between(min_lng, max_lng) & Marker.latitude.between(min_lat, max_lat)
+
+
+def cluster_markers(bbox, zoom):
+    """Group the markers in bbox into grid cells of about CLUSTER_CELL_PX pixels at this zoom.
+
+    Returns (clusters, ids of markers that are alone in their cell). The grid is anchored at
+    (-180, -90) rather than at the bbox, so clusters don't jump around while the map is panned.
+    """
+    # Web Mercator: degrees of longitude per pixel, and latitude degrees shrink by cos(lat)
+    cell_lng = CLUSTER_CELL_PX * 360 / (256 * 2 ** zoom)
+    cell_lat = cell_lng * math.cos(math.radians((bbox[1] + bbox[3]) / 2))
+
+    gx = db.cast((Marker.longitude + 180) / cell_lng, db.Integer)
+    gy = db.cast((Marker.latitude + 90) / cell_lat, db.Integer)
+    cells = db.session.execute(
+        db.select(db.func.count(), db.func.avg(Marker.latitude), db.func.avg(Marker.longitude),
+                  db.func.min(Marker.latitude), db.func.min(Marker.longitude),
+                  db.func.max(Marker.latitude), db.func.max(Marker.longitude), db.func.min(Marker.id))
+        .where(markers_in_bbox(bbox)).group_by(gx, gy)
+    )
+
+    clusters, singles = [], []
+    for count, lat, lng, min_lat, min_lng, max_lat, max_lng, first_id in cells:
+        if count == 1:
+            singles.append(first_id)
+        else:
+            clusters.append({
+                "latitude": lat,
+                "longitude": lng,
+                "count": count,
+                "bounds": [[min_lat, min_lng], [max_lat, max_lng]]
+            })
+    return clusters, singles
+
+
+@bp.route("/api/markers")
 def api_markers():
-    markers = Marker.query.order_by(Marker.id).all()
-    markers_list = [
-        {
-            "id": m.id,
-            "name": m.name,
-            "latitude": m.latitude,
-            "longitude": m.longitude,
-            "description": m.description,
-            "category": m.category.name if m.category else None,
-            "category_id": m.category_id,
-            "is_indoor": False
-        }
-        for m in markers
-    ]
+    """All outdoor markers, or with ?bbox=minLng,minLat,maxLng,maxLat&zoom= only those in view.
+
+    Bbox responses are {"markers": [...], "clusters": [...]}; clusters are only used below
+    CLUSTER_BELOW_ZOOM.
+    """
+    if "bbox" in request.args:
+        bbox = parse_bbox(request.args.get("bbox"))
+        if not bbox:
+            return jsonify({"success": False, "message": "bbox must be minLng,minLat,maxLng,maxLat"}), 400
+        zoom = request.args.get("zoom", type=int)
+
+        clusters = []
+        query = Marker.query
+        if zoom is not None and zoom < CLUSTER_BELOW_ZOOM:
+            clusters, singles = cluster_markers(bbox, zoom)
+            markers = query.filter(Marker.id.in_(singles)).order_by(Marker.id).all() if singles else []
+        else:
+            markers = query.filter(markers_in_bbox(bbox)).order_by(Marker.id).all()
 
-    return jsonify(markers_list)
+        return jsonify({"markers": [serialize_marker(m) for m in markers], "clusters": clusters})
 
+    def build():
+        markers = Marker.query.order_by(Marker.id).all()
+        return [serialize_marker(m) for m in markers]
 
-@app.route("/api/indoor-markers")
-def api_indoor_markers():
-    IndoorMarkers = IndoorMarker.query.order_by(IndoorMarker.id).all()
-    IndoorMarkers_list = [
-        {
-            "id": im.id,
-            "building": im.building,
-            "floor": im.floor,
-            "name": im.name,
-            "latitude": im.latitude,
-            "longitude": im.longitude,
-            "description": im.description,
-            "category": im.category.name if im.category else None,
-            "category_id": im.category_id,
-            "is_indoor": True
-        }
-        for im in IndoorMarkers
-    ]
-    return jsonify(IndoorMarkers_list)
+    return snapshot_response(*marker_snapshot(("markers",), build))
 
 
-@app.route("/add-marker", methods=["POST"])
+@bp.route("/api/indoor-markers")
+def api_indoor_markers():
+    # Optional filters; building + floor is served by ix_indoor_marker_building_floor
+    building = request.args.get("building")
+    floor = request.args.get("floor")
+    category = request.args.get("category")
+
+    def build():
+        query = IndoorMarker.query
+        if building:
+            query = query.filter(IndoorMarker.building == building)
+        if floor:
+            query = query.filter(IndoorMarker.floor == floor)
+        if category:
+            query = query.filter(IndoorMarker.category_id.in_(
+                [c["id"] for c in get_categories().values() if c["name"] == category]))
+        return [serialize_indoor_marker(im) for im in query.order_by(IndoorMarker.id).all()]
+
+    return snapshot_response(*marker_snapshot(("indoor-markers", building, floor, category), build))
+
+
+@bp.route("/add-marker", methods=["POST"])
 def add_marker():
     if not session.get("admin_logged_in"):
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
     
     name = request.form["name"]
     coords = request.form["coords"] 
@@ -525,7 +927,7 @@ def add_marker():
         latitude, longitude = map(float, coords.split(","))
     except ValueError:
         flash("Invalid coordinates!", "error")
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
 
     description = request.form["description"]
     category_id = request.form.get("category_id")
@@ -537,33 +939,37 @@ def add_marker():
     if is_indoor:
         if not building_id or not floor:
             flash("Indoor locations must have a building and floor", "error")
-            return redirect(url_for("index"))
+            return redirect(url_for("main.index"))
         
         new_indoor_marker = IndoorMarker(building=building_id, floor=floor, name=name, latitude=latitude, longitude=longitude, description=description, category_id=category_id)
         db.session.add(new_indoor_marker)
         db.session.commit()
+        bump_marker_version(building_id)
 
         flash("Indoor marker added successfully!", "success")
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
 
     new_marker = Marker(name=name, latitude=latitude, longitude=longitude, description=description, category_id=category_id)
     db.session.add(new_marker)
     db.session.commit()
+    bump_marker_version()
 
     flash("Marker added successfully!", "success")
-    return redirect(url_for("index"))
+    return redirect(url_for("main.index"))
 
 
-@app.route("/edit-marker/<int:marker_id>", methods=["POST"])
+@bp.route("/edit-marker/<int:marker_id>", methods=["POST"])
 def edit_marker(marker_id):
     if not session.get("admin_logged_in"):
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
 
     marker_id = request.form["marker_id"]
     is_indoor = request.form.get("is_indoor") == "1"
 
+    buildings = []
     if is_indoor:
         marker = IndoorMarker.query.get_or_404(marker_id)
+        buildings = [marker.building, request.form["building_id"]]
         marker.building = request.form["building_id"]
         marker.floor = request.form["floor"]
     else:
@@ -571,7 +977,7 @@ def edit_marker(marker_id):
 
     marker.name = request.form["name"]
     marker.description = request.form["description"]
-    marker.category_id = request.form.get("category_id")
+    marker.category_id = request.form.get("category_id") or None
 
     try:
         marker.latitude, marker.longitude = map(
@@ -579,30 +985,572 @@ def edit_marker(marker_id):
         )
     except ValueError:
         flash("Invalid coordinates", "error")
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
 
     db.session.commit()
+    bump_marker_version(*buildings)
 
     flash("Marker updated successfully!", "success")
-    return redirect(url_for("index"))
+    return redirect(url_for("main.index"))
 
 
-@app.route("/delete-marker/<int:marker_id>", methods=["POST"])
+@bp.route("/delete-marker/<int:marker_id>", methods=["POST"])
 def delete_marker(marker_id):
     if not session.get("admin_logged_in"):
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
 
     marker = Marker.query.get(marker_id)
     if marker:
         db.session.delete(marker)
         db.session.commit()
-        return redirect(url_for("index"))
+        bump_marker_version()
+        return redirect(url_for("main.index"))
 
     indoor_marker = IndoorMarker.query.get_or_404(marker_id)
     db.session.delete(indoor_marker)
     db.session.commit()
+    bump_marker_version(indoor_marker.building)
 
-    return redirect(url_for("index"))
+    return redirect(url_for("main.index"))
+
+
+MAX_IMPORT_ERRORS = 100
+
+
+def marker_file_format(filename=None):
+    """"csv" or "geojson", from ?format=, the uploaded file name or the Content-Type"""
+    fmt = request.args.get("format")
+    if fmt:
+        return "csv" if fmt.lower() == "csv" else "geojson"
+    if filename:
+        return "csv" if filename.lower().endswith(".csv") else "geojson"
+    return "csv" if request.mimetype == "text/csv" else "geojson"
+
+
+@bp.route("/api/admin/markers/import", methods=["POST"])
+def import_markers():
+    """Bulk upsert markers from a GeoJSON FeatureCollection or a CSV file in one transaction.
+
+    Rows with an id (as exported) update that marker; others are matched on name (outdoor) or on
+    (building, floor, name) (indoor). Nothing is written unless every row is valid; ?dry_run=1 only validates.
+    """
+    if not session.get("admin_logged_in"):
+        return jsonify({"success": False, "message": "Not authorized"}), 403
+
+    upload = request.files.get("file")
+    stream = upload.stream if upload else request.stream
+    fmt = marker_file_format(upload.filename if upload else None)
+    categories = {c["name"].lower(): c["id"] for c in get_categories().values()}
+
+    outdoor, indoor, errors = [], [], []
+    try:
+        for number, fields in marker_io.read_rows(stream, fmt):
+            try:
+                row = marker_io.clean_row(fields, categories)
+            except ValueError as e:
+                errors.append({"row": number, "message": str(e)})
+                continue
+            (indoor if "building" in row else outdoor).append(row)
+    except (marker_io.MarkerFileError, UnicodeDecodeError) as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    if errors:
+        return jsonify({
+            "success": False,
+            "message": f"{len(errors)} invalid rows, nothing was imported",
+            "errors": errors[:MAX_IMPORT_ERRORS]
+        }), 400
+
+    if request.args.get("dry_run") == "1":
+        return jsonify({"success": True, "dry_run": True, "outdoor": len(outdoor), "indoor": len(indoor)})
+
+    try:
+        outdoor_inserted, outdoor_updated = marker_io.upsert_rows(db.session, Marker, ["name"], outdoor)
+        indoor_inserted, indoor_updated = marker_io.upsert_rows(
+            db.session, IndoorMarker, ["building", "floor", "name"], indoor)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    bump_marker_version(*(row["building"] for row in indoor))
+
+    log.info("📥 Imported markers: %d inserted, %d updated",
+             outdoor_inserted + indoor_inserted, outdoor_updated + indoor_updated)
+    return jsonify({
+        "success": True,
+        "inserted": outdoor_inserted + indoor_inserted,
+        "updated": outdoor_updated + indoor_updated
+    })
+
+
+@bp.route("/api/admin/markers/export")
+def export_markers():
+    """All outdoor and indoor markers as GeoJSON (default) or ?format=csv, streamed in batches"""
+    if not session.get("admin_logged_in"):
+        return jsonify({"success": False, "message": "Not authorized"}), 403
+
+    fmt = marker_file_format()
+    categories = {c["id"]: c["name"] for c in get_categories().values()}
+
+    def rows():
+        outdoor = db.select(Marker.id, Marker.name, Marker.latitude, Marker.longitude, Marker.description, Marker.category_id)
+        for m in db.session.execute(outdoor.order_by(Marker.id).execution_options(yield_per=marker_io.BATCH_SIZE)):
+            yield {"id": m.id, "name": m.name, "latitude": m.latitude, "longitude": m.longitude, "description": m.description,
+                   "category": categories.get(m.category_id), "building": None, "floor": None}
+
+        indoor = db.select(IndoorMarker.id, IndoorMarker.name, IndoorMarker.latitude, IndoorMarker.longitude, IndoorMarker.description,
+                           IndoorMarker.category_id, IndoorMarker.building, IndoorMarker.floor)
+        for im in db.session.execute(indoor.order_by(IndoorMarker.id).execution_options(yield_per=marker_io.BATCH_SIZE)):
+            yield {"id": im.id, "name": im.name, "latitude": im.latitude, "longitude": im.longitude, "description": im.description,
+                   "category": categories.get(im.category_id), "building": im.building, "floor": im.floor}
+
+    if fmt == "csv":
+        body, mimetype = marker_io.export_csv(rows()), "text/csv"
+    else:
+        body, mimetype = marker_io.export_geojson(rows()), "application/geo+json"
+
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={"Content-Disposition": f'attachment; filename="markers.{fmt}"'})
+
+
+#---------------------------------------------------------------------------------------------------------------------------------
+# Indoor Floor Plans
+#---------------------------------------------------------------------------------------------------------------------------------
+
+FLOOR_IMAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "images")
+FLOOR_TILES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "tiles")
+TILE_NAME = re.compile(r"[0-9a-f]{16}")
+
+
+@click.command("build-floor-tiles")
+def build_floor_tiles_command():
+    """Cut the floor-plan images into tiles (needs Pillow): flask --app app build-floor-tiles"""
+    sizes = floorplans.build_tiles(FLOOR_IMAGES_DIR, FLOOR_TILES_DIR)
+    source = sum(os.path.getsize(os.path.join(FLOOR_IMAGES_DIR, name)) for name in os.listdir(FLOOR_IMAGES_DIR))
+    click.echo(f"✅ Floor tiles written to {FLOOR_TILES_DIR} (source images {source // 1024} KB)")
+    for fmt, size in sizes.items():
+        click.echo(f"   {fmt:<5} {size // 1024:>6} KB")
+
+
+@bp.route("/api/floor-tiles")
+def api_floor_tiles():
+    """Tile manifest for indoor.js; revalidated on every use because it names the current tiles"""
+    response = send_from_directory(FLOOR_TILES_DIR, "manifest.json", mimetype="application/json")
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@bp.route("/floor-tiles/<name>")
+def floor_tile(name):
+    """One floor-plan tile in the best format the browser accepts. Names are content hashes, so it never changes."""
+    if not TILE_NAME.fullmatch(name):
+        abort(404)
+
+    # Browsers that decode AVIF say so explicitly; */* alone does not count
+    fmt = "avif" if "image/avif" in {value for value, _ in request.accept_mimetypes} else "webp"
+
+    response = send_from_directory(FLOOR_TILES_DIR, f"{name}.{fmt}", max_age=365 * 24 * 3600)
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    response.vary.add("Accept")
+    return response
+
+
+#---------------------------------------------------------------------------------------------------------------------------------
+# Routing
+#---------------------------------------------------------------------------------------------------------------------------------
+
+WALKWAY_GEOJSON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "newcampus.geojson")
+
+# Built on the first route request and shared by every request after it. walkway_changes_version is the
+# shared "walkway" version its changes were read at; a change made through another worker bumps it.
+walkway_graph = None
+walkway_changes_version = None
+walkway_graph_lock = threading.Lock()
+
+registry.collected(
+    "cyberpath_route_cache_requests_total", "Route cache lookups by result", "counter",
+    lambda: [(("hit",), walkway_graph.route_cache.hits), (("miss",), walkway_graph.route_cache.misses)]
+            if walkway_graph else [],
+    ["result"])
+
+
+def serialize_walkway_change(c):
+    return {
+        "id": c.id,
+        "kind": c.kind,
+        "fid": c.fid,
+        "factor": c.factor,
+        "coordinates": json.loads(c.coordinates) if c.coordinates else None,
+        "accessible": bool(c.accessible),
+        "note": c.note,
+        "created_at": c.created_at.isoformat()
+    }
+
+
+def walkway_changes():
+    return [serialize_walkway_change(c) for c in WalkwayChange.query.order_by(WalkwayChange.id)]
+
+
+def get_walkway_graph():
+    """Return the walkway graph, loading it on first use, rebuilding it (and its route cache) if the GeoJSON
+    changed and re-applying the walkway changes if any worker changed them"""
+    global walkway_graph, walkway_changes_version
+    version = shared_version("walkway")
+    with walkway_graph_lock:
+        if walkway_graph is None or walkway_graph.is_stale():
+            graph = WalkwayGraph.load(WALKWAY_GEOJSON)
+            log.info("✅ Walkway graph loaded: %d nodes, %d edges", graph.node_count, graph.edge_count)
+            changes = walkway_changes()
+            walkway_graph = graph.with_changes(changes) if changes else graph
+            walkway_changes_version = version
+        elif walkway_changes_version != version:
+            changes = walkway_changes()
+            walkway_graph = walkway_graph.with_changes(changes)
+            walkway_changes_version = version
+            log.info("🚧 Walkway changes reloaded: %d changes, %d cached routes dropped",
+                     len(changes), walkway_graph.routes_dropped)
+    return walkway_graph
+
+
+def apply_walkway_changes():
+    """Bump the shared walkway version and swap in the graph with the changes as of this (uncommitted)
+    transaction; raises ValueError (and keeps the current graph) if one is invalid"""
+    global walkway_graph, walkway_changes_version
+    get_walkway_graph()
+    bump_shared_version("walkway", connection=db.session.connection())
+    # Read inside the transaction, which holds SQLite's write lock until commit, so no other worker's
+    # change can slip in between these changes and this version
+    version = db.session.scalar(db.select(data_version.c.version).where(data_version.c.name == "walkway"))
+    changes = walkway_changes()
+    with walkway_graph_lock:
+        started = time.perf_counter()
+        walkway_graph = walkway_graph.with_changes(changes)
+        walkway_changes_version = version
+        log.info("🚧 Walkway changes applied in %.1f ms: %d changes, %d cached routes dropped",
+                 (time.perf_counter() - started) * 1000, len(changes), walkway_graph.routes_dropped)
+    return walkway_graph
+
+
+# Compact encoding of the current graph: (graph, etag, body, gzipped body)
+walkway_transport = None
+
+
+def get_walkway_transport():
+    """Encode the walkway graph for the client once per graph load"""
+    global walkway_transport
+    graph = get_walkway_graph()
+    if walkway_transport is None or walkway_transport[0] is not graph:
+        body = graph.to_bytes()
+        walkway_transport = (graph, hashlib.sha1(body).hexdigest()[:16], body, gzip.compress(body, 9))
+    return walkway_transport
+
+
+@bp.route("/api/walkway-graph")
+def api_walkway_graph():
+    """The welded walkway graph in the binary format of WalkwayGraph.to_bytes(), pre-gzipped"""
+    _, etag, body, gzipped = get_walkway_transport()
+
+    if request.accept_encodings["gzip"]:
+        response = Response(gzipped, mimetype="application/octet-stream")
+        response.headers["Content-Encoding"] = "gzip"
+        response.set_etag(f"{etag}-gzip")
+    else:
+        response = Response(body, mimetype="application/octet-stream")
+        response.set_etag(etag)
+
+    response.vary.add("Accept-Encoding")
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+
+def parse_lat_lng(value):
+    """Parse a "lat,lng" query argument, returning None if it is malformed"""
+    try:
+        lat, lng = map(float, value.split(","))
+    except (AttributeError, ValueError):
+        return None
+    return lat, lng
+
+
+# Per-building indoor graphs, rebuilt when that building's indoor markers, the categories or the walkway
+# graph change. Builds run on a background thread: requests get the last graph built (for a moment stale
+# after an edit) and only wait, briefly, for a building's very first graph.
+INDOOR_FIRST_BUILD_WAIT = 2.0  # seconds
+indoor_graphs = {}  # building -> (version, IndoorGraph or None if it has no indoor markers)
+indoor_builds = {}  # building -> (version, Future) of the latest build started
+indoor_graphs_lock = threading.Lock()
+indoor_graph_builder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="indoor-graph")
+
+
+def build_indoor_graph(building, markers, walkway, version):
+    try:
+        graph = IndoorGraph(building, markers, walkway, version) if markers else None
+    except Exception:
+        log.exception("❌ Indoor graph for %s failed to build", building)
+        raise
+    with indoor_graphs_lock:
+        indoor_graphs[building] = (version, graph)
+    if graph:
+        log.info("✅ Indoor graph for %s: %d markers on %d floors, %d doors",
+                 building, len(markers), len(graph.floors), len(graph.doors))
+    return graph
+
+
+def get_indoor_graph(building, wait=INDOOR_FIRST_BUILD_WAIT):
+    """Return the latest IndoorGraph for a building id ("fci"), or None if it has no indoor markers (or none built yet).
+
+    Starts a background rebuild if it is out of date. Waits up to `wait` seconds only when the building
+    has no graph at all yet.
+    """
+    walkway = get_walkway_graph()
+    version = (shared_version(f"indoor:{building}"), shared_version("categories"), walkway.version)
+    with indoor_graphs_lock:
+        built = indoor_graphs.get(building)
+        if built and built[0] == version:
+            return built[1]
+
+        build = indoor_builds.get(building)
+        if build is None or build[0] != version:
+            rows = db.session.execute(
+                db.select(IndoorMarker.id, IndoorMarker.name, IndoorMarker.floor, IndoorMarker.latitude,
+                          IndoorMarker.longitude, IndoorMarker.category_id)
+                .where(IndoorMarker.building == building).order_by(IndoorMarker.id))
+            markers = [{"id": r.id, "name": r.name, "floor": r.floor, "latitude": r.latitude,
+                        "longitude": r.longitude, "category": category_name(r.category_id)} for r in rows]
+            build = (version, indoor_graph_builder.submit(build_indoor_graph, building, markers, walkway, version))
+            indoor_builds[building] = build
+
+    if built:
+        return built[1]
+    if wait:
+        try:
+            return build[1].result(timeout=wait)
+        except Exception:
+            return None
+    return None
+
+
+def unknown_profile(profile):
+    return jsonify({"success": False, "message": f"Unknown routing profile '{profile}'"}), 400
+
+
+@bp.route("/api/route")
+def api_route():
+    """Walking route between two points.
+
+    With ?indoor=1 and a building, the route goes through the building's doors to the indoor marker
+    at `to` (narrowed down by optional ?floor= and ?name=), and also returns the floor of each point.
+    ?profile= picks a routing profile (default, step_free or fewer_crossings).
+    """
+    start = parse_lat_lng(request.args.get("from"))
+    end = parse_lat_lng(request.args.get("to"))
+    if not start or not end:
+        return jsonify({"success": False, "message": "from and to must be given as lat,lng"}), 400
+
+    profile = request.args.get("profile") or "default"
+    if profile not in ROUTING_PROFILES:
+        return unknown_profile(profile)
+
+    building = request.args.get("building")
+    indoor = get_indoor_graph(BUILDING_IDS[building]) if request.args.get("indoor") == "1" and building in BUILDING_IDS else None
+    if indoor:
+        marker = indoor.find_marker(*end, floor=request.args.get("floor"), name=request.args.get("name"))
+        route = indoor.route(*start, marker, profile)
+        if route:
+            return jsonify({"success": True, **route})
+
+    route = get_walkway_graph().route(*start, *end, building=building, profile=profile)
+    if not route:
+        return jsonify({"success": False, "message": "No path found between selected points."}), 404
+
+    return jsonify({"success": True, "path": route["path"], "distance": route["distance"]})
+
+
+WALKWAY_CHANGE_KINDS = ("close", "cost", "detour")
+
+
+def parse_walkway_change(data, graph):
+    """A WalkwayChange from admin JSON, or raise ValueError with a readable message"""
+    kind = data.get("kind")
+    if kind not in WALKWAY_CHANGE_KINDS:
+        raise ValueError(f"kind must be one of {', '.join(WALKWAY_CHANGE_KINDS)}")
+    change = WalkwayChange(kind=kind, note=(data.get("note") or "").strip() or None)
+
+    if kind in ("close", "cost"):
+        change.fid = data.get("fid")
+        if change.fid not in graph.base.feature_ids:
+            raise ValueError(f"No walkway with fid {change.fid}")
+    if kind == "cost":
+        try:
+            change.factor = float(data.get("factor"))
+        except (TypeError, ValueError):
+            raise ValueError("factor must be a number")
+        # Only raising costs keeps the straight-line and landmark A* bounds valid
+        if not 1 <= change.factor < math.inf:
+            raise ValueError("factor must be at least 1; close the walkway to stop routing over it")
+    if kind == "detour":
+        coordinates = data.get("coordinates")
+        try:
+            coordinates = [[float(lng), float(lat)] for lng, lat in (point[:2] for point in coordinates)]
+        except (TypeError, ValueError):
+            raise ValueError("coordinates must be a list of [lng, lat] pairs")
+        if len(coordinates) < 2:
+            raise ValueError("A detour needs at least two points")
+        change.coordinates = json.dumps(coordinates)
+        change.accessible = bool(data.get("accessible"))
+    return change
+
+
+@bp.route("/api/admin/walkway/changes")
+def list_walkway_changes():
+    if not session.get("admin_logged_in"):
+        return jsonify({"success": False, "message": "Not authorized"}), 403
+    return jsonify({"success": True, "version": get_walkway_graph().version, "changes": walkway_changes()})
+
+
+@bp.route("/api/admin/walkway/changes", methods=["POST"])
+def add_walkway_change():
+    """Close a walkway (kind=close, fid), raise its cost (kind=cost, fid, factor) or add a detour
+    (kind=detour, coordinates, accessible). Takes effect on the live graph straight away."""
+    if not session.get("admin_logged_in"):
+        return jsonify({"success": False, "message": "Not authorized"}), 403
+
+    try:
+        change = parse_walkway_change(request.get_json(silent=True) or {}, get_walkway_graph())
+        db.session.add(change)
+        db.session.flush()
+        graph = apply_walkway_changes()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    db.session.commit()
+    return jsonify({"success": True, "version": graph.version, "change": serialize_walkway_change(change)})
+
+
+@bp.route("/api/admin/walkway/changes/<int:change_id>", methods=["DELETE"])
+def delete_walkway_change(change_id):
+    """Undo a change: reopen a closed walkway, restore its cost or remove a detour"""
+    if not session.get("admin_logged_in"):
+        return jsonify({"success": False, "message": "Not authorized"}), 403
+
+    change = db.session.get(WalkwayChange, change_id)
+    if not change:
+        return jsonify({"success": False, "message": "Change not found"}), 404
+
+    db.session.delete(change)
+    db.session.flush()
+    graph = apply_walkway_changes()
+    db.session.commit()
+    return jsonify({"success": True, "version": graph.version})
+
+
+MATRIX_MAX_TARGETS = 200
+NEAREST_MAX_K = 20
+
+
+@bp.route("/api/route-matrix")
+def api_route_matrix():
+    """Walking distances from one point to many (?to= repeated), from a single search over the walkway graph.
+
+    distances[i] is in meters for the i-th `to`, or null if it cannot be reached.
+    """
+    start = parse_lat_lng(request.args.get("from"))
+    ends = [parse_lat_lng(value) for value in request.args.getlist("to")]
+    if not start or not ends or None in ends:
+        return jsonify({"success": False, "message": "from and to must be given as lat,lng"}), 400
+    if len(ends) > MATRIX_MAX_TARGETS:
+        return jsonify({"success": False, "message": f"At most {MATRIX_MAX_TARGETS} destinations"}), 400
+
+    profile = request.args.get("profile") or "default"
+    if profile not in ROUTING_PROFILES:
+        return unknown_profile(profile)
+
+    walkway = get_walkway_graph()
+    nodes = [walkway.snap(*end, profile=profile) for end in ends]
+    distances = walkway.distances_from(*start, {node for node in nodes if node is not None}, profile)
+    return jsonify({"success": True,
+                    "distances": [distances[node][1] if node in distances else None for node in nodes]})
+
+
+def find_category(name):
+    """Category record by id or (case-insensitive) name, or None"""
+    categories = get_categories()
+    if str(name).isdigit():
+        return categories.get(int(name))
+    name = str(name).strip().lower()
+    return next((c for c in categories.values() if c["name"].lower() == name), None)
+
+
+def nearest_locations(lat, lng, category, k, profile="default"):
+    """The k markers (outdoor and indoor) of a category closest to a point by walking distance, nearest first.
+
+    Every candidate, and every door of the buildings with indoor candidates, is a target of one search
+    from the snapped origin; indoor markers add the distance from their building's best door. Only buildings
+    with markers in the category are looked at. A building whose indoor graph is not built yet is left out
+    (its build starts in the background) rather than ranked by guessed distances, unless no other
+    candidates are left; only then are the builds waited for, as for a route.
+    """
+    walkway = get_walkway_graph()
+    candidates = []  # (result, walkway node or None, indoor graph or None, indoor marker index)
+
+    rows = db.session.execute(db.select(Marker.name, Marker.latitude, Marker.longitude, Marker.description)
+                              .where(Marker.category_id == category["id"]))
+    for row in rows:
+        node = walkway.snap(row.latitude, row.longitude, profile=profile)
+        if node is not None:
+            candidates.append(({"name": row.name, "latitude": row.latitude, "longitude": row.longitude,
+                                "description": row.description, "building": None, "floor": None,
+                                "is_indoor": False}, node, None, None))
+
+    buildings = db.session.scalars(db.select(IndoorMarker.building).distinct()
+                                   .where(IndoorMarker.category_id == category["id"]))
+    graphs = {building: get_indoor_graph(building, wait=0) for building in buildings if building in BUILDING_NAMES}
+    if not candidates and not any(graphs.values()):
+        graphs = {building: get_indoor_graph(building) for building in graphs}
+
+    for building, graph in graphs.items():
+        for i, marker in enumerate(graph.markers if graph else ()):
+            if marker["category"] == category["name"]:
+                candidates.append(({"name": marker["name"], "latitude": marker["latitude"],
+                                    "longitude": marker["longitude"], "description": None,
+                                    "building": BUILDING_NAMES[building], "floor": marker["floor"],
+                                    "is_indoor": True}, None, graph, i))
+
+    graphs = {graph for _, _, graph, _ in candidates if graph}
+    nodes = {node for _, node, _, _ in candidates if node is not None}
+    nodes.update(node for graph in graphs for _, node, _ in graph.doors)
+
+    distances = walkway.distances_from(lat, lng, nodes, profile)
+    indoor = {graph: graph.marker_distances(distances, profile) for graph in graphs}
+
+    ranked = []
+    for result, node, graph, i in candidates:
+        cost, meters = indoor[graph][i] if graph else distances.get(node, (math.inf, math.inf))
+        if cost < math.inf:
+            ranked.append((cost, dict(result, distance=round(meters, 1))))
+    ranked.sort(key=lambda r: r[0])
+    return [result for _, result in ranked[:k]]
+
+
+@bp.route("/api/nearest")
+def api_nearest():
+    """The ?k= (default 3) nearest markers of ?category= (name or id) from ?from=lat,lng, by walking distance"""
+    start = parse_lat_lng(request.args.get("from"))
+    if not start:
+        return jsonify({"success": False, "message": "from must be given as lat,lng"}), 400
+
+    category = find_category(request.args.get("category", ""))
+    if not category:
+        return jsonify({"success": False, "message": "Unknown category"}), 404
+
+    profile = request.args.get("profile") or "default"
+    if profile not in ROUTING_PROFILES:
+        return unknown_profile(profile)
+
+    k = max(1, min(request.args.get("k", 3, type=int), NEAREST_MAX_K))
+    return jsonify({"success": True, "category": category["name"],
+                    "results": nearest_locations(*start, category, k, profile)})
 
 
 #---------------------------------------------------------------------------------------------------------------------------------
@@ -612,96 +1560,186 @@ def delete_marker(marker_id):
 gemini_api_key = "pretend-this-is-real-api-key"
 openrouter_api_key = "pretend-this-is-real-api-key"
 
-# Initialize client as None
-gemini_client = None
-openrouter_client = None
 
-if gemini_api_key:
-    # Just use the new method - no fallback
+def create_gemini_client(timeout):
+    if not gemini_api_key:
+        log.warning("⚠️ GEMINI_API_KEY not found in environment variables.")
+        return None
+
+    # The SDKs are imported here, on first chatbot use, because they dominate startup time
     try:
-        gemini_client = genai.Client(api_key=gemini_api_key)
-        print("✅ Gemini API configured successfully.")
+        import google.genai as genai
+        client = genai.Client(
+            api_key=gemini_api_key,
+            # Don't let the SDK hold a worker thread much past the latency budget
+            http_options=genai.types.HttpOptions(timeout=int(timeout * 1000))
+        )
+        log.info("✅ Gemini API configured successfully.")
+        return client
     except Exception as e:
-        print(f"❌ Failed to create Gemini client: {e}")
-        gemini_client = None
-else:
-    print("⚠️ GEMINI_API_KEY not found in environment variables.")
+        log.error("❌ Failed to create Gemini client: %s", e)
+        return None
+
+
+def create_openrouter_client(timeout):
+    if not openrouter_api_key:
+        log.warning("⚠️ OPENROUTER_API_KEY not found")
+        return None
 
-if openrouter_api_key:
     try:
-        openrouter_client = OpenAI(
+        from openai import OpenAI
+        client = OpenAI(
             api_key=openrouter_api_key,
-            base_url="https://openrouter.ai/api/v1"
+            base_url="https://openrouter.ai/api/v1",
+            timeout=timeout,
+            max_retries=0
         )
-        print("✅ OpenRouter API client created")
+        log.info("✅ OpenRouter API client created")
+        return client
     except Exception as e:
-        print(f"❌ OpenRouter client failed: {e}")
-        openrouter_client = None
-else:
-    print("⚠️ OPENROUTER_API_KEY not found")
+        log.error("❌ OpenRouter client failed: %s", e)
+        return None
 
-def get_ai_response(user_message, campus_info):
-    """Try multiple AI providers in order"""
+
+FALLBACK_ANSWER = "I'm here to help with campus navigation! Try asking about specific locations like the library, labs, or cafeteria."
+
+# AI answers for repeated questions, keyed on (normalized question, prompt location hash).
+# The cache itself is per app: current_app.extensions["answer_cache"], made in create_app().
+answer_cache_lock = threading.Lock()
+answer_cache_stats = {"hits": 0, "misses": 0}
+
+registry.collected(
+    "cyberpath_chatbot_cache_requests_total", "Chatbot answer cache lookups by result", "counter",
+    lambda: [(("hit",), answer_cache_stats["hits"]), (("miss",), answer_cache_stats["misses"])],
+    ["result"])
+
+
+def normalize_question(user_message):
+    return " ".join(utils.default_process(user_message).split())
+
+
+def get_cached_answer(key):
+    with answer_cache_lock:
+        answer = current_app.extensions["answer_cache"].get(key)
+        answer_cache_stats["hits" if answer is not None else "misses"] += 1
+    return answer
+
+
+def store_answer(key, answer):
+    """Cache an AI answer; fallback answers are never cached"""
+    if answer and answer != FALLBACK_ANSWER:
+        with answer_cache_lock:
+            current_app.extensions["answer_cache"][key] = answer
+
+
+def cached_ai_response(user_message, campus_info, prompt_hash):
+    """get_ai_response() behind the answer cache"""
+    key = (normalize_question(user_message), prompt_hash)
+
+    answer = get_cached_answer(key)
+    if answer is not None:
+        return answer
+
+    answer = get_ai_response(user_message, campus_info)
+    store_answer(key, answer)
+    return answer
+
+
+def ask_gemini(gemini_client, user_message, campus_info):
     full_prompt = f"{campus_info}\n\nUser asks: {user_message}\n\nYour helpful answer:"
-    
+    response = gemini_client.models.generate_content(
+        model="gemini-3-flash-preview",
+        contents=full_prompt
+    )
+    return response.text
+
+
+def ask_openrouter(openrouter_client, user_message, campus_info):
+    response = openrouter_client.chat.completions.create(
+        model="arcee-ai/trinity-large-preview:free",  # Free model
+        messages=[
+            {"role": "system", "content": campus_info},
+            {"role": "user", "content": user_message}
+        ],
+    )
+    return response.choices[0].message.content
 
-    # 1. FIRST try Gemini (your current working model)
+
+def stream_gemini(gemini_client, user_message, campus_info):
+    full_prompt = f"{campus_info}\n\nUser asks: {user_message}\n\nYour helpful answer:"
+    for chunk in gemini_client.models.generate_content_stream(
+        model="gemini-3-flash-preview",
+        contents=full_prompt
+    ):
+        yield chunk.text
+
+
+def stream_openrouter(openrouter_client, user_message, campus_info):
+    response = openrouter_client.chat.completions.create(
+        model="arcee-ai/trinity-large-preview:free",  # Free model
+        messages=[
+            {"role": "system", "content": campus_info},
+            {"role": "user", "content": user_message}
+        ],
+        stream=True
+    )
+    for chunk in response:
+        if chunk.choices:
+            yield chunk.choices[0].delta.content
+
+
+def create_ai_pool(config):
+    """Gemini first, OpenRouter as the (free) hedge and fallback"""
+    budget = config["AI_LATENCY_BUDGET"]
+    providers = []
+
+    gemini_client = create_gemini_client(budget)
     if gemini_client:
-        try:
-            print("🔄 Trying Gemini...")
-            response = gemini_client.models.generate_content(
-                model="gemini-3-flash-preview",
-                contents=full_prompt
-            )
-            answer = response.text
-            print("✅ Gemini succeeded")
-            return answer
-        except Exception as e:
-            print(f"❌ Gemini failed: {e}")
-    
-    # 2. SECOND try OpenRouter (free fallback)
+        providers.append(Provider("Gemini", partial(ask_gemini, gemini_client),
+                                  stream=partial(stream_gemini, gemini_client)))
+
+    openrouter_client = create_openrouter_client(budget)
     if openrouter_client:
-        try:
-            print("🔄 Trying OpenRouter...")
-            response = openrouter_client.chat.completions.create(
-                model="arcee-ai/trinity-large-preview:free",  # Free model
-                messages=[
-                    {"role": "system", "content": campus_info},
-                    {"role": "user", "content": user_message}
-                ],
-                
-            )
-            answer = response.choices[0].message.content
-            print("✅ OpenRouter succeeded")
-            return answer
-        except Exception as e:
-            print(f"❌ OpenRouter failed: {e}")
-
-    print("❌ All AI providers failed")
-    return "I'm here to help with campus navigation! Try asking about specific locations like the library, labs, or cafeteria."
-    
+        providers.append(Provider("OpenRouter", partial(ask_openrouter, openrouter_client),
+                                  stream=partial(stream_openrouter, openrouter_client)))
 
-@app.route("/chatbot/ask", methods=["POST"])
-def chatbot_ask():
-    user_message = request.json.get("message", "").strip()
-    if not user_message:
-        return jsonify({"success": False, "message": "Please type a question"})
+    return ProviderPool(providers, budget=budget, hedge_delay=config["AI_HEDGE_DELAY"],
+                        max_workers=config["AI_MAX_WORKERS"], on_call=record_provider_call)
 
-    try:
-        print(f"\n=== CHATBOT REQUEST ===")
-        print(f"User message: '{user_message}'")
-        
-        # FIRST: Try to find location in database
-        location_data = check_for_location(user_message)
-        
-        # SECOND: Generate AI response - ALWAYS generate AI response!
-        markers = Marker.query.all()
-        indoor_markers = IndoorMarker.query.all()
-        
-        # Get all location names for the AI context
-        location_names = [m.name for m in markers if m.name] + [im.name for im in indoor_markers if im.name]
 
-        campus_info = f"""
+ai_pool_lock = threading.Lock()
+
+
+def get_ai_pool():
+    """The app's provider pool, built on the first chatbot request rather than at startup"""
+    extensions = current_app.extensions
+    if "ai_pool" not in extensions:
+        with ai_pool_lock:
+            if "ai_pool" not in extensions:
+                extensions["ai_pool"] = create_ai_pool(current_app.config)
+    return extensions["ai_pool"]
+
+
+registry.collected(
+    "cyberpath_ai_provider_circuit_open", "1 while a provider's circuit breaker is open or half-open", "gauge",
+    lambda: [((p.name,), int(p.breaker.state != "closed"))
+             for p in getattr(current_app.extensions.get("ai_pool"), "providers", [])],
+    ["provider"])
+
+
+def get_ai_response(user_message, campus_info):
+    """Ask the AI providers within the latency budget"""
+    answer = get_ai_pool().ask(user_message, campus_info)
+    if answer:
+        return answer
+
+    log.error("❌ All AI providers failed")
+    return FALLBACK_ANSWER
+    
+
+def build_campus_info(index):
+    """System prompt for the AI, listing the locations from the location index"""
+    return f"""
             You are CyberPath, a friendly, smart and slightly fun campus assistant for Multimedia University (MMU) Cyberjaya.
 
             You can chat naturally with users for greetings, thanks, or general conversation.
@@ -710,7 +1748,7 @@ def chatbot_ask():
             You are connected to a live campus location database.
 
             ALL AVAILABLE LOCATIONS:
-            {', '.join(location_names[:20]) if location_names else 'Various campus locations'}
+            {index.prompt_locations}
 
             VERY IMPORTANT RULES:
             • If a location is NOT in the list, say: "I don't have that location in my database."
@@ -736,8 +1774,46 @@ def chatbot_ask():
             Be warm, clear, and friendly — but accurate.
             """
 
-        answer = get_ai_response(user_message, campus_info)
-        print(f"✅ AI Response: {answer[:100]}...")  # Debug
+
+def location_fields(location_data):
+    """Chatbot response fields for a check_for_location() result, or {} if nothing usable was found"""
+    if location_data and location_data.get("coordinates") and location_data.get("location_name"):
+        log.debug("📍 Location data found: %s", location_data.get("location_name"))
+        return {
+            "coordinates": location_data.get("coordinates"),
+            "location_name": location_data.get("location_name"),
+            "location_description": location_data.get("location_description", ""),
+            "building": location_data.get("building"),
+            "is_indoor": location_data.get("is_indoor", False),
+            "floor": location_data.get("floor"),
+            "distance": location_data.get("distance")
+        }
+
+    log.debug("📍 No location data found (but still responding to user)")
+    return {}
+
+
+@bp.route("/chatbot/ask", methods=["POST"])
+def chatbot_ask():
+    user_message = request.json.get("message", "").strip()
+    if not user_message:
+        return jsonify({"success": False, "message": "Please type a question"})
+
+    try:
+        log.debug("=== CHATBOT REQUEST ===")
+        log.debug("User message: '%s'", user_message)
+        
+        # FIRST: Try to find location in database
+        location_data = check_for_location(user_message, parse_lat_lng(request.json.get("from")))
+        
+        # SECOND: Generate AI response - ALWAYS generate AI response!
+        # Get all location names for the AI context
+        index = get_location_index()
+
+        campus_info = build_campus_info(index)
+
+        answer = cached_ai_response(user_message, campus_info, index.prompt_hash)
+        log.debug("✅ AI Response: %s...", answer[:100])
 
         # Prepare response - ALWAYS include success: true
         response_data = {
@@ -746,27 +1822,14 @@ def chatbot_ask():
         }
         
         # Add location data if found (but we still respond even without location!)
-        if location_data and location_data.get("coordinates") and location_data.get("location_name"):
-            print(f"📍 Location data found: {location_data.get('location_name')}")
-            response_data.update({
-                "coordinates": location_data.get("coordinates"),
-                "location_name": location_data.get("location_name"),
-                "location_description": location_data.get("location_description", ""),
-                "building": location_data.get("building"),
-                "is_indoor": location_data.get("is_indoor", False),
-                "floor": location_data.get("floor")
-            })
-        else:
-            print("📍 No location data found (but still responding to user)")
+        response_data.update(location_fields(location_data))
         
-        print("=== END REQUEST ===\n")
+        log.debug("=== END REQUEST ===")
         
         return jsonify(response_data)
         
     except Exception as e:
-        print(f"Chatbot error: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Chatbot error: %s", e)
         
         # Always return a valid response even on error
         return jsonify({
@@ -774,150 +1837,299 @@ def chatbot_ask():
             "response": "I'm here to help with campus navigation! How can I assist you today?"
         })
 
-def check_for_location(user_message):
-    """Find location in database and return coordinates"""
-    userLower = str(user_message).lower()
-    
-    print(f"🔍 Checking location for: '{user_message}'")
-    
-    # Get ALL markers from database
-    markers = Marker.query.all()
-    indoor_markers = IndoorMarker.query.all()
-    
-    # Combine all location names for fuzzy matching
-    all_location_names = []
-    all_locations = []  # Store the actual objects
-    
-    # Add outdoor markers
-    for marker in markers:
-        if marker.name:
-            all_location_names.append(str(marker.name))
-            all_locations.append({
-                "type": "outdoor",
-                "object": marker,
-                "name": marker.name,
-                "lat": marker.latitude,
-                "lng": marker.longitude,
-                "description": marker.description,
-                "category": marker.category.name if marker.category else None
-            })
-    
-    # Add indoor markers
-    for marker in indoor_markers:
-        if marker.name:
-            all_location_names.append(str(marker.name))
-            all_locations.append({
-                "type": "indoor",
-                "object": marker,
-                "name": marker.name,
-                "lat": marker.latitude,
-                "lng": marker.longitude,
-                "description": marker.description,
-                "building": marker.building,
-                "floor": marker.floor
-            })
-    
-    # Add building names
-    building_names = [
-        "FCI Building", "FOM Building", "FAIE Building", "FCM Building",
-        "Dewan Tun Canselor", "DTC", "Library", "Cafeteria", 
-        "Haji Tapah", "Starbees"
-    ]
-    
-    for building in building_names:
-        all_location_names.append(building)
-        all_locations.append({
-            "type": "building",
-            "name": building,
-            "lat": None,  # Will get from get_building_coordinates
-            "lng": None
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@bp.route("/chatbot/ask/stream", methods=["POST"])
+def chatbot_ask_stream():
+    """Like /chatbot/ask, but as Server-Sent Events: the location first, then the answer as it is generated"""
+    user_message = request.json.get("message", "").strip()
+    if not user_message:
+        return jsonify({"success": False, "message": "Please type a question"})
+
+    location_data = check_for_location(user_message, parse_lat_lng(request.json.get("from")))
+    index = get_location_index()
+    campus_info = build_campus_info(index)
+    key = (normalize_question(user_message), index.prompt_hash)
+    ai_pool = get_ai_pool()
+
+    def events():
+        # Sent before the AI is asked, so the page can get directions ready straight away
+        yield sse_event("location", location_fields(location_data))
+
+        answer = get_cached_answer(key)
+        if answer is not None:
+            yield sse_event("token", {"text": answer})
+        else:
+            chunks = []
+            finished = False
+            try:
+                for chunk in ai_pool.stream(user_message, campus_info):
+                    chunks.append(chunk)
+                    yield sse_event("token", {"text": chunk})
+                finished = True
+            except Exception as e:
+                log.exception("Chatbot stream error: %s", e)
+
+            answer = "".join(chunks)
+            if answer:
+                # A stream that broke off is shown as far as it got, but never cached
+                if finished:
+                    store_answer(key, answer)
+            else:
+                log.error("❌ All AI providers failed")
+                answer = FALLBACK_ANSWER
+                yield sse_event("token", {"text": answer})
+
+        yield sse_event("done", {"success": True, "response": answer})
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@bp.route("/api/chatbot/cache-stats")
+def chatbot_cache_stats():
+    if not session.get("admin_logged_in"):
+        return jsonify({"success": False, "message": "Not authorized"}), 403
+
+    answer_cache = current_app.extensions["answer_cache"]
+    with answer_cache_lock:
+        return jsonify({
+            "success": True,
+            "hits": answer_cache_stats["hits"],
+            "misses": answer_cache_stats["misses"],
+            "size": len(answer_cache),
+            "maxsize": answer_cache.maxsize,
+            "ttl": answer_cache.ttl
         })
-    
-    print(f"   Searching through {len(all_location_names)} locations")
-    
-    # Check for short forms first
-    shortform = {
-        "dtc": "Dewan Tun Canselor",
-        "lib": "Library",
-        "caf": "Cafeteria",
-        "ht": "Haji Tapah",
-        "food": "Starbees",
-        "fci": "FCI Building",
-        "fom": "FOM Building",
-        "faie": "FAIE Building",
-        "fcm": "FCM Building",
+
+
+# Hardcoded places that are not (all) in the marker tables
+building_names = [
+    "FCI Building", "FOM Building", "FAIE Building", "FCM Building",
+    "Dewan Tun Canselor", "DTC", "Library", "Cafeteria", 
+    "Haji Tapah", "Starbees"
+]
+
+shortform = {
+    "dtc": "Dewan Tun Canselor",
+    "lib": "Library",
+    "caf": "Cafeteria",
+    "ht": "Haji Tapah",
+    "food": "Starbees",  # only when the user's location is unknown, see category_words
+    "fci": "FCI Building",
+    "fom": "FOM Building",
+    "faie": "FAIE Building",
+    "fcm": "FCM Building",
+}
+
+# Words asking for the nearest place of a kind rather than a named place, and the category meant.
+# Answered by walking distance from the user's location when the page sends it.
+category_words = {
+    "food": "Food & Drinks", "eat": "Food & Drinks", "hungry": "Food & Drinks", "drink": "Food & Drinks",
+    "drinks": "Food & Drinks", "coffee": "Food & Drinks",
+    "restroom": "Restroom", "restrooms": "Restroom", "toilet": "Restroom", "toilets": "Restroom",
+    "washroom": "Restroom", "bathroom": "Restroom",
+    "lift": "Lift", "lifts": "Lift", "elevator": "Lift",
+    "stairs": "Stairs", "staircase": "Stairs",
+}
+
+location_keywords = ["where", "location", "place", "find", "directions", "navigate", 
+                     "route", "path", "how to get", "way to", "show me", "take me", 
+                     "guide me", "locate"]
+
+
+def sort_tokens(text):
+    """Normalize text the way token_sort_ratio does before comparing"""
+    return " ".join(sorted(utils.default_process(text).split()))
+
+
+class LocationIndex:
+    """Every chatbot location name, preprocessed once for fuzzy matching.
+
+    Built from the marker tables and rebuilt only when marker_version changes.
+    """
+
+    def __init__(self, version, markers, indoor_markers):
+        self.version = version
+        self.marker_names = [m.name for m in markers if m.name] + [im.name for im in indoor_markers if im.name]
+        # The location list injected into the AI prompt, and a hash of it for the answer cache
+        self.prompt_locations = ', '.join(self.marker_names[:20]) if self.marker_names else 'Various campus locations'
+        self.prompt_hash = hashlib.sha1(self.prompt_locations.encode()).hexdigest()
+
+        records = []
+        for marker in markers:
+            if marker.name:
+                records.append({
+                    "type": "outdoor",
+                    "name": marker.name,
+                    "lat": marker.latitude,
+                    "lng": marker.longitude,
+                    "description": marker.description,
+                    "category": category_name(marker.category_id)
+                })
+        for marker in indoor_markers:
+            if marker.name:
+                records.append({
+                    "type": "indoor",
+                    "name": marker.name,
+                    "lat": marker.latitude,
+                    "lng": marker.longitude,
+                    "description": marker.description,
+                    "building": marker.building,
+                    "floor": marker.floor
+                })
+        for building in building_names:
+            records.append({"type": "building", "name": building, "lat": None, "lng": None})
+
+        # The first record with a given name wins, like the old linear search
+        self.by_name = {}
+        for record in records:
+            self.by_name.setdefault(record["name"].lower(), record)
+
+        self.names = list(self.by_name)
+        # token_sort_ratio is ratio() on sorted tokens, so sort the choices once here
+        self.choices = [sort_tokens(name) for name in self.names]
+
+        # Shortforms resolved to their record up front, in priority order
+        self.aliases = [(short, long, self.by_name.get(long.lower())) for short, long in shortform.items()]
+
+        # Names as word sequences, to spot a name written out in a message
+        self.by_words = {}
+        for name, record in self.by_name.items():
+            self.by_words.setdefault(utils.default_process(name), record)
+        self.longest_name = max((len(words.split()) for words in self.by_words), default=0)
+
+    def __len__(self):
+        return len(self.names)
+
+    def named(self, user_message):
+        """The record whose whole name appears in the message (the longest one), or None.
+
+        A bare category word ("restroom", "lift") does not count as a name, so "nearest restroom"
+        is still answered by category.
+        """
+        words = utils.default_process(user_message).split()
+        for length in range(min(len(words), self.longest_name), 0, -1):
+            for start in range(len(words) - length + 1):
+                phrase = words[start:start + length]
+                if all(word in category_words for word in phrase):
+                    continue
+                record = self.by_words.get(" ".join(phrase))
+                if record:
+                    return record
+        return None
+
+    def best_match(self, user_message, score_cutoff=0):
+        """Return (record, score) for the closest location name, or (None, 0) below score_cutoff"""
+        result = process.extractOne(sort_tokens(user_message), self.choices, scorer=fuzz.ratio,
+                                    processor=None, score_cutoff=score_cutoff)
+        if not result:
+            return None, 0
+        _, score, i = result
+        return self.by_name[self.names[i]], score
+
+
+location_index = None
+
+
+def get_location_index():
+    """Return the location index, rebuilding it if markers changed since it was built"""
+    global location_index
+    version = marker_version()
+    if location_index is None or location_index.version != version:
+        markers = Marker.query.all()
+        indoor_markers = IndoorMarker.query.all()
+        location_index = LocationIndex(version, markers, indoor_markers)
+    return location_index
+
+
+def location_payload(location):
+    """Build the chatbot location response for a marker or building record"""
+    if location["type"] == "building":
+        return get_building_coordinates(location["name"])
+
+    building_name = extract_building_from_name(location["name"])
+    is_indoor = location["type"] == "indoor" or (
+        location.get("category") in ["Classroom", "Office","Restroom","Lift","Stairs"]
+    )
+    return {
+        "coordinates": {"latitude": location["lat"], "longitude": location["lng"]},
+        "location_name": location["name"],
+        "location_description": location.get("description"),
+        "building": building_name,
+        "is_indoor": is_indoor,
+        "floor": location.get("floor")
     }
+
+
+def nearest_payload(user_message, origin):
+    """Chatbot location for "nearest food/restroom/lift" questions, or None if the message names no category"""
+    for word in re.findall(r"[a-z]+", user_message.lower()):
+        category = find_category(category_words.get(word, ""))
+        if category:
+            nearest = nearest_locations(*origin, category, 1)
+            if nearest:
+                log.debug("   Category matched: '%s' -> %s (%.0f m)", word, nearest[0]["name"], nearest[0]["distance"])
+                return {
+                    "coordinates": {"latitude": nearest[0]["latitude"], "longitude": nearest[0]["longitude"]},
+                    "location_name": nearest[0]["name"],
+                    "location_description": nearest[0]["description"],
+                    "building": nearest[0]["building"],
+                    "is_indoor": nearest[0]["is_indoor"],
+                    "floor": nearest[0]["floor"],
+                    "distance": nearest[0]["distance"]
+                }
+    return None
+
+
+def check_for_location(user_message, origin=None):
+    """Find location in database and return coordinates; origin (lat, lng) enables nearest-by-category answers"""
+    userLower = str(user_message).lower()
+    
+    log.debug("🔍 Checking location for: '%s'", user_message)
+
+    index = get_location_index()
+    log.debug("   Searching through %d locations", len(index))
     
-    for short, long in shortform.items():
+    # A place named outright beats a short form, and both beat the nearest place of a kind
+    location = index.named(user_message)
+    if location:
+        log.debug("   Name matched: '%s'", location["name"])
+        return location_payload(location)
+
+    for short, long, location in index.aliases:
+        if origin and short in category_words:
+            continue  # with a location, "food" means the nearest food, below
         if f" {short} " in f" {userLower} " or userLower == short:
-            print(f"   Shortform matched: '{short}' -> '{long}'")
-            # Check if it's a building
-            for location in all_locations:
-                if location["name"].lower() == long.lower():
-                    if location["type"] == "building":
-                        return get_building_coordinates(long)
-                    else:
-                        building_name = extract_building_from_name(location["name"])
-                        is_indoor = location["type"] == "indoor" or (
-                            location.get("category") in ["Classroom", "Office","Restroom","Lift","Stairs"]
-                        )
-                        return {
-                            "coordinates": {"latitude": location["lat"], "longitude": location["lng"]},
-                            "location_name": location["name"],
-                            "location_description": location.get("description", ""),
-                            "building": building_name,
-                            "is_indoor": is_indoor,
-                            "floor": location.get("floor")
-                        }
+            log.debug("   Shortform matched: '%s' -> '%s'", short, long)
+            if location:
+                return location_payload(location)
+
+    if origin:
+        nearest = nearest_payload(userLower, origin)
+        if nearest:
+            return nearest
     
     # Check if this is a location question
-    location_keywords = ["where", "location", "place", "find", "directions", "navigate", 
-                        "route", "path", "how to get", "way to", "show me", "take me", 
-                        "guide me", "locate"]
-    
     is_location_question = any(keyword in userLower for keyword in location_keywords)
     
+    # Lower threshold for location questions, higher for general chat
+    threshold = 40 if is_location_question else 60
+    
     # Always try to find a location match, but prioritize if it's a location question
-    if all_location_names:  # Always try to match if we have locations
-        result = process.extractOne(user_message, all_location_names, scorer=fuzz.token_sort_ratio)
+    started = time.perf_counter()
+    location, score = index.best_match(user_message, score_cutoff=threshold)
+    location_match_latency.observe(time.perf_counter() - started)
+    if location:
+        log.debug("   Fuzzy match: '%s' → '%s' (score: %.0f)", user_message, location["name"], score)
         
-        if result:
-            best_match, score = result
-            print(f"   Fuzzy match: '{user_message}' → '{best_match}' (score: {score})")
-            
-            # Lower threshold for location questions, higher for general chat
-            threshold = 40 if is_location_question else 60
-            
-            if score > threshold:
-                # Find the matching location object
-                for location in all_locations:
-                    if location["name"].lower() == best_match.lower():
-                        print(f"   Found matching location: {location['name']} (type: {location['type']})")
-                        
-                        # Handle buildings specially
-                        if location["type"] == "building":
-                            return get_building_coordinates(best_match)
-                        
-                        # Get coordinates
-                        if location["lat"] is None or location["lng"] is None:
-                            # This shouldn't happen for non-building locations
-                            continue
-                        
-                        building_name = extract_building_from_name(location["name"])
-                        is_indoor = location["type"] == "indoor" or (
-                            location.get("category") in ["Classroom", "Office","Restroom","Lift","Stairs"]
-                        )
-                        
-                        return {
-                            "coordinates": {"latitude": location["lat"], "longitude": location["lng"]},
-                            "location_name": location["name"],
-                            "location_description": location.get("description", f"{location['name']} at MMU"),
-                            "building": building_name,
-                            "is_indoor": is_indoor,
-                            "floor": location.get("floor")
-                        }
+        if score > threshold:
+            log.debug("   Found matching location: %s (type: %s)", location["name"], location["type"])
+            return location_payload(location)
     
-    print(f"   No location match found for: '{user_message}'")
+    log.debug("   No location match found for: '%s'", user_message)
     return {}
 
 def extract_building_from_name(location_name):
@@ -957,9 +2169,134 @@ def get_building_coordinates(building_name):
         }
     return {}
 
+#---------------------------------------------------------------------------------------------------------------------------------
+# Static Assets
+#---------------------------------------------------------------------------------------------------------------------------------
+
+# Bundle name -> built file name, from static/dist/manifest.json; empty if there is no up-to-date build
+asset_files = None
+
+
+def get_asset_files():
+    """Read the asset manifest once per process (on every request in debug mode, where sources change)"""
+    global asset_files
+    if asset_files is None or current_app.debug:
+        files = {}
+        try:
+            with open(os.path.join(current_app.static_folder, "dist", assets.MANIFEST), encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest["sources"] == assets.sources_digest(current_app.static_folder):
+                files = manifest["files"]
+            else:
+                log.warning("⚠️ Built assets are older than their sources; run flask --app app build-assets")
+        except FileNotFoundError:
+            pass
+        asset_files = files
+    return asset_files
+
+
+@bp.app_template_global()
+def static_url(name):
+    """URL of a bundle or static file: the fingerprinted build if there is one, the live sources otherwise"""
+    files = get_asset_files()
+    if name in files:
+        return url_for("main.asset", filename=files[name])
+    if name in assets.BUNDLES:
+        return url_for("main.bundle", name=name)
+    return url_for("static", filename=name)
+
+
+@click.command("build-assets")
+@with_appcontext
+def build_assets_command():
+    """Minify, fingerprint and precompress the JS/CSS bundles (needs rjsmin, rcssmin, brotli): flask --app app build-assets"""
+    global asset_files
+    sizes = assets.build_assets(current_app.static_folder, os.path.join(current_app.static_folder, "dist"))
+    asset_files = None
+    for name, (source, minified, gzipped, brotli) in sizes.items():
+        click.echo(f"✅ {name:<8} {source // 1024:>4} KB -> minified {minified // 1024} KB, gzip {gzipped // 1024} KB, brotli {brotli // 1024} KB")
+
+
+@bp.route("/assets/<filename>")
+def asset(filename):
+    """A built bundle, precompressed as brotli or gzip when the browser accepts it. The name changes with the content."""
+    if filename not in get_asset_files().values():
+        abort(404)
+
+    dist = os.path.join(current_app.static_folder, "dist")
+    mimetype = assets.MIMETYPES[os.path.splitext(filename)[1]]
+    for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+        if request.accept_encodings[encoding] and os.path.exists(os.path.join(dist, filename + suffix)):
+            response = send_from_directory(dist, filename + suffix, mimetype=mimetype)
+            response.headers["Content-Encoding"] = encoding
+            break
+    else:
+        response = send_from_directory(dist, filename, mimetype=mimetype)
+
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+@bp.route("/bundle/<name>")
+def bundle(name):
+    """A bundle joined from its sources on each request, for when nothing is built (development)"""
+    if name not in assets.BUNDLES:
+        abort(404)
+    body = assets.bundle_source(current_app.static_folder, name).encode()
+    response = Response(body, mimetype=assets.MIMETYPES[os.path.splitext(name)[1]])
+    response.set_etag(hashlib.sha1(body).hexdigest()[:16])
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+
+#---------------------------------------------------------------------------------------------------------------------------------
+# App Factory
+#---------------------------------------------------------------------------------------------------------------------------------
+
+def create_app(config=None):
+    """Build the app. Does no database or network work and starts no threads (the email outbox worker starts
+    with the first request); run `flask --app app init-db` once per database."""
+    app = Flask(__name__)
+    app.config["SECRET_KEY"] = "sixseven67"
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///cyberpath.db"
+    app.config["CHATBOT_CACHE_SIZE"] = 512
+    app.config["CHATBOT_CACHE_TTL"] = 600  # seconds
+    app.config["AI_LATENCY_BUDGET"] = 10.0  # seconds per chatbot answer, across all providers
+    app.config["AI_HEDGE_DELAY"] = 2.5  # seconds before also asking the next provider
+    app.config["AI_MAX_WORKERS"] = 16  # provider calls running at once, across all chatbot requests
+    app.config["EMAIL_OUTBOX_WORKER"] = True  # deliver queued emails from a background thread, started on first use
+    app.config["LOG_LEVEL"] = "INFO"  # DEBUG traces every chatbot request; WARNING for production
+    # /metrics only answers local scrapes unless this is set; then it needs "Authorization: Bearer <token>"
+    # from anywhere. Behind a reverse proxy set a token, or keep /metrics off the proxy.
+    app.config["METRICS_TOKEN"] = None
+    # Any of the above can be overridden with FLASK_<NAME> environment variables (values parsed as JSON)
+    app.config.from_prefixed_env()
+    if config:
+        app.config.update(config)
+    # Worked out from the final database URI, since pool sizing only applies to SQLite files
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", sqlite_profile.engine_options(app.config["SQLALCHEMY_DATABASE_URI"]))
+
+    logging.basicConfig(level=app.config["LOG_LEVEL"], format="%(message)s")
+
+    db.init_app(app)
+    app.register_blueprint(bp)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(build_floor_tiles_command)
+    app.cli.add_command(build_assets_command)
+
+    app.extensions["answer_cache"] = TTLCache(maxsize=app.config["CHATBOT_CACHE_SIZE"], ttl=app.config["CHATBOT_CACHE_TTL"])
+    app.extensions["outbox_worker"] = OutboxWorker(app, db, EmailOutbox, send_email_batch)
+
+    return app
+
+
 #---------------------------------------------------------------------------------------------------------------------------------
 # Run Program
 #---------------------------------------------------------------------------------------------------------------------------------
 
 if __name__ == "__main__":
+    app = create_app()
+    with app.app_context():
+        init_db()
     app.run(debug=True, port=5050)
@@ -0,0 +1,68 @@
+"""Bundling the page's JS and CSS into fingerprinted, minified and precompressed files (flask build-assets)."""
+import gzip, hashlib, json, os
+
+
+# Bundle name -> source files under static/, in the order index.html used to load them
+BUNDLES = {
+    "app.js": ["path.js", "routing.js", "gps.js", "script.js", "indoor.js", "chatbot.js"],
+    "app.css": ["style.css"],
+}
+MIMETYPES = {".js": "text/javascript", ".css": "text/css"}
+MANIFEST = "manifest.json"
+
+
+def bundle_source(static_dir, name):
+    """The bundle's source files joined in order, unminified"""
+    parts = []
+    for filename in BUNDLES[name]:
+        with open(os.path.join(static_dir, filename), encoding="utf-8") as f:
+            parts.append(f"/* {filename} */\n{f.read()}")
+    # The separator stops a script without a trailing semicolon from running into the next one
+    return ("\n;\n" if name.endswith(".js") else "\n").join(parts)
+
+
+def sources_digest(static_dir):
+    """Hash of every bundled source file, to tell whether a build is out of date"""
+    digest = hashlib.sha1()
+    for name in BUNDLES:
+        digest.update(bundle_source(static_dir, name).encode())
+    return digest.hexdigest()[:16]
+
+
+def minify(name, text):
+    import rcssmin, rjsmin
+    return rjsmin.jsmin(text) if name.endswith(".js") else rcssmin.cssmin(text)
+
+
+def build_assets(static_dir, dist_dir):
+    """Write each bundle as <stem>.<hash><ext> plus .gz and .br copies, and the manifest naming them.
+
+    Files from older builds are removed. Returns {bundle: (source, minified, gzip, brotli) sizes}.
+    """
+    import brotli
+
+    os.makedirs(dist_dir, exist_ok=True)
+    files, sizes = {}, {}
+    for name in BUNDLES:
+        source = bundle_source(static_dir, name)
+        body = minify(name, source).encode()
+        stem, ext = os.path.splitext(name)
+        filename = f"{stem}.{hashlib.sha1(body).hexdigest()[:12]}{ext}"
+
+        # mtime=0 so the same input always gives byte-identical output
+        variants = {filename: body, f"{filename}.gz": gzip.compress(body, 9, mtime=0),
+                    f"{filename}.br": brotli.compress(body, quality=11)}
+        for variant, data in variants.items():
+            with open(os.path.join(dist_dir, variant), "wb") as f:
+                f.write(data)
+
+        files[name] = filename
+        sizes[name] = (len(source.encode()),) + tuple(len(data) for data in variants.values())
+
+    keep = {MANIFEST} | {f"{filename}{suffix}" for filename in files.values() for suffix in ("", ".gz", ".br")}
+    for stale in set(os.listdir(dist_dir)) - keep:
+        os.remove(os.path.join(dist_dir, stale))
+
+    with open(os.path.join(dist_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump({"sources": sources_digest(static_dir), "files": files}, f, indent=2, sort_keys=True)
+    return sizes
@@ -0,0 +1 @@
+"""Performance benchmarks for CyberPath. Run each one with `python -m benchmarks.<name>`."""
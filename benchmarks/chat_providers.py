@@ -0,0 +1,80 @@
+"""Chatbot provider latency with stub providers: old sequential fallback vs ProviderPool.
+
+The primary stub is usually fast but has a slow tail and occasional errors, like a congested
+Gemini; the secondary is slower but steady. Latencies are scaled down so the run is short.
+
+    python -m benchmarks.chat_providers
+"""
+import random, statistics, time
+
+from providers import Provider, ProviderPool
+
+
+REQUESTS = 200
+BUDGET = 0.5
+HEDGE_DELAY = 0.12
+
+
+def stub_provider(name, fast, slow, slow_rate, error_rate, rng):
+    def call(user_message, campus_info):
+        if rng.random() < error_rate:
+            time.sleep(fast)
+            raise RuntimeError(f"{name} stub error")
+        time.sleep(slow if rng.random() < slow_rate else fast)
+        return f"{name} answer"
+    return call
+
+
+def sequential(providers, *args):
+    """The old get_ai_response(): try each provider in turn, waiting as long as it takes"""
+    for provider in providers:
+        try:
+            answer = provider.call(*args)
+            if answer:
+                return answer
+        except Exception:
+            pass
+    return None
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+
+def run(label, ask):
+    latencies, failures = [], 0
+    for _ in range(REQUESTS):
+        start = time.perf_counter()
+        if not ask("where is the library", "campus info"):
+            failures += 1
+        latencies.append(time.perf_counter() - start)
+
+    print(f"{label:>12}: p50 {statistics.median(latencies) * 1000:6.1f} ms  "
+          f"p95 {percentile(latencies, 0.95) * 1000:6.1f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1000:6.1f} ms  "
+          f"max {max(latencies) * 1000:6.1f} ms  no answer {failures}")
+
+
+def make_providers(seed):
+    rng = random.Random(seed)
+    return [
+        Provider("primary", stub_provider("primary", fast=0.02, slow=1.5, slow_rate=0.08, error_rate=0.03, rng=rng)),
+        Provider("secondary", stub_provider("secondary", fast=0.06, slow=0.2, slow_rate=0.02, error_rate=0.0, rng=rng)),
+    ]
+
+
+def main():
+    print(f"{REQUESTS} requests, budget {BUDGET * 1000:.0f} ms, hedge after {HEDGE_DELAY * 1000:.0f} ms")
+
+    providers = make_providers(seed=1)
+    run("sequential", lambda *args: sequential(providers, *args))
+
+    pool = ProviderPool(make_providers(seed=1), budget=BUDGET, hedge_delay=HEDGE_DELAY)
+    run("hedged pool", pool.ask)
+    for provider in pool.providers:
+        print(f"{provider.name:>12}: breaker {provider.breaker.state}, consecutive failures {provider.breaker.failures}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""Throughput, latency percentiles and SQL queries per request for the hot endpoints.
+
+Runs against a scratch database filled with synthetic markers (10^2, 10^4 and 10^5 outdoor
+and indoor markers by default), with Gemini/OpenRouter and Resend replaced by local stubs.
+Every endpoint is driven through the Flask test client and, with --server, through a real
+local WSGI server with concurrent clients.
+
+    python -m benchmarks.endpoints                      # print results
+    python -m benchmarks.endpoints --save               # also write benchmarks/baselines/endpoints.json
+    python -m benchmarks.endpoints --compare            # flag regressions against the saved baseline
+"""
+import argparse, http.client, itertools, json, logging, os, random, statistics, tempfile, threading, time
+
+import app as cyberpath
+from providers import Provider, ProviderPool
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "endpoints.json")
+REGRESSION_TOLERANCE = 0.20
+
+QUESTIONS = [
+    "where is the library", "where is fci", "where is dtc", "how do I get to haji tapah",
+    "hi", "thanks", "where is the bakery", "take me to fom", "where is CQAR2004", "find the lift",
+]
+
+ADMIN_EMAIL = "bench@cyberpath.app"
+ADMIN_PASSWORD = "Benchmark123"
+
+# Shared by every run so "unique" questions never hit answers cached by an earlier run
+unique = itertools.count()
+
+
+def percentile(samples, q):
+    return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+
+def summarize(latencies, seconds, queries):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / seconds, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "queries_per_request": round(queries / len(latencies), 2),
+    }
+
+
+def load_app(tmp, llm_latency):
+    """Build the app against a scratch database with every external service stubbed out"""
+    flask_app = cyberpath.create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+        "EMAIL_OUTBOX_WORKER": False,
+        "LOG_LEVEL": "WARNING",
+    })
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    with flask_app.app_context():
+        cyberpath.init_db()
+
+    def stub_llm(name):
+        def call(user_message, campus_info):
+            time.sleep(llm_latency)
+            return f"{name} stub answer for: {user_message}"
+        return call
+
+    flask_app.extensions["ai_pool"] = ProviderPool(
+        [Provider("gemini-stub", stub_llm("gemini")), Provider("openrouter-stub", stub_llm("openrouter"))],
+        budget=flask_app.config["AI_LATENCY_BUDGET"], hedge_delay=flask_app.config["AI_HEDGE_DELAY"])
+    flask_app.extensions["outbox_worker"].send_batch = lambda messages: None
+    return flask_app
+
+
+def populate(flask_app, count):
+    """Replace all markers with count outdoor and count indoor synthetic markers"""
+    from werkzeug.security import generate_password_hash
+
+    rng = random.Random(count)
+    db = cyberpath.db
+    with flask_app.app_context():
+        db.session.query(cyberpath.Marker).delete()
+        db.session.query(cyberpath.IndoorMarker).delete()
+        if not cyberpath.User.query.filter_by(email=ADMIN_EMAIL).first():
+            db.session.add(cyberpath.User(email=ADMIN_EMAIL, password=generate_password_hash(ADMIN_PASSWORD), verified=True))
+
+        outdoor = [c.id for c in cyberpath.Category.query.filter_by(indoor_only=False)]
+        indoor = [c.id for c in cyberpath.Category.query.filter_by(indoor_only=True)]
+        db.session.execute(db.insert(cyberpath.Marker), [
+            {"name": f"Place {i}", "latitude": 2.921 + rng.random() * 0.01, "longitude": 101.637 + rng.random() * 0.008,
+             "description": "Synthetic outdoor marker", "category_id": rng.choice(outdoor)}
+            for i in range(count)
+        ])
+        db.session.execute(db.insert(cyberpath.IndoorMarker), [
+            {"building": rng.choice(["fci", "faie", "fom", "fcm"]), "floor": str(rng.randrange(5)),
+             "name": f"CQAR{i:05d}", "latitude": 2.928 + rng.random() * 0.001, "longitude": 101.640 + rng.random() * 0.001,
+             "description": "Synthetic room", "category_id": rng.choice(indoor)}
+            for i in range(count)
+        ])
+        db.session.commit()
+        cyberpath.bump_marker_version(*cyberpath.BUILDING_NAMES)
+
+
+def scenarios():
+    """(name, method, path-or-factory, body kind, body) for every hot code path"""
+    rng = random.Random(0)
+
+    def route_path():
+        return (f"/api/route?from={2.921 + rng.random() * 0.01},{101.637 + rng.random() * 0.008}"
+                f"&to={2.921 + rng.random() * 0.01},{101.637 + rng.random() * 0.008}")
+
+    questions = itertools.cycle(QUESTIONS)
+
+    return [
+        ("index", "GET", lambda: "/", None, None),
+        ("markers", "GET", lambda: "/api/markers", None, None),
+        ("markers bbox z16", "GET", lambda: "/api/markers?bbox=101.636,2.92,101.646,2.932&zoom=16", None, None),
+        ("markers bbox z19", "GET", lambda: "/api/markers?bbox=101.640,2.925,101.6415,2.926&zoom=19", None, None),
+        ("indoor-markers", "GET", lambda: "/api/indoor-markers", None, None),
+        ("indoor-markers floor", "GET", lambda: "/api/indoor-markers?building=fci&floor=1", None, None),
+        ("route", "GET", route_path, None, None),
+        ("chatbot (repeat)", "POST", lambda: "/chatbot/ask", "json", lambda: {"message": next(questions)}),
+        ("chatbot (unique)", "POST", lambda: "/chatbot/ask", "json",
+         lambda: {"message": f"{next(questions)} {next(unique)}"}),
+        ("signin", "POST", lambda: "/signin", "form", lambda: {"email": ADMIN_EMAIL, "password": ADMIN_PASSWORD}),
+    ]
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self.increment)
+
+    def increment(self, *args):
+        self.count += 1
+
+
+def run_test_client(flask_app, counter, scenario, requests):
+    name, method, path, kind, body = scenario
+    client = flask_app.test_client()
+    latencies = []
+    counter.count = 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        kwargs = {kind: body()} if kind == "json" else {"data": body()} if kind == "form" else {}
+        start = time.perf_counter()
+        response = client.open(path(), method=method, **kwargs)
+        response.close()
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies, time.perf_counter() - started, counter.count)
+
+
+def run_server(port, counter, scenario, requests, concurrency):
+    name, method, path, kind, body = scenario
+    latencies, lock = [], threading.Lock()
+    remaining = iter(range(requests))
+
+    def client():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    break
+                request_path = path()
+                payload = body() if body else None
+            headers, data = {}, None
+            if kind == "json":
+                headers["Content-Type"], data = "application/json", json.dumps(payload)
+            elif kind == "form":
+                from urllib.parse import urlencode
+                headers["Content-Type"], data = "application/x-www-form-urlencoded", urlencode(payload)
+
+            start = time.perf_counter()
+            try:
+                conn.request(method, request_path, body=data, headers=headers)
+                conn.getresponse().read()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+        conn.close()
+
+    counter.count = 0
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(latencies, time.perf_counter() - started, counter.count)
+
+
+def compare(results, baseline):
+    """Print every metric that got worse than the baseline by more than REGRESSION_TOLERANCE"""
+    regressions = 0
+    for mode, sizes in results.items():
+        for size, endpoints in sizes.items():
+            for endpoint, now in endpoints.items():
+                before = baseline.get(mode, {}).get(size, {}).get(endpoint)
+                if not before:
+                    continue
+                checks = [("p95_ms", now["p95_ms"] > before["p95_ms"] * (1 + REGRESSION_TOLERANCE)),
+                          ("rps", now["rps"] < before["rps"] * (1 - REGRESSION_TOLERANCE)),
+                          ("queries_per_request", now["queries_per_request"] > before["queries_per_request"])]
+                for metric, worse in checks:
+                    if worse:
+                        regressions += 1
+                        print(f"REGRESSION {mode} {size} {endpoint}: {metric} {before[metric]} -> {now[metric]}")
+    print(f"{regressions} regression(s) against {BASELINE_PATH}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100,10000,100000", help="comma-separated marker counts")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="stub AI provider latency in seconds")
+    parser.add_argument("--server", action="store_true", help="also run through a local WSGI server")
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads for --server")
+    parser.add_argument("--save", action="store_true", help="write results as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="compare results with the saved baseline")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        flask_app = load_app(tmp, args.llm_latency)
+        with flask_app.app_context():
+            counter = QueryCounter(cyberpath.db.engine)
+
+        server = None
+        if args.server:
+            from werkzeug.serving import make_server
+            server = make_server("127.0.0.1", 0, flask_app, threaded=True)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        results = {"test_client": {}, "wsgi_server": {}} if server else {"test_client": {}}
+        for size in [int(s) for s in args.sizes.split(",")]:
+            populate(flask_app, size)
+            print(f"\n{size} outdoor + {size} indoor markers")
+            print(f"{'':>8} {'endpoint':<22} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'SQL/req':>8}")
+
+            for mode in results:
+                results[mode][str(size)] = {}
+                for scenario in scenarios():
+                    if mode == "test_client":
+                        stats = run_test_client(flask_app, counter, scenario, args.requests)
+                    else:
+                        stats = run_server(server.server_port, counter, scenario, args.requests, args.concurrency)
+                    results[mode][str(size)][scenario[0]] = stats
+                    print(f"{mode[:8]:>8} {scenario[0]:<22} {stats['rps']:>9} {stats['p50_ms']:>9} "
+                          f"{stats['p95_ms']:>9} {stats['p99_ms']:>9} {stats['queries_per_request']:>8}")
+
+        if server:
+            server.shutdown()
+        with flask_app.app_context():
+            cyberpath.db.engine.dispose()
+
+    if args.compare and os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+    if args.save:
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {BASELINE_PATH}")
+
+
+if __name__ == "__main__":
+    main()
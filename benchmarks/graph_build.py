@@ -0,0 +1,86 @@
+"""Walkway graph build time at 1x, 10x, 100x and 1000x the current feature count.
+
+Larger networks are made by tiling copies of static/newcampus.geojson side by side, so every
+copy keeps the real vertex density. The old all-pairs merge is only timed up to 10x.
+
+    python -m benchmarks.graph_build
+"""
+import copy, json, os, time
+
+from routing import WalkwayGraph, distance_meters, weld_vertices, MERGE_THRESHOLD_M
+
+
+GEOJSON_PATH = os.path.join(os.path.dirname(__file__), "..", "static", "newcampus.geojson")
+SCALES = [1, 10, 100, 1000]
+QUADRATIC_MAX_SCALE = 10
+
+
+def tiled_geojson(base, scale):
+    """Repeat the campus features on a grid of scale tiles, each shifted past the campus bounds"""
+    coords = [c for f in base["features"] for c in f["geometry"]["coordinates"]]
+    width = max(c[0] for c in coords) - min(c[0] for c in coords) + 0.001
+    height = max(c[1] for c in coords) - min(c[1] for c in coords) + 0.001
+    columns = max(int(scale ** 0.5), 1)
+
+    features = []
+    for tile in range(scale):
+        dx, dy = (tile % columns) * width, (tile // columns) * height
+        for feature in base["features"]:
+            feature = copy.deepcopy(feature)
+            feature["geometry"]["coordinates"] = [[lng + dx, lat + dy] for lng, lat in feature["geometry"]["coordinates"]]
+            features.append(feature)
+
+    return {"type": "FeatureCollection", "features": features}
+
+
+def all_pairs_merge(lats, lngs, threshold):
+    """The original O(n^2) mergeCloseNodes(), kept here only for comparison"""
+    mapping = list(range(len(lats)))
+    for i in range(len(lats)):
+        if mapping[i] != i:
+            continue
+        for j in range(i + 1, len(lats)):
+            if mapping[j] == j and distance_meters(lats[i], lngs[i], lats[j], lngs[j]) < threshold:
+                mapping[j] = i
+    return mapping
+
+
+def vertices(geojson):
+    lats, lngs = [], []
+    for feature in geojson["features"]:
+        for lng, lat in feature["geometry"]["coordinates"]:
+            lats.append(lat)
+            lngs.append(lng)
+    return lats, lngs
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    with open(GEOJSON_PATH, encoding="utf-8") as f:
+        base = json.load(f)
+
+    print(f"{'scale':>6} {'features':>9} {'vertices':>9} {'nodes':>9} {'weld':>10} {'full build':>11} {'all-pairs':>10}")
+    for scale in SCALES:
+        geojson = tiled_geojson(base, scale)
+        lats, lngs = vertices(geojson)
+
+        mapping, weld_time = timed(weld_vertices, lats, lngs, MERGE_THRESHOLD_M)
+        graph, build_time = timed(WalkwayGraph.from_geojson, geojson)
+
+        quadratic = "skipped"
+        if scale <= QUADRATIC_MAX_SCALE:
+            old_mapping, quadratic_time = timed(all_pairs_merge, lats, lngs, MERGE_THRESHOLD_M)
+            assert old_mapping == mapping, "grid weld disagrees with the all-pairs merge"
+            quadratic = f"{quadratic_time * 1000:.1f} ms"
+
+        print(f"{scale:>5}x {len(geojson['features']):>9} {len(lats):>9} {graph.node_count:>9} "
+              f"{weld_time * 1000:>7.1f} ms {build_time * 1000:>8.1f} ms {quadratic:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Cold start of a worker: time to import app.py and to run create_app(), in fresh interpreters.
+
+Also lists the slowest modules app.py pulls in (from python -X importtime), so a new heavy
+dependency shows up by name.
+
+    python -m benchmarks.import_time                    # print results
+    python -m benchmarks.import_time --save             # also write benchmarks/baselines/import_time.json
+    python -m benchmarks.import_time --compare          # exit 1 if import time regressed
+"""
+import argparse, json, os, statistics, subprocess, sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "import_time.json")
+REGRESSION_TOLERANCE = 0.25
+
+# Times both steps in a fresh interpreter; the outbox thread is off so nothing touches the database
+STARTUP_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+print(json.dumps({"import_ms": (imported - start) * 1000, "create_app_ms": (created - imported) * 1000}))
+"""
+
+
+def run_python(*args):
+    env = dict(os.environ, FLASK_EMAIL_OUTBOX_WORKER="false", FLASK_LOG_LEVEL="WARNING")
+    return subprocess.run([sys.executable, *args], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+
+
+def measure_startup(runs):
+    samples = [json.loads(run_python("-c", STARTUP_SCRIPT).stdout.strip().splitlines()[-1]) for _ in range(runs)]
+    return {key: round(statistics.median(s[key] for s in samples), 1) for key in samples[0]}
+
+
+def slowest_imports(count):
+    """(module, cumulative ms) for the modules imported directly by app.py, slowest first"""
+    modules = []
+    for line in run_python("-X", "importtime", "-c", "import app").stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Direct imports of app.py are indented one level below it
+        if cumulative.strip().isdigit() and name.startswith("   ") and not name.startswith("    "):
+            modules.append((name.strip(), int(cumulative) / 1000))
+    return sorted(modules, key=lambda m: m[1], reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to time (median is reported)")
+    parser.add_argument("--save", action="store_true", help="write results as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="compare results with the saved baseline")
+    args = parser.parse_args()
+
+    results = measure_startup(args.runs)
+    print(f"import app      {results['import_ms']:>8.1f} ms")
+    print(f"create_app()    {results['create_app_ms']:>8.1f} ms")
+    print("\nSlowest direct imports (cumulative):")
+    for name, ms in slowest_imports(10):
+        print(f"  {name:<28} {ms:>8.1f} ms")
+
+    regressed = False
+    if args.compare and os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, encoding="utf-8") as f:
+            baseline = json.load(f)
+        for key, now in results.items():
+            before = baseline.get(key)
+            if before and now > before * (1 + REGRESSION_TOLERANCE):
+                regressed = True
+                print(f"REGRESSION {key}: {before} -> {now} ms")
+        if not regressed:
+            print(f"\nNo regressions against {BASELINE_PATH}")
+
+    if args.save:
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {BASELINE_PATH}")
+
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Bulk marker import/export vs adding markers one form POST at a time.
+
+Imports ROWS synthetic markers (half outdoor, half indoor) as CSV and as GeoJSON into a scratch
+database, re-imports them (every row becomes an update), exports them again, and times
+/add-marker for FORM_ROWS rows to extrapolate what the same load costs through the admin form.
+
+    python -m benchmarks.marker_import
+"""
+import io, logging, os, random, tempfile, time
+
+import app as cyberpath
+import marker_io
+
+
+ROWS = 10000
+FORM_ROWS = 300
+
+
+def make_rows(count):
+    rng = random.Random(count)
+    rows = []
+    for i in range(count):
+        row = {"name": f"Place {i}", "latitude": 2.921 + rng.random() * 0.01, "longitude": 101.637 + rng.random() * 0.008,
+               "description": "Synthetic marker", "category": "Facilities", "building": "", "floor": ""}
+        if i % 2:
+            row.update(name=f"CQAR{i:05d}", category="Classroom", building=rng.choice(["fci", "fom", "faie", "fcm"]),
+                       floor=str(rng.randrange(5)))
+        rows.append(row)
+    return rows
+
+
+def admin_client(flask_app):
+    client = flask_app.test_client()
+    with client.session_transaction() as s:
+        s["admin_logged_in"] = True
+    return client
+
+
+def timed(label, count, call):
+    start = time.perf_counter()
+    response = call()
+    response.get_data()  # exports are streamed, so read them to the end
+    seconds = time.perf_counter() - start
+    assert response.status_code == 200, response.get_data(as_text=True)[:300]
+    print(f"{label:<34} {seconds:>8.2f} s   {count / seconds:>9.0f} rows/s")
+    return seconds
+
+
+def main():
+    rows = make_rows(ROWS)
+    csv_body = "".join(marker_io.export_csv(rows)).encode()
+    geojson_body = "".join(marker_io.export_geojson(rows)).encode()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        flask_app = cyberpath.create_app({
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            "EMAIL_OUTBOX_WORKER": False,
+            "LOG_LEVEL": "WARNING",
+        })
+        with flask_app.app_context():
+            cyberpath.init_db()
+        client = admin_client(flask_app)
+
+        def clear():
+            with flask_app.app_context():
+                cyberpath.Marker.query.delete()
+                cyberpath.IndoorMarker.query.delete()
+                cyberpath.db.session.commit()
+
+        print(f"{ROWS} markers ({len(csv_body) // 1024} KB CSV, {len(geojson_body) // 1024} KB GeoJSON)\n")
+        timed("import CSV (all inserts)", ROWS, lambda: client.post(
+            "/api/admin/markers/import?format=csv", data=csv_body, content_type="text/csv"))
+        timed("import CSV again (all updates)", ROWS, lambda: client.post(
+            "/api/admin/markers/import?format=csv", data=csv_body, content_type="text/csv"))
+        clear()
+        timed("import GeoJSON upload (all inserts)", ROWS, lambda: client.post(
+            "/api/admin/markers/import",
+            data={"file": (io.BytesIO(geojson_body), "markers.geojson")}, content_type="multipart/form-data"))
+        timed("export CSV", ROWS, lambda: client.get("/api/admin/markers/export?format=csv"))
+        timed("export GeoJSON", ROWS, lambda: client.get("/api/admin/markers/export"))
+
+        clear()
+        with flask_app.app_context():
+            category_id = cyberpath.Category.query.filter_by(name="Classroom").first().id
+        start = time.perf_counter()
+        for row in rows[:FORM_ROWS]:
+            client.post("/add-marker", data={
+                "name": row["name"], "coords": f"{row['latitude']},{row['longitude']}",
+                "description": row["description"], "category_id": category_id,
+                "building_id": row["building"], "floor": row["floor"], "is_indoor": "1" if row["building"] else "0"})
+        seconds = time.perf_counter() - start
+        print(f"{'/add-marker one by one':<34} {seconds:>8.2f} s   {FORM_ROWS / seconds:>9.0f} rows/s"
+              f"   (~{seconds / FORM_ROWS * ROWS:.0f} s for {ROWS})")
+
+        with flask_app.app_context():
+            cyberpath.db.engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    main()
@@ -0,0 +1,98 @@
+"""Marker read throughput while an admin keeps writing, default SQLite settings vs sqlite_profile.
+
+Each run gets a fresh database with MARKERS rows. READERS threads read the whole marker table
+in a loop (like /api/markers without its snapshot cache) while one thread inserts and commits
+markers (like /add-marker).
+
+    python -m benchmarks.sqlite_concurrency
+"""
+import os, random, statistics, tempfile, threading, time
+
+from sqlalchemy import create_engine, event, text
+
+import sqlite_profile
+
+
+MARKERS = 2000
+READERS = 4
+SECONDS = 3.0
+
+
+def make_database(path):
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE marker (id INTEGER PRIMARY KEY, name VARCHAR(150), latitude FLOAT NOT NULL, "
+                          "longitude FLOAT NOT NULL, description TEXT, category_id INTEGER)"))
+        conn.execute(text("INSERT INTO marker (name, latitude, longitude, description, category_id) "
+                          "VALUES (:name, :lat, :lng, :desc, :cat)"),
+                     [{"name": f"Marker {i}", "lat": 2.92 + random.random() / 100, "lng": 101.64 + random.random() / 100,
+                       "desc": "Synthetic marker", "cat": i % 11 + 1} for i in range(MARKERS)])
+    engine.dispose()
+
+
+def make_engine(path, production):
+    if not production:
+        return create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+
+    engine = create_engine(f"sqlite:///{path}", **sqlite_profile.engine_options(f"sqlite:///{path}"))
+    event.listen(engine, "connect", lambda dbapi_connection, record: sqlite_profile.apply_pragmas(dbapi_connection))
+    return engine
+
+
+def run(label, production):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        make_database(path)
+        engine = make_engine(path, production)
+
+        stop = threading.Event()
+        read_latencies, errors, writes = [], [], [0]
+        lock = threading.Lock()
+
+        def reader():
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    with engine.connect() as conn:
+                        conn.execute(text("SELECT * FROM marker ORDER BY id")).fetchall()
+                except Exception as e:
+                    with lock:
+                        errors.append(str(e).splitlines()[0])
+                    continue
+                with lock:
+                    read_latencies.append(time.perf_counter() - start)
+
+        def writer():
+            while not stop.is_set():
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(text("INSERT INTO marker (name, latitude, longitude, description, category_id) "
+                                          "VALUES ('New marker', 2.93, 101.64, 'Added by admin', 1)"))
+                    writes[0] += 1
+                except Exception as e:
+                    with lock:
+                        errors.append(str(e).splitlines()[0])
+
+        threads = [threading.Thread(target=reader) for _ in range(READERS)] + [threading.Thread(target=writer)]
+        for t in threads:
+            t.start()
+        time.sleep(SECONDS)
+        stop.set()
+        for t in threads:
+            t.join()
+        engine.dispose()
+
+    read_latencies.sort()
+    p99 = read_latencies[int(len(read_latencies) * 0.99)] if read_latencies else 0
+    print(f"{label:>10}: {len(read_latencies) / SECONDS:8.0f} reads/s  {writes[0] / SECONDS:7.0f} writes/s  "
+          f"read p50 {statistics.median(read_latencies) * 1000:6.2f} ms  p99 {p99 * 1000:6.2f} ms  errors {len(errors)}")
+
+
+def main():
+    print(f"{MARKERS} markers, {READERS} readers + 1 writer, {SECONDS:.0f} s per run")
+    run("default", production=False)
+    run("production", production=True)
+
+
+if __name__ == "__main__":
+    main()
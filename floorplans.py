@@ -0,0 +1,132 @@
+"""Cutting the indoor floor-plan images into content-hashed XYZ tiles (Web Mercator, 256 px).
+
+Each tile is written as <hash>.avif and <hash>.webp, hashed from its pixels, so identical tiles (empty
+corners, floors that share an image) are stored and downloaded once. manifest.json maps building/floor
+to a plan and a plan to its bounds, zoom range and tiles. Pillow is only needed to build the tiles.
+"""
+import hashlib, io, json, math, os
+
+
+TILE_SIZE = 256
+MIN_ZOOM = 17
+PLAN_SIZE_M = 123  # side of the square each plan is stretched over, as in indoor.js boundsFromCenter()
+FORMATS = {"avif": {"quality": 60}, "webp": {"quality": 85}}
+
+# Same buildings, centers and images as indoor.js
+FLOOR_PLANS = {
+    "fci": {"center": (2.928656, 101.64111), "floors": {
+        0: "fci_ground.png", 1: "fci_floor1.png", 2: "fci_floor23.png", 3: "fci_floor23.png", 4: "fci_floor4.png"}},
+    "faie": {"center": (2.926317, 101.641355), "floors": {
+        0: "faie_lowerGround.png", 1: "faie_ground.png", 2: "faie_floor1.png", 3: "faie_floor2.png", 4: "faie_floor3.png"}},
+    "fom": {"center": (2.929348, 101.641260), "floors": {floor: "wip.png" for floor in range(5)}},
+    "fcm": {"center": (2.926155, 101.642649), "floors": {floor: "wip.png" for floor in range(5)}},
+}
+
+
+def plan_bounds(center, size_m=PLAN_SIZE_M):
+    """[[south, west], [north, east]] of a size_m square around center, matching indoor.js"""
+    lat, lng = center
+    d_lat = size_m / 2 / 111320
+    d_lng = size_m / 2 / (111320 * math.cos(math.radians(lat)))
+    return [[lat - d_lat, lng - d_lng], [lat + d_lat, lng + d_lng]]
+
+
+def project(lat, lng, zoom):
+    """Web Mercator pixel coordinates of a point at zoom"""
+    scale = TILE_SIZE * 2 ** zoom
+    x = (lng + 180) / 360 * scale
+    y = (1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * scale
+    return x, y
+
+
+def native_zoom(image, bounds):
+    """Zoom at which the plan is drawn closest to the image's own resolution"""
+    (south, west), (north, east) = bounds
+    left, _ = project(north, west, 0)
+    right, _ = project(north, east, 0)
+    return max(MIN_ZOOM, round(math.log2(image.width / (right - left))))
+
+
+def cut_tiles(image, bounds, zoom):
+    """Yield ("z/x/y", RGBA tile image) for every tile the plan touches at zoom"""
+    from PIL import Image
+
+    (south, west), (north, east) = bounds
+    left, top = project(north, west, zoom)
+    right, bottom = project(south, east, zoom)
+    scaled = image.resize((round(right - left), round(bottom - top)), Image.Resampling.LANCZOS)
+
+    for ty in range(int(top // TILE_SIZE), int(math.ceil(bottom / TILE_SIZE))):
+        for tx in range(int(left // TILE_SIZE), int(math.ceil(right / TILE_SIZE))):
+            tile = Image.new("RGBA", (TILE_SIZE, TILE_SIZE))
+            tile.paste(scaled, (round(left - tx * TILE_SIZE), round(top - ty * TILE_SIZE)))
+            yield f"{zoom}/{tx}/{ty}", tile
+
+
+def encode(tile, fmt):
+    buffer = io.BytesIO()
+    tile.save(buffer, fmt.upper(), **FORMATS[fmt])
+    return buffer.getvalue()
+
+
+def write_tile(tiles_dir, tile_hash, tile):
+    """Write any missing format of one tile; returns {format: bytes on disk}"""
+    sizes = {}
+    for fmt in FORMATS:
+        path = os.path.join(tiles_dir, f"{tile_hash}.{fmt}")
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(encode(tile, fmt))
+        sizes[fmt] = os.path.getsize(path)
+    return sizes
+
+
+def build_tiles(images_dir, tiles_dir):
+    """Write every plan's tiles and manifest.json into tiles_dir; returns {format: total bytes}.
+
+    Tiles that are already on disk are not encoded again, and tiles no plan uses any more are removed.
+    """
+    from PIL import Image
+
+    os.makedirs(tiles_dir, exist_ok=True)
+    manifest = {"plans": {}, "floors": {}}
+    known, sizes = set(), dict.fromkeys(FORMATS, 0)
+
+    for building_id, building in FLOOR_PLANS.items():
+        bounds = plan_bounds(building["center"])
+        for floor, filename in building["floors"].items():
+            path = os.path.join(images_dir, filename)
+            with open(path, "rb") as f:
+                plan_id = hashlib.sha1(f.read() + json.dumps(bounds).encode()).hexdigest()[:16]
+            manifest["floors"].setdefault(building_id, {})[str(floor)] = plan_id
+            if plan_id in manifest["plans"]:
+                continue
+
+            image = Image.open(path).convert("RGBA")
+            max_zoom = native_zoom(image, bounds)
+            tiles = {}
+            for zoom in range(MIN_ZOOM, max_zoom + 1):
+                for key, tile in cut_tiles(image, bounds, zoom):
+                    tile_hash = hashlib.sha1(tile.tobytes()).hexdigest()[:16]
+                    tiles[key] = tile_hash
+                    if tile_hash not in known:
+                        known.add(tile_hash)
+                        for fmt, size in write_tile(tiles_dir, tile_hash, tile).items():
+                            sizes[fmt] += size
+
+            manifest["plans"][plan_id] = {
+                "image": filename,
+                "bounds": bounds,
+                "minZoom": MIN_ZOOM,
+                "maxNativeZoom": max_zoom,
+                "tiles": tiles
+            }
+
+    for name in os.listdir(tiles_dir):
+        stem, ext = os.path.splitext(name)
+        if name != "manifest.json" and (stem not in known or ext[1:] not in FORMATS):
+            os.remove(os.path.join(tiles_dir, name))
+
+    with open(os.path.join(tiles_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, separators=(",", ":"), sort_keys=True)
+    return sizes
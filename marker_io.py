@@ -0,0 +1,162 @@
+"""Reading, validating and writing marker files (GeoJSON and CSV) for bulk import and export."""
+import csv, io, json
+from sqlalchemy import insert, update
+
+
+CSV_FIELDS = ["id", "name", "latitude", "longitude", "description", "category", "building", "floor"]
+BATCH_SIZE = 1000
+
+
+class MarkerFileError(ValueError):
+    """The uploaded file could not be read at all (as opposed to a bad row)"""
+
+
+def read_rows(stream, fmt):
+    """Yield (row number, raw fields) from a GeoJSON FeatureCollection or CSV byte stream"""
+    if fmt == "csv":
+        reader = csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+        missing = {"name", "latitude", "longitude"} - set(reader.fieldnames or [])
+        if missing:
+            raise MarkerFileError(f"CSV is missing columns: {', '.join(sorted(missing))}")
+        # Header is line 1, so data rows are numbered from 2 like in a spreadsheet
+        yield from enumerate(reader, start=2)
+        return
+
+    try:
+        collection = json.load(stream)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise MarkerFileError(f"Invalid GeoJSON: {e}")
+    if not isinstance(collection, dict) or collection.get("type") != "FeatureCollection":
+        raise MarkerFileError("GeoJSON must be a FeatureCollection")
+
+    for number, feature in enumerate(collection.get("features") or [], start=1):
+        fields = dict((feature or {}).get("properties") or {})
+        geometry = (feature or {}).get("geometry") or {}
+        if geometry.get("type") == "Point" and len(geometry.get("coordinates") or []) >= 2:
+            fields["longitude"], fields["latitude"] = geometry["coordinates"][:2]
+        yield number, fields
+
+
+def clean_row(fields, categories):
+    """Validate raw fields into a marker row; categories maps lower-case category name -> id.
+
+    Rows with a building (and floor) are indoor markers. An id (as exported) names the marker to
+    update. Name and description are kept exactly as given, so an export imports back unchanged.
+    Raises ValueError with a readable message.
+    """
+    def text(key, strip=True):
+        value = fields.get(key)
+        if value is None:
+            return ""
+        return str(value).strip() if strip else str(value)
+
+    name = text("name", strip=False)
+    if not name.strip():
+        raise ValueError("name is required")
+
+    marker_id = None
+    if text("id"):
+        try:
+            marker_id = int(text("id"))
+        except ValueError:
+            raise ValueError("id must be a whole number")
+
+    try:
+        latitude, longitude = float(fields.get("latitude")), float(fields.get("longitude"))
+    except (TypeError, ValueError):
+        raise ValueError("latitude and longitude must be numbers")
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError("latitude/longitude out of range")
+
+    category_id = None
+    category = text("category")
+    if category:
+        if category.lower() not in categories:
+            raise ValueError(f"unknown category '{category}'")
+        category_id = categories[category.lower()]
+
+    row = {
+        "name": name,
+        "latitude": latitude,
+        "longitude": longitude,
+        "description": text("description", strip=False),
+        "category_id": category_id
+    }
+    if marker_id is not None:
+        row["id"] = marker_id
+
+    building, floor = text("building"), text("floor")
+    if building or floor:
+        if not building or not floor:
+            raise ValueError("indoor markers need both building and floor")
+        row.update(building=building, floor=floor)
+    return row
+
+
+def upsert_rows(session, model, key_fields, rows):
+    """Insert or update rows, in BATCH_SIZE executemany batches.
+
+    Rows with an id update that marker, or are inserted with that id if it is not taken; rows
+    without one are matched on key_fields. If a row is matched more than once the last one wins.
+    Runs inside the caller's transaction; returns (inserted, updated).
+    """
+    columns = [getattr(model, field) for field in key_fields]
+    stored = session.query(model.id, *columns).all()
+    existing = {tuple(row[1:]): row[0] for row in stored}
+    ids = {row[0] for row in stored}
+    latest = {}
+    for row in rows:
+        key = ("id", row["id"]) if "id" in row else tuple(row[field] for field in key_fields)
+        latest[key] = row
+
+    inserts, inserts_with_id, updates = [], [], []
+    for key, row in latest.items():
+        marker_id = row["id"] if "id" in row else existing.get(key)
+        if marker_id in ids:
+            updates.append(dict(row, id=marker_id))
+        elif "id" in row:
+            inserts_with_id.append(row)
+        else:
+            inserts.append(row)
+
+    # Separate batches, since every row of an executemany needs the same columns
+    for batch in (inserts_with_id, inserts):
+        for start in range(0, len(batch), BATCH_SIZE):
+            session.execute(insert(model), batch[start:start + BATCH_SIZE])
+    for start in range(0, len(updates), BATCH_SIZE):
+        # Bulk UPDATE by primary key
+        session.execute(update(model), updates[start:start + BATCH_SIZE])
+
+    return len(inserts) + len(inserts_with_id), len(updates)
+
+
+def export_csv(rows):
+    """Yield a CSV file of marker dicts (CSV_FIELDS keys) chunk by chunk"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_geojson(rows):
+    """Yield a GeoJSON FeatureCollection of marker dicts chunk by chunk"""
+    yield '{"type": "FeatureCollection", "features": [\n'
+    chunk = []
+    for count, row in enumerate(rows):
+        properties = {key: row[key] for key in CSV_FIELDS if key not in ("latitude", "longitude") and row.get(key) is not None}
+        feature = {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [row["longitude"], row["latitude"]]},
+            "properties": properties
+        }
+        chunk.append(("" if count == 0 else ",\n") + json.dumps(feature, ensure_ascii=False))
+        if len(chunk) == BATCH_SIZE:
+            yield "".join(chunk)
+            chunk = []
+    yield "".join(chunk) + "\n]}\n"
@@ -0,0 +1,110 @@
+import logging, random, threading, uuid
+from datetime import datetime, timedelta
+
+
+log = logging.getLogger(__name__)
+
+
+class OutboxWorker(threading.Thread):
+    """Background thread that delivers queued emails from the outbox table.
+
+    Pending rows are claimed in batches with a claim token, so several workers (e.g. the
+    debug reloader's two processes) never send the same row twice. A failed batch is retried
+    with exponential backoff; after max_attempts its rows are marked "failed".
+    """
+
+    def __init__(self, app, db, model, send_batch, batch_size=50, poll_seconds=5.0,
+                 max_attempts=5, backoff_seconds=10.0, max_backoff_seconds=3600.0, claim_timeout_seconds=600.0):
+        super().__init__(name="email-outbox", daemon=True)
+        self.app = app
+        self.db = db
+        self.model = model
+        self.send_batch = send_batch
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.claim_timeout_seconds = claim_timeout_seconds
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def wake(self):
+        """Deliver new messages now instead of at the next poll"""
+        self._wake.set()
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+
+    def run(self):
+        while not self._stopping.is_set():
+            try:
+                with self.app.app_context():
+                    sent = self.drain_once()
+            except Exception as e:
+                log.error("❌ Email outbox worker error: %s", e)
+                sent = 0
+
+            # Keep going while there is a backlog, otherwise sleep until woken or the next poll
+            if not sent:
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+
+    def backoff(self, attempts):
+        delay = min(self.backoff_seconds * 2 ** (attempts - 1), self.max_backoff_seconds)
+        return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+    def claim_batch(self):
+        """Mark up to batch_size due messages as ours and return them"""
+        model, session = self.model, self.db.session
+        now = datetime.now()
+        stale = now - timedelta(seconds=self.claim_timeout_seconds)
+
+        due = (model.status == "pending") & (model.next_attempt_at <= now)
+        # Rows claimed by a worker that died mid-send are picked up again
+        abandoned = (model.status == "sending") & (model.claimed_at < stale)
+
+        ids = [row.id for row in session.query(model.id).filter(due | abandoned)
+               .order_by(model.id).limit(self.batch_size)]
+        if not ids:
+            return []
+
+        token = uuid.uuid4().hex
+        session.query(model).filter(model.id.in_(ids), due | abandoned).update(
+            {"status": "sending", "claim_token": token, "claimed_at": now}, synchronize_session=False)
+        session.commit()
+
+        return model.query.filter_by(claim_token=token).order_by(model.id).all()
+
+    def drain_once(self):
+        """Send one batch; returns the number of messages delivered"""
+        batch = self.claim_batch()
+        if not batch:
+            return 0
+
+        now = datetime.now()
+        try:
+            self.send_batch([{"to": m.to, "subject": m.subject, "body": m.body} for m in batch])
+        except Exception as e:
+            log.error("❌ Email batch of %d failed: %s", len(batch), e)
+            for message in batch:
+                message.attempts += 1
+                message.last_error = str(e)[:500]
+                message.claim_token = None
+                if message.attempts >= self.max_attempts:
+                    message.status = "failed"
+                else:
+                    message.status = "pending"
+                    message.next_attempt_at = now + self.backoff(message.attempts)
+            self.db.session.commit()
+            return 0
+
+        for message in batch:
+            message.attempts += 1
+            message.status = "sent"
+            message.sent_at = now
+            message.last_error = None
+            message.claim_token = None
+        self.db.session.commit()
+        return len(batch)
@@ -0,0 +1,255 @@
+import logging, math, queue, threading, time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+log = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Stops calling a provider after repeated failures or slow calls.
+
+    Once open, a single trial call is let through after reset_seconds; if it succeeds in
+    time the breaker closes again, otherwise it stays open for another period.
+    """
+
+    def __init__(self, failure_threshold=3, slow_call_seconds=8.0, reset_seconds=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        """True if a call may be made now; in half-open state only one trial call is allowed"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.clock() - self.opened_at >= self.reset_seconds and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def release(self):
+        """Give back a call allow() let through that was never made"""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record(self, ok, seconds):
+        """Record the outcome of a call; calls slower than slow_call_seconds count as failures"""
+        with self._lock:
+            self.trial_in_flight = False
+            if ok and seconds <= self.slow_call_seconds:
+                self.failures = 0
+                self.opened_at = None
+                return
+
+            self.failures += 1
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = self.clock()
+
+
+class StreamInterrupted(Exception):
+    """The winning provider's stream broke off after part of the answer was sent"""
+
+
+class Provider:
+    """An AI backend: call(user_message, campus_info) returns the answer text or raises.
+
+    stream(user_message, campus_info), if given, yields the answer in chunks as they arrive.
+    """
+
+    def __init__(self, name, call, stream=None, breaker=None):
+        self.name = name
+        self.call = call
+        self.stream = stream
+        self.breaker = breaker or CircuitBreaker()
+
+
+class ProviderPool:
+    """Ask providers in order within a latency budget, hedging to the next one when the first is slow.
+
+    The first provider is called straight away. If it has not answered after hedge_delay seconds,
+    or as soon as it fails, the next allowed provider is called too, and whichever answers first
+    wins. ask() returns None once the budget is spent. Time a call waits for a free worker counts
+    against the budget: calls still queued are cancelled, and a call that only gets a worker after the
+    deadline is skipped. Calls already running finish in the background and only update their
+    provider's circuit breaker.
+
+    max_workers bounds the provider calls running at once across all requests (AI_MAX_WORKERS).
+    on_call(provider, ok, seconds), if given, is told the outcome of every provider call.
+    """
+
+    def __init__(self, providers, budget=10.0, hedge_delay=2.5, max_workers=8, clock=time.monotonic, on_call=None):
+        self.providers = list(providers)
+        self.budget = budget
+        self.hedge_delay = hedge_delay
+        self.clock = clock
+        self.on_call = on_call
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-provider")
+
+    def _call(self, provider, args, deadline):
+        start = self.clock()
+        if start >= deadline:
+            log.warning("⏱️ %s skipped: waited past the budget for a worker", provider.name)
+            provider.breaker.release()
+            return None
+        answer = None
+        try:
+            answer = provider.call(*args)
+        except Exception as e:
+            log.error("❌ %s failed: %s", provider.name, e)
+        finally:
+            self.record(provider, bool(answer), self.clock() - start)
+        return answer
+
+    def record(self, provider, ok, seconds):
+        provider.breaker.record(ok, seconds)
+        if self.on_call:
+            self.on_call(provider, ok, seconds)
+
+    def cancel(self, pending):
+        """Cancel calls that have not started yet; ones already running cannot be stopped"""
+        for future, provider in pending.items():
+            if future.cancel():
+                provider.breaker.release()
+
+    def ask(self, *args):
+        deadline = self.clock() + self.budget
+        remaining = iter(self.providers)
+        pending = {}
+
+        def launch():
+            for provider in remaining:
+                if provider.breaker.allow():
+                    pending[self.executor.submit(self._call, provider, args, deadline)] = provider
+                    return True
+            return False
+
+        launch()
+        hedge_at = self.clock() + self.hedge_delay
+
+        while pending:
+            now = self.clock()
+            if now >= deadline:
+                break
+
+            done, _ = wait(pending, timeout=max(min(deadline, hedge_at) - now, 0), return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.pop(future)
+                answer = future.result()
+                if answer:
+                    self.cancel(pending)
+                    return answer
+                # Failed: bring in the next provider right away
+                launch()
+
+            if not done and self.clock() >= hedge_at:
+                launch()
+                hedge_at = math.inf
+
+        self.cancel(pending)
+        return None
+
+    def _stream(self, provider, args, events, cancelled, deadline):
+        start = self.clock()
+        if cancelled.is_set() or start >= deadline:
+            # Lost the race, or waited past the budget for a worker, before starting
+            provider.breaker.release()
+            events.put((provider, "end", False))
+            return
+        first_chunk_seconds = None
+        finished = False
+        try:
+            for chunk in provider.stream(*args):
+                if cancelled.is_set():
+                    break
+                if chunk:
+                    if first_chunk_seconds is None:
+                        first_chunk_seconds = self.clock() - start
+                    events.put((provider, "chunk", chunk))
+            else:
+                finished = True
+        except Exception as e:
+            log.error("❌ %s stream failed: %s", provider.name, e)
+        finally:
+            # Streams are judged on time to first chunk, not on how long the answer is
+            ok = first_chunk_seconds is not None
+            self.record(provider, ok, first_chunk_seconds if ok else self.clock() - start)
+            events.put((provider, "end", finished))
+
+    def stream(self, *args):
+        """Yield answer chunks from the first provider to start streaming.
+
+        Hedging works like ask(), but on the first chunk, and the budget only limits the wait for
+        it: once a provider has sent one, the others are cancelled and its stream is passed through
+        to the end. Yields nothing if no provider starts within the budget; raises StreamInterrupted
+        if the winner's stream breaks off, so a partial answer is never taken for a whole one.
+        """
+        deadline = self.clock() + self.budget
+        remaining = iter([p for p in self.providers if p.stream])
+        events = queue.Queue()
+        cancelled = {}
+        running = set()
+        winner = None
+
+        def launch():
+            for provider in remaining:
+                if provider.breaker.allow():
+                    running.add(provider)
+                    cancelled[provider] = threading.Event()
+                    self.executor.submit(self._stream, provider, args, events, cancelled[provider], deadline)
+                    return True
+            return False
+
+        launch()
+        hedge_at = self.clock() + self.hedge_delay
+
+        try:
+            while running:
+                if winner:
+                    provider, kind, value = events.get()
+                else:
+                    now = self.clock()
+                    if now >= deadline:
+                        return
+                    try:
+                        provider, kind, value = events.get(timeout=max(min(deadline, hedge_at) - now, 0))
+                    except queue.Empty:
+                        if self.clock() >= hedge_at:
+                            launch()
+                            hedge_at = math.inf
+                        continue
+
+                if kind == "end":
+                    running.discard(provider)
+                    if provider is winner:
+                        if not value:  # the end event's value says whether the stream finished
+                            raise StreamInterrupted(f"{provider.name} stream broke off")
+                        return
+                    if winner is None:
+                        # Failed before sending anything: bring in the next provider right away
+                        launch()
+                    continue
+
+                if winner is None:
+                    winner = provider
+                    for other, event in cancelled.items():
+                        if other is not winner:
+                            event.set()
+                if provider is winner:
+                    yield value
+        finally:
+            # Also stops the winner if the client went away mid-answer
+            for event in cancelled.values():
+                event.set()
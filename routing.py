@@ -0,0 +1,965 @@
+import heapq, itertools, json, math, os, struct, sys, threading
+from array import array
+from collections import OrderedDict
+from spatial import NodeIndex
+
+
+EARTH_RADIUS_M = 6371000
+MERGE_THRESHOLD_M = 5
+BUILDING_RADIUS_M = 80
+LANDMARK_COUNT = 8
+ROUTE_CACHE_SIZE = 4096
+SEARCH_RADIUS_M = 5000  # one-to-many searches give up on targets farther than this
+DETOUR_SNAP_M = 15  # detours must start and end this close to an existing walkway node
+NO_FID = -1  # edge_fids value for features without a fid
+DETOUR_FID = -2  # edge_fids value for detour edges
+
+# Every graph gets a new version, so anything derived from one (indoor graphs, cache entries) can tell it apart
+graph_versions = itertools.count(1)
+
+# Compact transport format (see WalkwayGraph.to_bytes)
+TRANSPORT_MAGIC = b"CPWG"
+TRANSPORT_VERSION = 1
+TRANSPORT_HEADER = struct.Struct("<4sHHIIIIddd")
+TRANSPORT_SCALE = 1e-7  # degrees per quantization step, about 1 cm
+
+# Same centres as getBuildingCenter() in static/routing.js
+BUILDING_CENTERS = {
+    "FCI Building": (2.928633, 101.64111),
+    "FOM Building": (2.929487, 101.641294),
+    "FAIE Building": (2.926401, 101.641255),
+    "FCM Building": (2.926155, 101.642649)
+}
+
+# Indoor marker building ids, and the floor each building is entered on (default: its lowest floor)
+BUILDING_IDS = {"FCI Building": "fci", "FOM Building": "fom", "FAIE Building": "faie", "FCM Building": "fcm"}
+BUILDING_NAMES = {building: name for name, building in BUILDING_IDS.items()}
+ENTRANCE_FLOORS = {"faie": "1"}
+
+FLOOR_LINKS = 3  # each indoor marker is linked to this many nearest markers on its floor
+SHAFT_RADIUS_M = 5  # stairs or lifts this close on adjacent floors are the same stairwell or shaft
+DOOR_COUNT = 2
+# Going up or down one floor, in equivalent meters of walking
+VERTICAL_COST_M = {"Stairs": 12, "Lift": 8}
+
+
+def is_stairs(properties):
+    return "stairs" in str(properties.get("type", ""))
+
+
+def is_road_crossing(properties):
+    # Spelled "roadcross", "crossroad" and a few variants in the GeoJSON
+    return "cross" in str(properties.get("type", ""))
+
+
+def step_free_cost(properties):
+    """Leaves out stairs not marked accessible and prefers accessible paths"""
+    if is_stairs(properties) and not properties.get("accessible"):
+        return None
+    return (1.0 if properties.get("accessible") else 1.5), 0.0
+
+
+def fewer_crossings_cost(properties):
+    """Road crossings count double plus 50 m each, so a short detour beats crossing"""
+    return (2.0, 50.0) if is_road_crossing(properties) else (1.0, 0.0)
+
+
+# Routing profiles: cost(feature properties) -> (length factor, meters added once per feature), or
+# None to leave the feature out of that profile's graph. Factors stay >= 1 so the straight-line
+# A* heuristic is still a lower bound.
+ROUTING_PROFILES = {
+    "default": None,
+    "step_free": step_free_cost,
+    "fewer_crossings": fewer_crossings_cost,
+}
+# Indoor vertical links each profile does not use
+INDOOR_EXCLUDED = {"step_free": {"Stairs"}}
+
+
+def distance_meters(lat1, lng1, lat2, lng2):
+    """Haversine distance in meters"""
+    to_rad = math.radians
+    d_lat = to_rad(lat2 - lat1)
+    d_lng = to_rad(lng2 - lng1)
+
+    a = (math.sin(d_lat / 2) ** 2 +
+         math.cos(to_rad(lat1)) * math.cos(to_rad(lat2)) *
+         math.sin(d_lng / 2) ** 2)
+
+    return EARTH_RADIUS_M * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def weld_vertices(lats, lngs, threshold):
+    """Merge vertices closer than threshold, keeping the first vertex of each group.
+
+    Vertices are bucketed into threshold-sized grid cells and only compared with the 3x3 block
+    around them, so this is near-linear instead of all-pairs. Returns vertex -> kept vertex.
+    """
+    mapping = list(range(len(lats)))
+    if not lats:
+        return mapping
+
+    # Cells are at least `threshold` wide everywhere in the data, so neighbours are never missed
+    max_lat = max(abs(lat) for lat in lats)
+    meters_per_degree = math.radians(EARTH_RADIUS_M)
+    cell_lat = threshold / meters_per_degree
+    cell_lng = threshold / (meters_per_degree * max(math.cos(math.radians(max_lat)), 1e-6))
+
+    cells = {}
+    for j in range(len(lats)):
+        lat, lng = lats[j], lngs[j]
+        cx, cy = int(math.floor(lng / cell_lng)), int(math.floor(lat / cell_lat))
+
+        rep = None
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for i in cells.get((cx + dx, cy + dy), ()):
+                    if (rep is None or i < rep) and distance_meters(lats[i], lngs[i], lat, lng) < threshold:
+                        rep = i
+
+        if rep is None:
+            cells.setdefault((cx, cy), []).append(j)
+        else:
+            mapping[j] = rep
+
+    return mapping
+
+
+class RouteCache:
+    """Thread-safe LRU cache of route results keyed by (start node, end node, profile).
+
+    Entries remember the graph version they were found on and the node path, so a changed graph can
+    keep the entries that are still right for it (see WalkwayGraph.with_changes).
+    """
+
+    def __init__(self, maxsize=ROUTE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, version, nodes, result):
+        with self._lock:
+            self._entries[key] = (version, nodes, result)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def revalidate(self, old_version, new_version, keep):
+        """Move the old_version entries for which keep(key, nodes, result) is true to new_version and drop
+        the rest; returns how many were dropped"""
+        with self._lock:
+            dropped = 0
+            for key, (version, nodes, result) in list(self._entries.items()):
+                if version == old_version and keep(key, nodes, result):
+                    self._entries[key] = (new_version, nodes, result)
+                else:
+                    del self._entries[key]
+                    dropped += 1
+            return dropped
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class WalkwayGraph:
+    """Walkway network with integer node ids and array-backed (CSR) adjacency"""
+
+    def __init__(self, lats, lngs, offsets, targets, weights, edge_fids=None, lengths=None):
+        self.lats = lats
+        self.lngs = lngs
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        # Walking meters of each CSR slot; weights differ once a profile cost or admin cost change applies
+        self.lengths = lengths if lengths is not None else weights
+        # GeoJSON fid of each CSR slot, so closures and cost changes can find a feature's edges
+        self.edge_fids = edge_fids if edge_fids is not None else array("l", [NO_FID]) * len(targets)
+        self.version = next(graph_versions)
+
+        # Profile graphs and closures leave some nodes without usable edges; never snap to those
+        self.index = NodeIndex(lats, lngs, [n for n in range(len(lats)) if any(
+            weights[i] != math.inf for i in range(offsets[n], offsets[n + 1]))])
+        # Nodes around each building, so building-filtered snaps only look at a handful of nodes
+        self.entrances = {
+            name: self.index.within(lat, lng, BUILDING_RADIUS_M)
+            for name, (lat, lng) in BUILDING_CENTERS.items()
+        }
+
+        self.lines = []  # node ids of each LineString after welding, for drawing the network
+        self.landmarks = []
+        self.landmark_tables = []
+        self.route_cache = RouteCache()
+        self.profiles = {"default": self}
+        self.base = self  # the graph as loaded from the GeoJSON, before admin changes
+        self.changes = []
+        self.source_path = None
+        self.source_mtime = None
+
+    @property
+    def node_count(self):
+        return len(self.lats)
+
+    @property
+    def edge_count(self):
+        return len(self.targets)
+
+    @classmethod
+    def load(cls, path):
+        """Build the default and per-profile graphs from a GeoJSON file and run the landmark preprocessing"""
+        mtime = os.path.getmtime(path)
+        with open(path, encoding="utf-8") as f:
+            geojson = json.load(f)
+
+        graph = cls.from_geojson(geojson)
+        for name, cost in ROUTING_PROFILES.items():
+            if cost:
+                graph.profiles[name] = cls.from_geojson(geojson, cost=cost)
+        for profile in graph.profiles.values():
+            profile.precompute_landmarks()
+
+        graph.source_path = path
+        graph.source_mtime = mtime
+        return graph
+
+    def is_stale(self):
+        """True if the GeoJSON file this graph was loaded from has changed since"""
+        if not self.source_path:
+            return False
+        try:
+            return os.path.getmtime(self.source_path) != self.source_mtime
+        except OSError:
+            return False
+
+    @classmethod
+    def from_geojson(cls, geojson, threshold=MERGE_THRESHOLD_M, cost=None):
+        """Build the graph the same way buildGraphFromGeoJSON() does in static/path.js.
+
+        With a profile cost function, edges are weighted (or left out) by their feature's properties.
+        Every vertex is still welded, so node ids are the same in every profile's graph.
+        """
+        lats, lngs, edges, costs, fids, lines = [], [], [], [], [], []
+
+        for feature in geojson.get("features", []):
+            geometry = feature.get("geometry") or {}
+            if geometry.get("type") != "LineString":
+                continue
+
+            properties = feature.get("properties") or {}
+            feature_cost = cost(properties) if cost else (1.0, 0.0)
+            fid = properties.get("fid")
+            prev = None
+            line = []
+            for lng, lat in (c[:2] for c in geometry["coordinates"]):
+                node = len(lats)
+                lats.append(lat)
+                lngs.append(lng)
+                line.append(node)
+                if prev is not None and feature_cost is not None:
+                    edges.append((prev, node))
+                    # The per-feature extra goes on its first segment only
+                    costs.append((feature_cost[0], feature_cost[1] if len(line) == 2 else 0.0))
+                    fids.append(fid if isinstance(fid, int) else NO_FID)
+                prev = node
+            if feature_cost is not None:
+                lines.append(line)
+
+        mapping = weld_vertices(lats, lngs, threshold)
+        return cls.from_edges(lats, lngs, edges, mapping, lines, costs if cost else None, fids)
+
+    @classmethod
+    def from_edges(cls, lats, lngs, edges, mapping, lines=(), costs=None, fids=None):
+        """Renumber merged nodes densely and pack both edge directions into CSR arrays.
+
+        costs, if given, holds a (length factor, extra meters) pair per edge, and fids the feature id of each edge.
+        """
+        new_id = {}
+        node_lats, node_lngs = array("d"), array("d")
+        for node, rep in enumerate(mapping):
+            if node == rep:
+                new_id[node] = len(node_lats)
+                node_lats.append(lats[node])
+                node_lngs.append(lngs[node])
+
+        adjacency = [[] for _ in range(len(node_lats))]
+        for i, (a, b) in enumerate(edges):
+            # Weight uses the original vertices, like the client does before merging
+            length = weight = distance_meters(lats[a], lngs[a], lats[b], lngs[b])
+            if costs:
+                weight = weight * costs[i][0] + costs[i][1]
+            u, v = new_id[mapping[a]], new_id[mapping[b]]
+            if u == v:
+                continue
+            fid = fids[i] if fids else NO_FID
+            adjacency[u].append((v, weight, fid, length))
+            adjacency[v].append((u, weight, fid, length))
+
+        offsets, targets, weights, edge_fids = array("l", [0]), array("l"), array("d"), array("l")
+        lengths = array("d")
+        for neighbours in adjacency:
+            for v, weight, fid, length in neighbours:
+                targets.append(v)
+                weights.append(weight)
+                edge_fids.append(fid)
+                lengths.append(length)
+            offsets.append(len(targets))
+
+        graph = cls(node_lats, node_lngs, offsets, targets, weights, edge_fids, lengths if costs else None)
+        for line in lines:
+            welded = array("l")
+            for node in line:
+                if not welded or welded[-1] != new_id[mapping[node]]:
+                    welded.append(new_id[mapping[node]])
+            graph.lines.append(welded)
+        return graph
+
+    def to_bytes(self):
+        """Pack the graph into the compact transport format read by loadWalkwayGraph() in static/path.js.
+
+        Little-endian, every section 4-byte aligned so the client can view it as typed arrays:
+        a TRANSPORT_HEADER (magic, version, node, edge, line and line-node counts, origin lat/lng,
+        scale), then Int32 lat and lng offsets from the origin in TRANSPORT_SCALE steps, Uint32
+        CSR offsets (n + 1) and targets, Float32 weights in meters, and the drawing lines as Uint32
+        line offsets (lines + 1) into a Uint32 list of node ids.
+        """
+        origin_lat = min(self.lats, default=0.0)
+        origin_lng = min(self.lngs, default=0.0)
+        line_offsets, line_nodes = array("I", [0]), array("I")
+        for line in self.lines:
+            line_nodes.fromlist(line.tolist())
+            line_offsets.append(len(line_nodes))
+
+        sections = [
+            array("i", (round((lat - origin_lat) / TRANSPORT_SCALE) for lat in self.lats)),
+            array("i", (round((lng - origin_lng) / TRANSPORT_SCALE) for lng in self.lngs)),
+            array("I", self.offsets),
+            array("I", self.targets),
+            array("f", self.weights),
+            line_offsets,
+            line_nodes,
+        ]
+        if sys.byteorder == "big":
+            for section in sections:
+                section.byteswap()
+
+        header = TRANSPORT_HEADER.pack(TRANSPORT_MAGIC, TRANSPORT_VERSION, 0, self.node_count, self.edge_count,
+                                       len(self.lines), len(line_nodes), origin_lat, origin_lng, TRANSPORT_SCALE)
+        return header + b"".join(section.tobytes() for section in sections)
+
+    def neighbours(self, node):
+        for i in range(self.offsets[node], self.offsets[node + 1]):
+            yield self.targets[i], self.weights[i]
+
+    def nearest_node(self, lat, lng, building=None):
+        """Snap a coordinate to the closest node, preferring nodes near the target building"""
+        entrances = self.entrances.get(building)
+        if entrances:
+            return min(entrances, key=lambda n: distance_meters(lat, lng, self.lats[n], self.lngs[n]))
+
+        node, _ = self.index.nearest(lat, lng)
+        return node
+
+    def shortest_distances(self, source):
+        """Dijkstra from source; returns an array of network distances (inf where unreachable)"""
+        offsets, targets, weights = self.offsets, self.targets, self.weights
+        dist = array("d", [math.inf]) * self.node_count
+        dist[source] = 0.0
+        heap = [(0.0, source)]
+
+        while heap:
+            d, current = heapq.heappop(heap)
+            if d > dist[current]:
+                continue
+            for i in range(offsets[current], offsets[current + 1]):
+                neighbour = targets[i]
+                nd = d + weights[i]
+                if nd < dist[neighbour]:
+                    dist[neighbour] = nd
+                    heapq.heappush(heap, (nd, neighbour))
+
+        return dist
+
+    def search_targets(self, source, targets, max_cost=SEARCH_RADIUS_M):
+        """One Dijkstra from source that stops once every target node is settled or max_cost is passed.
+
+        Returns ({target: cost} for the targets reached, {node: previous node} of the search tree).
+        """
+        remaining = set(targets)
+        offsets, targets, weights = self.offsets, self.targets, self.weights
+        dist = {source: 0.0}
+        previous = {source: None}
+        found = {}
+        heap = [(0.0, source)]
+
+        while heap and remaining:
+            d, current = heapq.heappop(heap)
+            if d > dist[current]:
+                continue
+            if d > max_cost:
+                break
+            if current in remaining:
+                remaining.discard(current)
+                found[current] = d
+            for i in range(offsets[current], offsets[current + 1]):
+                neighbour = targets[i]
+                nd = d + weights[i]
+                if nd < dist.get(neighbour, math.inf):
+                    dist[neighbour] = nd
+                    previous[neighbour] = current
+                    heapq.heappush(heap, (nd, neighbour))
+
+        return found, previous
+
+    def precompute_landmarks(self, count=LANDMARK_COUNT):
+        """Pick landmarks and store their distance tables for the ALT lower bound.
+
+        The snapped building entrances are always landmarks, since most routes end there and a
+        landmark on the goal makes the bound exact. The rest are picked farthest-first so they
+        sit on the edge of the network, where they give the tightest bounds.
+        """
+        self.landmarks, self.landmark_tables = [], []
+        if not self.node_count:
+            return
+
+        def add(node):
+            if node is not None and node not in self.landmarks:
+                self.landmarks.append(node)
+                self.landmark_tables.append(self.shortest_distances(node))
+
+        for name in BUILDING_CENTERS:
+            add(self.nearest_node(*BUILDING_CENTERS[name], building=name))
+
+        if not self.landmarks:
+            add(0)
+
+        # Closest landmark distance for every node, to pick the next farthest one
+        closest = array("d", self.landmark_tables[0])
+        for table in self.landmark_tables[1:]:
+            closest = array("d", map(min, closest, table))
+
+        for _ in range(count):
+            far = max((d, n) for n, d in enumerate(closest) if d != math.inf)
+            if far[0] <= 0:
+                break
+            add(far[1])
+            closest = array("d", map(min, closest, self.landmark_tables[-1]))
+
+    def astar(self, start, goal):
+        """A* over the CSR arrays with a binary heap; returns (node path, distance) or None.
+
+        The heuristic is the larger of the straight-line distance and the ALT landmark bound.
+        """
+        lats, lngs = self.lats, self.lngs
+        offsets, targets, weights = self.offsets, self.targets, self.weights
+        goal_lat, goal_lng = lats[goal], lngs[goal]
+
+        # Only landmarks that can reach the goal give a usable bound
+        goal_rows = [(table, table[goal]) for table in self.landmark_tables if table[goal] != math.inf]
+
+        def heuristic(node):
+            h = distance_meters(lats[node], lngs[node], goal_lat, goal_lng)
+            for table, to_goal in goal_rows:
+                bound = abs(to_goal - table[node])
+                if bound > h and bound != math.inf:
+                    h = bound
+            return h
+
+        g_score = {start: 0.0}
+        came_from = {}
+        closed = set()
+        open_heap = [(heuristic(start), start)]
+
+        while open_heap:
+            _, current = heapq.heappop(open_heap)
+
+            if current == goal:
+                path = [current]
+                while current in came_from:
+                    current = came_from[current]
+                    path.append(current)
+                path.reverse()
+                return path, g_score[goal]
+
+            if current in closed:
+                continue
+            closed.add(current)
+
+            current_g = g_score[current]
+            for i in range(offsets[current], offsets[current + 1]):
+                neighbour = targets[i]
+                tentative_g = current_g + weights[i]
+                if tentative_g < g_score.get(neighbour, math.inf):
+                    came_from[neighbour] = current
+                    g_score[neighbour] = tentative_g
+                    heapq.heappush(open_heap, (tentative_g + heuristic(neighbour), neighbour))
+
+        return None
+
+    def route(self, from_lat, from_lng, to_lat, to_lng, building=None, profile="default"):
+        """Snap both ends and return {"path": [[lat, lng], ...], "distance": meters, "cost": profile cost} or None"""
+        graph = self.profiles.get(profile)
+        if graph is None:
+            return None
+
+        start = graph.nearest_node(from_lat, from_lng)
+        goal = graph.nearest_node(to_lat, to_lng, building)
+        if start is None or goal is None:
+            return None
+
+        key = (start, goal, profile)
+        cached = self.route_cache.get(key, self.version)
+        if cached is not None:
+            return cached
+
+        result = graph.astar(start, goal)
+        if not result:
+            return None
+
+        path, cost = result
+        route = {
+            "path": [[self.lats[n], self.lngs[n]] for n in path],
+            "distance": graph.path_meters(path),
+            "cost": cost
+        }
+        self.route_cache.put(key, self.version, tuple(path), route)
+        return route
+
+    def snap(self, lat, lng, building=None, profile="default"):
+        """Node a point snaps to in a profile's graph (node ids are the same in every profile), or None"""
+        graph = self.profiles.get(profile)
+        return graph.nearest_node(lat, lng, building) if graph else None
+
+    def distances_from(self, from_lat, from_lng, nodes, profile="default"):
+        """Walking distances from a point to many nodes with one bounded search instead of a route each.
+
+        Returns {node: (profile cost, meters)} for the nodes reached; rank by cost, show meters.
+        """
+        graph = self.profiles.get(profile)
+        start = graph.nearest_node(from_lat, from_lng) if graph else None
+        if start is None:
+            return {}
+
+        found, previous = graph.search_targets(start, nodes)
+        if graph.weights is graph.lengths:
+            return {node: (cost, cost) for node, cost in found.items()}
+
+        distances = {}
+        for node, cost in found.items():
+            path = [node]
+            while previous[path[-1]] is not None:
+                path.append(previous[path[-1]])
+            distances[node] = (cost, graph.path_meters(path))
+        return distances
+
+    def path_meters(self, path):
+        """Walking meters along a node path, over the cheapest edge between each pair of nodes as routed"""
+        meters = 0.0
+        for a, b in zip(path, path[1:]):
+            slot = min((i for i in range(self.offsets[a], self.offsets[a + 1]) if self.targets[i] == b),
+                       key=self.weights.__getitem__)
+            meters += self.lengths[slot]
+        return meters
+
+
+    @property
+    def feature_ids(self):
+        return set(self.edge_fids) - {NO_FID, DETOUR_FID}
+
+    def edge_weight(self, a, b):
+        """Weight of the cheapest edge from a to b (inf if there is none)"""
+        return min((self.weights[i] for i in range(self.offsets[a], self.offsets[a + 1]) if self.targets[i] == b),
+                   default=math.inf)
+
+    def lower_bound(self, a, b):
+        """Straight-line or ALT landmark lower bound on the network distance from a to b, as in astar()"""
+        h = distance_meters(self.lats[a], self.lngs[a], self.lats[b], self.lngs[b])
+        for table in self.landmark_tables:
+            if table[a] != math.inf and table[b] != math.inf:
+                h = max(h, abs(table[b] - table[a]))
+        return h
+
+    def attach_detour(self, coordinates):
+        """Node path of a detour given as [lng, lat] pairs: its ends snapped to existing nodes within
+        DETOUR_SNAP_M and its inner points numbered as new nodes after the existing ones"""
+        ends = []
+        for lng, lat in (coordinates[0], coordinates[-1]):
+            node, meters = self.index.nearest(lat, lng)
+            if node is None or meters > DETOUR_SNAP_M:
+                raise ValueError(f"A detour must start and end within {DETOUR_SNAP_M} m of a walkway")
+            ends.append(node)
+        inner = range(self.node_count, self.node_count + len(coordinates) - 2)
+        return [ends[0], *inner, ends[1]], [(lat, lng) for lng, lat in coordinates[1:-1]]
+
+    def with_changes(self, changes):
+        """A new graph: the one loaded from the GeoJSON plus admin changes, without re-reading or re-welding it.
+
+        changes are dicts with "kind" "close" (fid), "cost" (fid, factor >= 1) or "detour" (coordinates as
+        [lng, lat] pairs, accessible). Closures and costs only rewrite edge weights, and since they never
+        shorten a distance the landmark tables stay valid; detours append their nodes and edges to the CSR
+        arrays and redo the landmarks. The route cache is shared with this graph, keeping only the entries
+        that are still shortest paths (see keep_route()). Raises ValueError for a detour that does not attach.
+        """
+        base = self.base
+        factors = {}
+        detours, points = [], []
+        for change in changes:
+            if change["kind"] == "close":
+                factors[change["fid"]] = math.inf
+            elif change["kind"] == "cost":
+                factors[change["fid"]] = max(factors.get(change["fid"], 1.0), change["factor"])
+            elif change["kind"] == "detour":
+                path, inner = base.attach_detour(change["coordinates"])
+                shift = len(points)
+                detours.append(({"type": "walkway", "accessible": int(bool(change.get("accessible")))},
+                                [n + shift if n >= base.node_count else n for n in path]))
+                points.extend(inner)
+
+        graph = base.derive(factors, points, detours)
+        for name, cost in ROUTING_PROFILES.items():
+            if cost:
+                graph.profiles[name] = base.profiles[name].derive(factors, points, detours, cost)
+        graph.changes = list(changes)
+        graph.source_path, graph.source_mtime = base.source_path, base.source_mtime
+
+        # Only edges of features changed before or now (and detours) can differ between the two graphs
+        fids = {c["fid"] for c in self.changes + graph.changes if "fid" in c} | {DETOUR_FID}
+        diffs = {name: graph.profiles[name].weight_changes(self.profiles[name], fids) + ({},) for name in graph.profiles}
+        graph.route_cache = self.route_cache
+        graph.routes_dropped = self.route_cache.revalidate(
+            self.version, graph.version,
+            lambda key, nodes, route: self.profiles[key[2]].keep_route(key, nodes, route["cost"], *diffs[key[2]]))
+        return graph
+
+    def derive(self, factors, points, detours, cost=None):
+        """This graph with feature weights multiplied by factors ({fid: factor}, inf closes) and detours
+        ((properties, node path) over the existing nodes plus points) added, weighted by the profile cost"""
+        lats, lngs, offsets, targets, edge_fids = self.lats, self.lngs, self.offsets, self.targets, self.edge_fids
+        weights, lengths = array("d", self.weights), self.lengths
+        lines = list(self.lines)
+        if points:
+            # Added in every profile, even where the detour is left out, so node ids stay the same
+            lats = lats + array("d", (lat for lat, _ in points))
+            lngs = lngs + array("d", (lng for _, lng in points))
+
+        added = {}
+        for properties, path in detours:
+            detour_cost = cost(properties) if cost else (1.0, 0.0)
+            if detour_cost is None:
+                continue
+            for i, (a, b) in enumerate(zip(path, path[1:])):
+                length = distance_meters(lats[a], lngs[a], lats[b], lngs[b])
+                weight = length * detour_cost[0] + (detour_cost[1] if i == 0 else 0.0)
+                added.setdefault(a, []).append((b, weight, length))
+                added.setdefault(b, []).append((a, weight, length))
+            lines.append(array("l", path))
+
+        if added:
+            # Repack the CSR arrays with the detour edges after each node's own
+            old_offsets, old_targets, old_weights, old_fids, old_lengths = offsets, targets, weights, edge_fids, lengths
+            offsets, targets, weights, edge_fids = array("l", [0]), array("l"), array("d"), array("l")
+            lengths = array("d")
+            for node in range(len(lats)):
+                if node + 1 < len(old_offsets):
+                    start, end = old_offsets[node], old_offsets[node + 1]
+                    targets.extend(old_targets[start:end])
+                    weights.extend(old_weights[start:end])
+                    edge_fids.extend(old_fids[start:end])
+                    lengths.extend(old_lengths[start:end])
+                for neighbour, weight, length in added.get(node, ()):
+                    targets.append(neighbour)
+                    weights.append(weight)
+                    edge_fids.append(DETOUR_FID)
+                    lengths.append(length)
+                offsets.append(len(targets))
+
+        if factors and lengths is self.weights:
+            lengths = array("d", lengths)  # the factors below must not reach the meters
+        for i, fid in enumerate(edge_fids):
+            factor = factors.get(fid)
+            if factor is not None:
+                weights[i] = math.inf if factor == math.inf else weights[i] * factor
+
+        graph = type(self)(lats, lngs, offsets, targets, weights, edge_fids, lengths)
+        graph.lines = lines
+        graph.base = self.base
+        if added or points:
+            graph.precompute_landmarks()
+        else:
+            graph.landmarks, graph.landmark_tables = self.landmarks, self.landmark_tables
+        return graph
+
+    def feature_weights(self, fids):
+        """{(a, b): cheapest weight} over the edges of the given features"""
+        weights = {}
+        for a in range(self.node_count):
+            for i in range(self.offsets[a], self.offsets[a + 1]):
+                if self.edge_fids[i] in fids:
+                    key = (a, self.targets[i])
+                    weights[key] = min(weights.get(key, math.inf), self.weights[i])
+        return weights
+
+    def weight_changes(self, old, fids):
+        """Edges (a, b) of the given features that got more expensive or closed, and that got cheaper or
+        were added, going from graph old to this one"""
+        old_weights, new_weights = old.feature_weights(fids), self.feature_weights(fids)
+        raised, lowered = set(), set()
+        for edge in old_weights.keys() | new_weights.keys():
+            before, after = old_weights.get(edge, math.inf), new_weights.get(edge, math.inf)
+            if after > before:
+                raised.add(edge)
+            elif after < before:
+                lowered.add(edge)
+        return raised, lowered
+
+    def keep_route(self, key, nodes, cost, raised, lowered, bounds):
+        """Whether a route found on this graph is still a shortest path once raised and lowered edges change.
+
+        A route over a changed edge is dropped, and so is one starting or ending inside a detour, whose node
+        ids may now mean other points. Raising other edges cannot beat a route, but a cheaper or new edge
+        might: any path using one starts with unchanged or raised edges up to the first one, and ends
+        likewise after the last, so it costs at least the lower bounds from start to and from goal to the
+        nearest changed edge end. Routes no longer than that are kept. bounds memoizes those per node.
+        """
+        changed = raised | lowered
+        if any(edge in changed for edge in zip(nodes, nodes[1:])):
+            return False
+        if max(key[0], key[1]) >= self.base.node_count:
+            return False
+        if not lowered:
+            return True
+
+        for node in key[:2]:
+            if node not in bounds:
+                # Edges are two-way, so the bound to the changes is also the bound from them
+                bounds[node] = min((self.lower_bound(node, end) for edge in lowered for end in edge
+                                    if end < self.node_count), default=math.inf)
+        return bounds[key[0]] + bounds[key[1]] >= cost
+
+
+def floor_order(floor):
+    try:
+        return (0, float(floor))
+    except ValueError:
+        return (1, floor)
+
+
+class IndoorGraph:
+    """One building's floors as a graph over its indoor markers, joined to the walkway graph at its doors.
+
+    There are no corridor drawings, so a floor's corridors are approximated by links to each marker's
+    FLOOR_LINKS nearest neighbours, plus whatever spanning tree links it takes to keep the floor connected.
+    Stairs and lifts at the same spot on adjacent floors are linked with VERTICAL_COST_M per floor.
+    Neighbours come from a NodeIndex per floor, so building takes O(n log n) rather than O(n^2). The doors are the entrance-floor markers closest to the walkway network, and distances
+    from every door to every marker are worked out once here, so routing to a room is one cached
+    outdoor A* per door plus a lookup.
+    """
+
+    def __init__(self, building, markers, walkway, version=None):
+        # markers: dicts with id, name, floor, latitude, longitude and category
+        self.building = building
+        self.markers = markers
+        self.walkway = walkway
+        self.version = version
+        self.adjacency = [[] for _ in markers]
+
+        by_floor = {}
+        for i, marker in enumerate(markers):
+            by_floor.setdefault(marker["floor"], []).append(i)
+        self.floors = sorted(by_floor, key=floor_order)
+
+        linked = set()
+
+        def link(a, b, weight, kind):
+            if (min(a, b), max(a, b)) not in linked:
+                linked.add((min(a, b), max(a, b)))
+                self.adjacency[a].append((b, weight, kind))
+                self.adjacency[b].append((a, weight, kind))
+
+        lats = [m["latitude"] for m in markers]
+        lngs = [m["longitude"] for m in markers]
+        floor_index = {floor: NodeIndex(lats, lngs, nodes) for floor, nodes in by_floor.items()}
+
+        for floor, nodes in by_floor.items():
+            index = floor_index[floor]
+            candidates = {}
+            for a in nodes:
+                for b, _ in index.nearest_k(lats[a], lngs[a], FLOOR_LINKS + 1):
+                    if b != a:
+                        candidates[min(a, b), max(a, b)] = self.distance(a, b)
+            for a, b in candidates:
+                link(a, b, candidates[a, b], "floor")
+            for a, b in self.spanning_tree(nodes, candidates, index):
+                link(a, b, self.distance(a, b), "floor")
+
+        for lower, upper in zip(self.floors, self.floors[1:]):
+            for a in by_floor[lower]:
+                category = markers[a]["category"]
+                if category not in VERTICAL_COST_M:
+                    continue
+                for b in floor_index[upper].within(lats[a], lngs[a], SHAFT_RADIUS_M):
+                    if markers[b]["category"] == category:
+                        link(a, b, VERTICAL_COST_M[category], category)
+
+        self.doors = self.find_doors(by_floor.get(ENTRANCE_FLOORS.get(building, self.floors[0] if self.floors else None), []))
+        self.door_tables = {
+            profile: [self.shortest_paths(marker, INDOOR_EXCLUDED.get(profile, ())) for marker, _, _ in self.doors]
+            for profile in ROUTING_PROFILES
+        }
+
+    def distance(self, a, b):
+        a, b = self.markers[a], self.markers[b]
+        return distance_meters(a["latitude"], a["longitude"], b["latitude"], b["longitude"])
+
+    def spanning_tree(self, nodes, candidates, index):
+        """Spanning tree over one floor's markers, as (a, b) pairs.
+
+        Kruskal over the nearest-neighbour candidate edges ({(a, b): meters}); if those leave the
+        floor in pieces, each piece is joined to the closest marker outside it (found through the
+        floor's index) until it is connected.
+        """
+        parent = {node: node for node in nodes}
+
+        def find(node):
+            while parent[node] != node:
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+
+        edges = []
+        for (a, b), _ in sorted(candidates.items(), key=lambda item: item[1]):
+            ra, rb = find(a), find(b)
+            if ra != rb:
+                parent[ra] = rb
+                edges.append((a, b))
+
+        while len(edges) < len(nodes) - 1:
+            pieces = {}
+            for node in nodes:
+                pieces.setdefault(find(node), []).append(node)
+            largest = max(pieces.values(), key=len)
+
+            # Boruvka step: the shortest link out of every piece but the largest
+            joins = []
+            for piece in pieces.values():
+                if piece is largest:
+                    continue
+                best = None
+                for a in piece:
+                    k = FLOOR_LINKS + 1
+                    while True:
+                        outside = [(d, b) for b, d in index.nearest_k(self.markers[a]["latitude"], self.markers[a]["longitude"], k)
+                                   if find(b) != find(a)]
+                        if outside or k >= len(nodes):
+                            break
+                        k *= 2
+                    if outside and (best is None or outside[0][0] < best[0]):
+                        best = (outside[0][0], a, outside[0][1])
+                joins.append(best)
+
+            for _, a, b in sorted(joins):
+                ra, rb = find(a), find(b)
+                if ra != rb:
+                    parent[ra] = rb
+                    edges.append((a, b))
+        return edges
+
+    def find_doors(self, entrance_markers):
+        """(marker, walkway node, meters between them) for the DOOR_COUNT entrance-floor markers nearest the walkways"""
+        walkway = self.walkway
+        candidates = []
+        for marker in entrance_markers:
+            m = self.markers[marker]
+            node = walkway.nearest_node(m["latitude"], m["longitude"], BUILDING_NAMES.get(self.building))
+            if node is not None:
+                candidates.append((distance_meters(m["latitude"], m["longitude"], walkway.lats[node], walkway.lngs[node]),
+                                   marker, node))
+        return [(marker, node, d) for d, marker, node in sorted(candidates)[:DOOR_COUNT]]
+
+    def shortest_paths(self, source, excluded=()):
+        """Dijkstra from one marker, not using links of the excluded kinds; returns (distances, previous marker) lists"""
+        dist = [math.inf] * len(self.markers)
+        previous = [None] * len(self.markers)
+        dist[source] = 0.0
+        heap = [(0.0, source)]
+        while heap:
+            d, current = heapq.heappop(heap)
+            if d > dist[current]:
+                continue
+            for neighbour, weight, kind in self.adjacency[current]:
+                if kind in excluded:
+                    continue
+                nd = d + weight
+                if nd < dist[neighbour]:
+                    dist[neighbour] = nd
+                    previous[neighbour] = current
+                    heapq.heappush(heap, (nd, neighbour))
+        return dist, previous
+
+    def marker_distances(self, door_distances, profile="default"):
+        """(cost, meters) to every marker through its best door, given {walkway node: (cost, meters)} to the
+        door nodes as returned by WalkwayGraph.distances_from(); (inf, inf) where no door leads"""
+        best = [(math.inf, math.inf)] * len(self.markers)
+        for (_, node, door_m), (dist, _) in zip(self.doors, self.door_tables.get(profile, ())):
+            if node in door_distances:
+                cost, meters = door_distances[node]
+                best = [min(b, (cost + door_m + d, meters + door_m + d)) for b, d in zip(best, dist)]
+        return best
+
+    def find_marker(self, lat, lng, floor=None, name=None):
+        """Index of the marker a destination refers to: by name if given, on floor if given, closest to lat/lng"""
+        candidates = range(len(self.markers))
+        if name:
+            named = [i for i in candidates if (self.markers[i]["name"] or "").strip().lower() == name.strip().lower()]
+            candidates = named or candidates
+        if floor is not None:
+            on_floor = [i for i in candidates if self.markers[i]["floor"] == str(floor)]
+            candidates = on_floor or candidates
+        return min(candidates, default=None, key=lambda i: distance_meters(
+            lat, lng, self.markers[i]["latitude"], self.markers[i]["longitude"]))
+
+    def route(self, from_lat, from_lng, marker, profile="default"):
+        """Walkways to the best door, then indoors to marker.
+
+        Returns {"path", "floors" (None for outdoor points), "distance", "floor"} or None.
+        """
+        best = None
+        for (door, node, door_m), (dist, previous) in zip(self.doors, self.door_tables.get(profile, ())):
+            if dist[marker] == math.inf:
+                continue
+            outdoor = self.walkway.route(from_lat, from_lng, self.walkway.lats[node], self.walkway.lngs[node],
+                                         profile=profile)
+            if outdoor and (best is None or outdoor["cost"] + door_m + dist[marker] < best[0]):
+                best = (outdoor["cost"] + door_m + dist[marker], outdoor, previous, door_m + dist[marker])
+
+        if best is None:
+            return None
+
+        _, outdoor, previous, indoor_m = best
+        indoor = []
+        node = marker
+        while node is not None:
+            indoor.append(node)
+            node = previous[node]
+        indoor.reverse()
+
+        return {
+            "path": outdoor["path"] + [[self.markers[i]["latitude"], self.markers[i]["longitude"]] for i in indoor],
+            "floors": [None] * len(outdoor["path"]) + [self.markers[i]["floor"] for i in indoor],
+            "distance": outdoor["distance"] + indoor_m,
+            "floor": self.markers[marker]["floor"]
+        }
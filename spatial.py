@@ -0,0 +1,117 @@
+import heapq, math
+from array import array
+
+
+# Same earth radius as the haversine distance, so projected distances agree with it
+METERS_PER_DEGREE = math.radians(6371000)
+
+
+class NodeIndex:
+    """Static 2-d tree over node coordinates for nearest, nearest-k and radius queries.
+
+    Points are projected to local meters around the mean latitude and stored in implicit
+    tree order (the median of every range is its root), so queries walk flat arrays and
+    never allocate tree nodes.
+    """
+
+    def __init__(self, lats, lngs, ids=None):
+        """Index the given node ids (all nodes if None); lats/lngs are indexed by node id"""
+        ids = range(len(lats)) if ids is None else ids
+        lats = [lats[i] for i in ids]
+        lngs = [lngs[i] for i in ids]
+        n = len(lats)
+        lat0 = sum(lats) / n if n else 0.0
+        self.kx = METERS_PER_DEGREE * math.cos(math.radians(lat0))
+        self.ky = METERS_PER_DEGREE
+
+        order = list(range(n))
+        xs = [lng * self.kx for lng in lngs]
+        ys = [lat * self.ky for lat in lats]
+        self._build(order, xs, ys, 0, n, 0)
+
+        self.ids = array("l", (ids[i] for i in order))
+        self.xs = array("d", (xs[i] for i in order))
+        self.ys = array("d", (ys[i] for i in order))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _build(self, order, xs, ys, lo, hi, axis):
+        if hi - lo <= 1:
+            return
+        coords = xs if axis == 0 else ys
+        order[lo:hi] = sorted(order[lo:hi], key=coords.__getitem__)
+        mid = (lo + hi) // 2
+        self._build(order, xs, ys, lo, mid, 1 - axis)
+        self._build(order, xs, ys, mid + 1, hi, 1 - axis)
+
+    def nearest(self, lat, lng):
+        """Return (node id, distance in meters) of the closest node, or (None, inf) if empty"""
+        best_d2, best = self._nearest(lng * self.kx, lat * self.ky, 0, len(self.ids), 0, math.inf, -1)
+        if best < 0:
+            return None, math.inf
+        return self.ids[best], math.sqrt(best_d2)
+
+    def _nearest(self, x, y, lo, hi, axis, best_d2, best):
+        if lo >= hi:
+            return best_d2, best
+        mid = (lo + hi) // 2
+        dx, dy = x - self.xs[mid], y - self.ys[mid]
+        d2 = dx * dx + dy * dy
+        if d2 < best_d2:
+            best_d2, best = d2, mid
+
+        diff = dx if axis == 0 else dy
+        if diff < 0:
+            best_d2, best = self._nearest(x, y, lo, mid, 1 - axis, best_d2, best)
+            if diff * diff < best_d2:
+                best_d2, best = self._nearest(x, y, mid + 1, hi, 1 - axis, best_d2, best)
+        else:
+            best_d2, best = self._nearest(x, y, mid + 1, hi, 1 - axis, best_d2, best)
+            if diff * diff < best_d2:
+                best_d2, best = self._nearest(x, y, lo, mid, 1 - axis, best_d2, best)
+        return best_d2, best
+
+    def nearest_k(self, lat, lng, k):
+        """Return up to k (node id, distance in meters) pairs, closest first"""
+        heap = []  # max-heap of (-d2, position)
+        if k > 0:
+            self._nearest_k(lng * self.kx, lat * self.ky, 0, len(self.ids), 0, k, heap)
+        return [(self.ids[pos], math.sqrt(-neg_d2)) for neg_d2, pos in sorted(heap, reverse=True)]
+
+    def _nearest_k(self, x, y, lo, hi, axis, k, heap):
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        dx, dy = x - self.xs[mid], y - self.ys[mid]
+        d2 = dx * dx + dy * dy
+        if len(heap) < k:
+            heapq.heappush(heap, (-d2, mid))
+        elif d2 < -heap[0][0]:
+            heapq.heapreplace(heap, (-d2, mid))
+
+        diff = dx if axis == 0 else dy
+        near, far = ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+        self._nearest_k(x, y, near[0], near[1], 1 - axis, k, heap)
+        if len(heap) < k or diff * diff < -heap[0][0]:
+            self._nearest_k(x, y, far[0], far[1], 1 - axis, k, heap)
+
+    def within(self, lat, lng, radius):
+        """Return the ids of all nodes within radius meters"""
+        found = []
+        self._within(lng * self.kx, lat * self.ky, 0, len(self.ids), 0, radius * radius, radius, found)
+        return found
+
+    def _within(self, x, y, lo, hi, axis, r2, radius, found):
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        dx, dy = x - self.xs[mid], y - self.ys[mid]
+        if dx * dx + dy * dy < r2:
+            found.append(self.ids[mid])
+
+        diff = dx if axis == 0 else dy
+        if diff < radius:
+            self._within(x, y, lo, mid, 1 - axis, r2, radius, found)
+        if diff > -radius:
+            self._within(x, y, mid + 1, hi, 1 - axis, r2, radius, found)
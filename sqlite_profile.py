@@ -0,0 +1,59 @@
+"""SQLite settings for running CyberPath with concurrent readers and admin writers."""
+import logging
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+
+
+log = logging.getLogger(__name__)
+
+
+# WAL lets readers carry on while a writer commits; NORMAL is still crash-safe in WAL mode
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,         # ms to wait for a lock instead of failing with "database is locked"
+    "mmap_size": 268435456,       # 256 MB of the file read through mmap
+    "cache_size": -16000,         # 16 MB page cache per connection
+    "temp_store": "MEMORY",
+}
+
+# Only for file-backed databases: in-memory SQLite gets a StaticPool, which takes no sizing
+POOL_OPTIONS = {
+    "pool_size": 10,
+    "max_overflow": 20,
+    "pool_timeout": 10,
+}
+CONNECT_ARGS = {"timeout": 5, "check_same_thread": False}
+
+
+def engine_options(uri):
+    """SQLAlchemy engine options for a database URI: pool sizing for SQLite files, nothing for other databases"""
+    url = make_url(uri)
+    if url.get_backend_name() != "sqlite":
+        return {}
+    in_memory = url.database in (None, "", ":memory:") or url.query.get("mode") == "memory"
+    return {"connect_args": dict(CONNECT_ARGS)} if in_memory else {**POOL_OPTIONS, "connect_args": dict(CONNECT_ARGS)}
+
+
+def apply_pragmas(dbapi_connection, pragmas=SQLITE_PRAGMAS):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def enable():
+    """Apply SQLITE_PRAGMAS to every new SQLite connection made by SQLAlchemy"""
+    @event.listens_for(Engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        if type(dbapi_connection).__module__.startswith("sqlite3"):
+            apply_pragmas(dbapi_connection)
+
+
+def run_migrations(connection, migrations):
+    """Apply the migrations newer than the database's PRAGMA user_version, in order"""
+    version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+    for number, statement in enumerate(migrations[version:], start=version + 1):
+        connection.exec_driver_sql(statement)
+        connection.exec_driver_sql(f"PRAGMA user_version={number}")
+        log.info("✅ Applied migration %d", number)
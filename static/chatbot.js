@@ -99,9 +99,10 @@ function setupChatbot() {
         
         chatMessages.appendChild(messageDiv);
         chatMessages.scrollTop = chatMessages.scrollHeight;
+        return messageDiv;
     }
 
-    function addDirectionsButton(coordinates, locationName, isIndoor = false, building = null) {
+    function addDirectionsButton(coordinates, locationName, isIndoor = false, building = null, floor = null) {
         const buttonDiv = document.createElement('div');
 
         const isDark = document.body.classList.contains('dark-mode');
@@ -132,6 +133,7 @@ function setupChatbot() {
                 data-name="${escapeHtml(locationName)}"
                 data-building="${isIndoor ? escapeHtml(building) : ''}"
                 data-indoor="${isIndoor}"
+                data-floor="${isIndoor && floor ? escapeHtml(floor) : ''}"
                 style="padding: 8px 16px; background: #2196f3; color: white; border: none; border-radius: 4px; cursor: pointer;">
             🗺️ Get Walking Directions
         </button>
@@ -148,7 +150,7 @@ function setupChatbot() {
         // Use a routing flag to prevent double-triggering
         let routingInProgress = false;
 
-        newButton.addEventListener('click', function () {
+        newButton.addEventListener('click', async function () {
             if (routingInProgress) return; // ignore if already routing
             routingInProgress = true;
 
@@ -158,6 +160,7 @@ function setupChatbot() {
                 const locationName = this.dataset.name; // ensure you have a name attribute
                 const building = this.dataset.building;
                 const isIndoor = this.dataset.indoor === 'true';
+                const marker = isIndoor ? { floor: this.dataset.floor || null, name: locationName } : null;
 
                 if (!window.userLocation) {
                     addMessageToChat(" Please click 'Find My Location' first.", false);
@@ -169,12 +172,12 @@ function setupChatbot() {
                     return;
                 }
 
-                const routeLayer = window.router.createRoute(lat, lng, building, isIndoor);
+                const routeLayer = await window.router.createRoute(lat, lng, building, isIndoor, null, marker);
                 window.showRouteInfoPopup(routeLayer, locationName);
                 if (routeLayer) {
                     let successMsg = `✅ Creating route to ${locationName}! Check the map for the blue path.`;
                 if (isIndoor && building) {
-                    successMsg = `✅ Creating route to ${building}! The path will lead you to the building entrance.`;
+                    successMsg = `✅ Creating route to ${locationName} in ${building}! Check the map for the blue path.`;
                 }
                 addMessageToChat(successMsg, false);
                 chatbotPopup.classList.add('hidden');
@@ -194,6 +197,91 @@ function setupChatbot() {
         return div.innerHTML;
     }
     
+    // Read a Server-Sent Events response body, calling onEvent(name, data) for each event
+    async function readEvents(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let end;
+            while ((end = buffer.indexOf("\n\n")) !== -1) {
+                const block = buffer.slice(0, end);
+                buffer = buffer.slice(end + 2);
+
+                let event = "message";
+                let data = "";
+                block.split("\n").forEach(line => {
+                    if (line.startsWith("event: ")) event = line.slice(7);
+                    else if (line.startsWith("data: ")) data += line.slice(6);
+                });
+                onEvent(event, data ? JSON.parse(data) : {});
+            }
+        }
+    }
+
+    function showLocationHelp(data) {
+        // Check if we have coordinates to show directions button
+        if (data.coordinates && data.location_name) {
+            console.log("✅ Has coordinates, showing directions button");
+            console.log("   Location:", data.location_name);
+            console.log("   Coordinates:", data.coordinates);
+            console.log("   Is indoor:", data.is_indoor);
+            console.log("   Building:", data.building);
+            
+            // Wait a moment, then show directions
+            setTimeout(() => {
+                const isIndoor = data.is_indoor === true;
+                const building = data.building || null;
+                
+                let botMessage = `💡 I can show you walking directions to **${data.location_name}**! `;
+                if (data.distance != null) {
+                    botMessage += `It's the nearest one, about ${Math.round(data.distance)} m on foot. `;
+                }
+                
+                if (isIndoor && building) {
+                    botMessage += `The route will lead you to the **${building}** entrance. `;
+                } else if (building) {
+                    botMessage += `The route will lead you to **${building}**. `;
+                }
+                
+                botMessage += `Click the button below when you're ready to go.`;
+                
+                addMessageToChat(botMessage, false);
+                
+                // Show the directions button
+                setTimeout(() => {
+                    addDirectionsButton(
+                        data.coordinates, 
+                        data.location_name, 
+                        isIndoor, 
+                        building,
+                        data.floor
+                    );
+                }, 300);
+            }, 800);
+        } else {
+            console.log("❌ No coordinates available");
+            // Even without coordinates, suggest asking for a location
+            setTimeout(() => {
+                addMessageToChat("💡 You can ask me for directions to places like: 'Library', 'DTC', 'FCI Building', or 'Haji Tapah'.", false);
+            }, 1000);
+        }
+    }
+    
+    // With the user's location the server can answer "nearest food/restroom/lift" by walking distance
+    function chatRequest(message) {
+        const body = { message };
+        if (window.userLocation) {
+            body.from = `${window.userLocation.latitude},${window.userLocation.longitude}`;
+        }
+        return body;
+    }
+
     async function sendMessage() {  
         const userMessage = chatInput.value.trim();
         if (!userMessage) return;
@@ -206,76 +294,54 @@ function setupChatbot() {
 
         // Show thinking indicator
         const thinkingDiv = showThinking();
+        let answerDiv = null;
+        let answer = "";
+        let locationData = {};
 
         try {
-            const response = await fetch('/chatbot/ask', {
+            const response = await fetch('/chatbot/ask/stream', {
                 method: 'POST',
                 headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({ message: userMessage })
+                body: JSON.stringify(chatRequest(userMessage))
             });
-            
-            const data = await response.json();
-            console.log("📦 Full bot response:", data);
-            
-            thinkingDiv.remove();
 
-            if (data.success) {
-                // Always show bot response
-                addMessageToChat(data.response, false);
-                
-                // ALWAYS show suggestions
-                showSuggestions([
-                    "🗺️ Get directions",
-                    "⏱️ How long will it take?",
-                    "📍 Show me the route"
-                ]);
-                
-                // Check if we have coordinates to show directions button
-                if (data.coordinates && data.location_name) {
-                    console.log("✅ Has coordinates, showing directions button");
-                    console.log("   Location:", data.location_name);
-                    console.log("   Coordinates:", data.coordinates);
-                    console.log("   Is indoor:", data.is_indoor);
-                    console.log("   Building:", data.building);
-                    
-                    // Wait a moment, then show directions
-                    setTimeout(() => {
-                        const isIndoor = data.is_indoor === true;
-                        const building = data.building || null;
-                        
-                        let botMessage = `💡 I can show you walking directions to **${data.location_name}**! `;
-                        
-                        if (isIndoor && building) {
-                            botMessage += `The route will lead you to the **${building}** entrance. `;
-                        } else if (building) {
-                            botMessage += `The route will lead you to **${building}**. `;
-                        }
-                        
-                        botMessage += `Click the button below when you're ready to go.`;
-                        
-                        addMessageToChat(botMessage, false);
-                        
-                        // Show the directions button
-                        setTimeout(() => {
-                            addDirectionsButton(
-                                data.coordinates, 
-                                data.location_name, 
-                                isIndoor, 
-                                building
-                            );
-                        }, 300);
-                    }, 800);
-                } else {
-                    console.log("❌ No coordinates available");
-                    // Even without coordinates, suggest asking for a location
-                    setTimeout(() => {
-                        addMessageToChat("💡 You can ask me for directions to places like: 'Library', 'DTC', 'FCI Building', or 'Haji Tapah'.", false);
-                    }, 1000);
+            // The answer arrives token by token; the location comes first so routing can start early
+            await readEvents(response, (event, data) => {
+                if (event === "location") {
+                    locationData = data;
+                    if (data.coordinates && window.router?.prefetchRoute) {
+                        window.router.prefetchRoute(data.coordinates.latitude, data.coordinates.longitude,
+                                                    data.building || null, data.is_indoor === true,
+                                                    data.is_indoor === true ? { floor: data.floor, name: data.location_name } : null);
+                    }
+                } else if (event === "token") {
+                    if (!answerDiv) {
+                        thinkingDiv.remove();
+                        answerDiv = addMessageToChat("", false);
+                    }
+                    answer += data.text;
+                    answerDiv.innerHTML = `<strong>Assistant:</strong> ${escapeHtml(answer)}`;
+                    chatMessages.scrollTop = chatMessages.scrollHeight;
+                } else if (event === "done") {
+                    console.log("📦 Full bot response:", { ...locationData, ...data });
                 }
-            } else {
+            });
+
+            if (!answerDiv) {
+                thinkingDiv.remove();
                 addMessageToChat("Sorry, something went wrong. Please try again.", false);
+                return;
             }
 
+            // ALWAYS show suggestions
+            showSuggestions([
+                "🗺️ Get directions",
+                "⏱️ How long will it take?",
+                "📍 Show me the route"
+            ]);
+
+            showLocationHelp(locationData);
+
         } catch (error) {
             console.error("Error communicating with chatbot:", error);
             thinkingDiv.remove();
@@ -20,7 +20,8 @@ function makeGPS() {
                     if (window.currentDestination && window.autoReroute === true) {
                         router.createRoute(window.currentDestination.lat, window.currentDestination.lng, 
                                         window.currentDestination.building || null,
-                                        window.currentDestination.isIndoor || false);
+                                        window.currentDestination.isIndoor || false, null,
+                                        window.currentDestination.marker || null);
                     }
                 },
                 function (gpsError) {
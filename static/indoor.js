@@ -7,6 +7,22 @@ let activeFloor = null;
 
 let isIndoor = false;
 
+// Per-floor marker requests for this page load, keyed by "building/floor"
+const floorMarkerCache = new Map();
+
+// Floor-plan tiles from `flask --app app build-floor-tiles`; without them the full images are drawn
+const floorTileManifest = fetch("/api/floor-tiles")
+    .then(res => res.ok ? res.json() : null)
+    .catch(() => null);
+
+// Tile names are content hashes listed in the manifest, so they are cached for good
+const FloorPlanLayer = L.TileLayer.extend({
+    getTileUrl(coords) {
+        const hash = this.options.tiles[`${coords.z}/${coords.x}/${coords.y}`];
+        return hash ? `/floor-tiles/${hash}` : L.Util.emptyImageUrl;
+    }
+});
+
 
 /* =========================
     INDOOR DATA (DEMO ONLY)
@@ -110,30 +126,48 @@ async function loadFloor(floorNumber) {
     const floor = activeBuilding.floors[floorNumber];
     if (!floor || !floor.image) return;
 
-    if (indoorImageOverlay) {
-        map.removeLayer(indoorImageOverlay);
+    const buildingId = activeBuildingId;
+    const manifest = await floorTileManifest;
+    if (activeBuildingId !== buildingId || activeFloor !== floorNumber) return;
+
+    const planId = manifest?.floors?.[buildingId]?.[floorNumber];
+
+    // Floors that share a plan (FCI 2 and 3) keep the layer that is already on the map
+    if (!planId || indoorImageOverlay?.options.planId !== planId) {
+        if (indoorImageOverlay) {
+            map.removeLayer(indoorImageOverlay);
+        }
+
+        if (planId) {
+            const plan = manifest.plans[planId];
+            indoorImageOverlay = new FloorPlanLayer("", {
+                planId,
+                tiles: plan.tiles,
+                bounds: plan.bounds,
+                minNativeZoom: plan.minZoom,
+                maxNativeZoom: plan.maxNativeZoom,
+                maxZoom: 22,
+                pane: "overlayPane",
+                zIndex: 300
+            }).addTo(map);
+        } else {
+            indoorImageOverlay = L.imageOverlay(
+                floor.image,
+                boundsFromCenter(activeBuilding.center, 123),
+                { opacity: 1, interactive: false, zIndex: 300 }
+            ).addTo(map);
+        }
     }
 
-    const bounds = boundsFromCenter(activeBuilding.center, 123);
-
-    indoorImageOverlay = L.imageOverlay(
-        floor.image,
-        bounds,
-        { opacity: 1, interactive: false, zIndex: 300 }
-    ).addTo(map);
-
     indoorMarkers.clearLayers();
 
-    // Load real indoor markers from DB
-    const response = await fetch("/api/indoor-markers");
-    const indoorData = await response.json();
+    // Load this floor's indoor markers from DB
+    const floorMarkers = await fetchFloorMarkers(buildingId, floorNumber);
 
-    const filtered = indoorData.filter(m =>
-        m.building === activeBuildingId &&
-        m.floor == activeFloor
-    );
+    // Ignore the result if the user switched floor or building while it was loading
+    if (activeBuildingId !== buildingId || activeFloor !== floorNumber) return;
 
-    filtered.forEach(m => {
+    floorMarkers.forEach(m => {
         L.marker([m.latitude, m.longitude], {
             icon: getCategoryIcon(m.category)
         })
@@ -141,7 +175,32 @@ async function loadFloor(floorNumber) {
         .addTo(indoorMarkers);
     });
 
+    prefetchAdjacentFloors(buildingId, floorNumber);
+}
 
+function fetchFloorMarkers(buildingId, floorNumber) {
+    const key = `${buildingId}/${floorNumber}`;
+
+    if (!floorMarkerCache.has(key)) {
+        const params = new URLSearchParams({ building: buildingId, floor: floorNumber });
+        const request = fetch(`/api/indoor-markers?${params}`)
+            .then(res => res.json())
+            .catch(err => {
+                floorMarkerCache.delete(key);
+                console.error("Failed to load indoor markers:", err);
+                return [];
+            });
+        floorMarkerCache.set(key, request);
+    }
+    return floorMarkerCache.get(key);
+}
+
+// Warm the floors above and below so switching floors is instant
+function prefetchAdjacentFloors(buildingId, floorNumber) {
+    const floors = buildings[buildingId]?.floors || {};
+    [floorNumber - 1, floorNumber + 1].forEach(f => {
+        if (floors[f]) fetchFloorMarkers(buildingId, f);
+    });
 }
 
 function boundsFromCenter(center, sizeMeters) {
@@ -2,6 +2,7 @@
 window.graph = {};
 window.nodes = {};   
 window.edges = [];   
+window.nodeIndex = null;
 window.nodeIdCounter = 1;
 
 // Haversine distance in meters
@@ -72,37 +73,131 @@ function buildGraphFromGeoJSON() {
     window.graph[edge.from].push({ to: edge.to, weight: edge.weight });
   });
 
+  // Spatial index for snapping GPS fixes and destinations to the graph
+  window.nodeIndex = buildNodeIndex(window.nodes);
+
   console.log("Merged Nodes count:", Object.keys(window.nodes).length);
   console.log("Merged Edges count:", window.edges.length);
   console.log("Graph ready for routing:", window.graph);
 }
 
-// Merge nodes closer than threshold
+// Load the graph the server already built, in the compact format of
+// WalkwayGraph.to_bytes() in routing.py: nodes are already merged and the
+// adjacency is CSR, so there is no GeoJSON parsing or merge pass here.
+// Returns the walkway lines as [[lat, lng], ...] arrays for drawing.
+async function loadWalkwayGraph() {
+  const response = await fetch("/api/walkway-graph");
+  if (!response.ok) throw new Error(`walkway graph: HTTP ${response.status}`);
+  const buffer = await response.arrayBuffer();
+
+  const header = new DataView(buffer, 0, 48);
+  const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+  if (magic !== "CPWG" || header.getUint16(4, true) !== 1) throw new Error("walkway graph: unknown format");
+
+  const nodeCount = header.getUint32(8, true);
+  const edgeCount = header.getUint32(12, true);
+  const lineCount = header.getUint32(16, true);
+  const lineNodeCount = header.getUint32(20, true);
+  const originLat = header.getFloat64(24, true);
+  const originLng = header.getFloat64(32, true);
+  const scale = header.getFloat64(40, true);
+
+  let offset = 48;
+  function take(ArrayType, length) {
+    const view = new ArrayType(buffer, offset, length);
+    offset += length * ArrayType.BYTES_PER_ELEMENT;
+    return view;
+  }
+  const latSteps = take(Int32Array, nodeCount);
+  const lngSteps = take(Int32Array, nodeCount);
+  const offsets = take(Uint32Array, nodeCount + 1);
+  const targets = take(Uint32Array, edgeCount);
+  const weights = take(Float32Array, edgeCount);
+  const lineOffsets = take(Uint32Array, lineCount + 1);
+  const lineNodes = take(Uint32Array, lineNodeCount);
+
+  window.nodes = {};
+  window.edges = [];
+  window.graph = {};
+
+  const lats = new Float64Array(nodeCount);
+  const lngs = new Float64Array(nodeCount);
+  for (let i = 0; i < nodeCount; i++) {
+    lats[i] = originLat + latSteps[i] * scale;
+    lngs[i] = originLng + lngSteps[i] * scale;
+    window.nodes["n" + i] = { lat: lats[i], lng: lngs[i] };
+  }
+
+  for (let i = 0; i < nodeCount; i++) {
+    const neighbours = [];
+    for (let e = offsets[i]; e < offsets[i + 1]; e++) {
+      const edge = { from: "n" + i, to: "n" + targets[e], weight: weights[e] };
+      window.edges.push(edge);
+      neighbours.push({ to: edge.to, weight: edge.weight });
+    }
+    if (neighbours.length) window.graph["n" + i] = neighbours;
+  }
+
+  window.walkway = { lats, lngs, offsets, targets, weights };
+  window.nodeIndex = buildNodeIndex(window.nodes);
+
+  const lines = [];
+  for (let l = 0; l < lineCount; l++) {
+    const line = [];
+    for (let k = lineOffsets[l]; k < lineOffsets[l + 1]; k++) line.push([lats[lineNodes[k]], lngs[lineNodes[k]]]);
+    lines.push(line);
+  }
+
+  console.log("Walkway graph loaded:", nodeCount, "nodes,", edgeCount, "edges");
+  return lines;
+}
+
+// Merge nodes closer than threshold.
+// Nodes are bucketed into threshold-sized grid cells and only compared with the
+// 3x3 block of cells around them, so this stays near-linear as the map grows.
+// Same rule as weld_vertices() in routing.py: each node joins the first kept node in range.
 function mergeCloseNodes(nodes, edges, threshold) {
   const nodeIds = Object.keys(nodes);
   const merged = {};
   const mapping = {};
+  const cells = new Map();
+
+  let maxLat = 0;
+  nodeIds.forEach(id => { maxLat = Math.max(maxLat, Math.abs(nodes[id].lat)); });
 
-  for (let i = 0; i < nodeIds.length; i++) {
-    const idA = nodeIds[i];
-    if (mapping[idA]) continue;
+  const metersPerDegree = 6371000 * Math.PI / 180;
+  const cellLat = threshold / metersPerDegree;
+  const cellLng = threshold / (metersPerDegree * Math.max(Math.cos(maxLat * Math.PI / 180), 1e-6));
 
-    for (let j = i + 1; j < nodeIds.length; j++) {
-      const idB = nodeIds[j];
-      if (mapping[idB]) continue;
+  nodeIds.forEach((idB, j) => {
+    const node = nodes[idB];
+    const cx = Math.floor(node.lng / cellLng);
+    const cy = Math.floor(node.lat / cellLat);
 
-      const d = distanceMeters(
-        nodes[idA].lat, nodes[idA].lng,
-        nodes[idB].lat, nodes[idB].lng
-      );
+    let rep = -1;
+    for (let dx = -1; dx <= 1; dx++) {
+      for (let dy = -1; dy <= 1; dy++) {
+        const cell = cells.get(`${cx + dx},${cy + dy}`);
+        if (!cell) continue;
 
-      if (d < threshold) {
-        mapping[idB] = idA;
+        for (const i of cell) {
+          if (rep !== -1 && i > rep) continue;
+          const idA = nodeIds[i];
+          const d = distanceMeters(nodes[idA].lat, nodes[idA].lng, node.lat, node.lng);
+          if (d < threshold) rep = i;
+        }
       }
     }
 
-    if (!merged[idA]) merged[idA] = nodes[idA];
-  }
+    if (rep === -1) {
+      const key = `${cx},${cy}`;
+      if (!cells.has(key)) cells.set(key, []);
+      cells.get(key).push(j);
+      merged[idB] = node;
+    } else {
+      mapping[idB] = nodeIds[rep];
+    }
+  });
 
   // Update edges
   const newEdges = edges.map(edge => {
@@ -115,3 +210,117 @@ function mergeCloseNodes(nodes, edges, threshold) {
   return { nodes: merged, edges: newEdges };
 }
 
+
+// Static 2-d tree over graph nodes (same layout as NodeIndex in spatial.py).
+// Coordinates are projected to local meters and kept in typed arrays in tree
+// order, so nearest() walks flat arrays without allocating.
+function buildNodeIndex(nodes) {
+  const metersPerDegree = 6371000 * Math.PI / 180;
+  const ids = Object.keys(nodes);
+  const n = ids.length;
+
+  let lat0 = 0;
+  ids.forEach(id => { lat0 += nodes[id].lat; });
+  lat0 = n ? lat0 / n : 0;
+
+  const kx = metersPerDegree * Math.cos(lat0 * Math.PI / 180);
+  const ky = metersPerDegree;
+
+  const order = ids.map((_, i) => i);
+  const px = ids.map(id => nodes[id].lng * kx);
+  const py = ids.map(id => nodes[id].lat * ky);
+
+  function build(lo, hi, axis) {
+    if (hi - lo <= 1) return;
+    const coords = axis === 0 ? px : py;
+    const slice = order.slice(lo, hi).sort((a, b) => coords[a] - coords[b]);
+    for (let i = 0; i < slice.length; i++) order[lo + i] = slice[i];
+    const mid = (lo + hi) >> 1;
+    build(lo, mid, 1 - axis);
+    build(mid + 1, hi, 1 - axis);
+  }
+  build(0, n, 0);
+
+  const treeIds = order.map(i => ids[i]);
+  const xs = Float64Array.from(order, i => px[i]);
+  const ys = Float64Array.from(order, i => py[i]);
+
+  let qx = 0, qy = 0, bestD2 = Infinity, best = -1;
+
+  function searchNearest(lo, hi, axis) {
+    if (lo >= hi) return;
+    const mid = (lo + hi) >> 1;
+    const dx = qx - xs[mid];
+    const dy = qy - ys[mid];
+    const d2 = dx * dx + dy * dy;
+    if (d2 < bestD2) { bestD2 = d2; best = mid; }
+
+    const diff = axis === 0 ? dx : dy;
+    if (diff < 0) {
+      searchNearest(lo, mid, 1 - axis);
+      if (diff * diff < bestD2) searchNearest(mid + 1, hi, 1 - axis);
+    } else {
+      searchNearest(mid + 1, hi, 1 - axis);
+      if (diff * diff < bestD2) searchNearest(lo, mid, 1 - axis);
+    }
+  }
+
+  // Closest node id, or null if the graph is empty
+  function nearest(lat, lng) {
+    qx = lng * kx; qy = lat * ky; bestD2 = Infinity; best = -1;
+    searchNearest(0, n, 0);
+    return best === -1 ? null : treeIds[best];
+  }
+
+  // Up to k [id, meters] pairs, closest first
+  function nearestK(lat, lng, k) {
+    const x = lng * kx, y = lat * ky;
+    const found = [];
+
+    function search(lo, hi, axis) {
+      if (lo >= hi) return;
+      const mid = (lo + hi) >> 1;
+      const dx = x - xs[mid];
+      const dy = y - ys[mid];
+      const d2 = dx * dx + dy * dy;
+
+      if (found.length < k || d2 < found[found.length - 1][1]) {
+        let i = found.length;
+        while (i > 0 && found[i - 1][1] > d2) i--;
+        found.splice(i, 0, [mid, d2]);
+        if (found.length > k) found.pop();
+      }
+
+      const diff = axis === 0 ? dx : dy;
+      const [nearLo, nearHi, farLo, farHi] = diff < 0 ? [lo, mid, mid + 1, hi] : [mid + 1, hi, lo, mid];
+      search(nearLo, nearHi, 1 - axis);
+      if (found.length < k || diff * diff < found[found.length - 1][1]) search(farLo, farHi, 1 - axis);
+    }
+
+    if (k > 0) search(0, n, 0);
+    return found.map(([pos, d2]) => [treeIds[pos], Math.sqrt(d2)]);
+  }
+
+  // Ids of all nodes within radius meters
+  function withinRadius(lat, lng, radius) {
+    const x = lng * kx, y = lat * ky, r2 = radius * radius;
+    const found = [];
+
+    function search(lo, hi, axis) {
+      if (lo >= hi) return;
+      const mid = (lo + hi) >> 1;
+      const dx = x - xs[mid];
+      const dy = y - ys[mid];
+      if (dx * dx + dy * dy < r2) found.push(treeIds[mid]);
+
+      const diff = axis === 0 ? dx : dy;
+      if (diff < radius) search(lo, mid, 1 - axis);
+      if (diff > -radius) search(mid + 1, hi, 1 - axis);
+    }
+
+    search(0, n, 0);
+    return found;
+  }
+
+  return { nearest, nearestK, withinRadius };
+}
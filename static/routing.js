@@ -2,44 +2,49 @@
 function startRouting() {
   let currentRouteLayer = null;
 
+  // Nodes within 80m of each building, worked out once per graph build
+  let entranceNodes = {};
+  let entranceIndex = null;
+
+  function getEntranceNodes(buildingName) {
+    if (entranceIndex !== window.nodeIndex) {
+        entranceNodes = {};
+        entranceIndex = window.nodeIndex;
+    }
+
+    if (!entranceNodes[buildingName]) {
+        const buildingCenter = getBuildingCenter(buildingName);
+        entranceNodes[buildingName] = buildingCenter && window.nodeIndex
+            ? window.nodeIndex.withinRadius(buildingCenter.lat, buildingCenter.lng, 80)
+            : [];
+    }
+    return entranceNodes[buildingName];
+  }
+
   // Find nearest node to a lat/lng
   function snapToNearestNode(lat, lng, targetBuilding = null) {
-    console.log(`🔍 Snapping coordinates (${lat}, ${lng}) to nearest node`);
-    console.log(`   Target building: ${targetBuilding}`);
-    
-    let candidateNodes = Object.entries(nodes);
-    
-    // If we have a target building, filter nodes to those near that building
+    // If we have a target building, only consider nodes near that building
     if (targetBuilding) {
-        const buildingCenter = getBuildingCenter(targetBuilding);
-        if (buildingCenter) {
-            candidateNodes = candidateNodes.filter(([id, node]) => {
-                const distToBuilding = distanceMeters(node.lat, node.lng, buildingCenter.lat, buildingCenter.lng);
-                return distToBuilding < 80; // Only consider nodes within 80m of building
-            });
-            
-            console.log(`   Filtered to ${candidateNodes.length} nodes near ${targetBuilding}`);
-            
-            // If no nodes found near building, fall back to all nodes
-            if (candidateNodes.length === 0) {
-                console.log(`   No nodes near ${targetBuilding}, using all nodes`);
-                candidateNodes = Object.entries(nodes);
+        const entrances = getEntranceNodes(targetBuilding);
+        
+        let nearestId = null;
+        let minDist = Infinity;
+        
+        entrances.forEach(id => {
+            const d = distanceMeters(lat, lng, nodes[id].lat, nodes[id].lng);
+            if (d < minDist) {
+                minDist = d;
+                nearestId = id;
             }
-        }
+        });
+        
+        if (nearestId) return nearestId;
+        
+        // If no nodes found near building, fall back to all nodes
+        console.log(`   No nodes near ${targetBuilding}, using all nodes`);
     }
     
-    let nearestId = null;
-    let minDist = Infinity;
-    
-    candidateNodes.forEach(([id, node]) => {
-        const d = distanceMeters(lat, lng, node.lat, node.lng);
-        if (d < minDist) {
-            minDist = d;
-            nearestId = id;
-        }
-    });
-    
-    console.log(`✅ Selected node: ${nearestId} at distance ${minDist.toFixed(2)}m`);
+    const nearestId = window.nodeIndex ? window.nodeIndex.nearest(lat, lng) : null;
     
     if (!nearestId) {
         console.warn("⚠️ Could not find any nearby nodes!");
@@ -118,14 +123,12 @@ function getBuildingCenter(buildingName) {
     return null; // no path found
   }
 
-  // Draw route on map
-  function drawRoute(nodePath) {
+  // Draw route on map; floors (from the server, null for outdoor points) marks each floor change inside
+  function drawRoute(routeCoords, floors = null) {
     if (currentRouteLayer) {
       map.removeLayer(currentRouteLayer);
     }
 
-    const routeCoords = nodePath.map(id => [nodes[id].lat, nodes[id].lng]);
-
     // Glow effect: shadow polyline + main polyline
     const shadow = L.polyline(routeCoords, {
       color: "#00FFFF",
@@ -141,13 +144,111 @@ function getBuildingCenter(buildingName) {
       smoothFactor: 2
     }).addTo(map);
 
-    currentRouteLayer = L.layerGroup([shadow, main]);
+    const floorMarkers = [];
+    (floors || []).forEach((floor, i) => {
+      if (floor == null || floor === floors[i - 1]) return;
+      floorMarkers.push(L.circleMarker(routeCoords[i], {
+        radius: 5,
+        color: "#00FFFF",
+        fillColor: "#003344",
+        fillOpacity: 1,
+        weight: 2
+      }).bindTooltip(`Floor ${floor}`, { permanent: true, direction: "right" }));
+    });
+
+    currentRouteLayer = L.layerGroup([shadow, ...floorMarkers, main]);
     map.addLayer(currentRouteLayer);
+  }
+
+  // Ask the server for a route; returns { path: [[lat, lng], ...], floors } or null.
+  // Indoor destinations are routed through the building's doors and floors to the room itself;
+  // the marker's floor and name pick the right room when several share the same coordinates.
+  async function fetchServerRoute(from, to, targetBuilding, isIndoor, marker) {
+    const params = new URLSearchParams({
+      from: `${from.lat},${from.lng}`,
+      to: `${to.lat},${to.lng}`
+    });
+    if (targetBuilding) params.set("building", targetBuilding);
+    if (isIndoor && targetBuilding) {
+      params.set("indoor", "1");
+      if (marker && marker.floor) params.set("floor", marker.floor);
+      if (marker && marker.name) params.set("name", marker.name);
+    }
+    if (routeProfile() !== "default") params.set("profile", routeProfile());
+
+    const response = await fetch(`/api/route?${params}`);
+    const data = await response.json();
+    return data.success ? { path: data.path, floors: data.floors || null } : null;
+  }
 
+  // Route preference from the sidebar (step-free, fewer road crossings), remembered between visits.
+  // Only the server knows the profiles; the local fallback always takes the shortest route.
+  const profileSelect = document.getElementById("routeProfile");
+  if (profileSelect) {
+    profileSelect.value = localStorage.getItem("routeProfile") || "default";
+    profileSelect.addEventListener("change", () => localStorage.setItem("routeProfile", profileSelect.value));
+  }
+
+  function routeProfile() {
+    return (profileSelect && profileSelect.value) || "default";
+  }
+
+  // Fallback when the server cannot be reached: route on the graph built in path.js
+  function localRoute(from, to, targetBuilding) {
+    const startNode = snapToNearestNode(from.lat, from.lng);
+    const endNode = snapToNearestNode(to.lat, to.lng, targetBuilding);
     
+    console.log("Snapped start/end nodes:", startNode, endNode);
+
+    if (!startNode || !endNode) return null;
+
+    const nodePath = aStar(startNode, endNode);
+    if (!nodePath) return null;
+
+    return { path: nodePath.map(id => [nodes[id].lat, nodes[id].lng]), floors: null };
+  }
+
+  // The local graph has no indoor floors, so indoor locations are routed to the building center
+  function routeDestination(toLat, toLng, targetBuilding, isIndoor) {
+    if (isIndoor && targetBuilding) {
+        // Get building center coordinates
+        const buildingCenter = getBuildingCenter(targetBuilding);
+        if (buildingCenter) return buildingCenter;
+    }
+    return { lat: toLat, lng: toLng };
+  }
+
+  // Last route requested ahead of time (e.g. while the chatbot is still answering)
+  let prefetched = null;
+
+  function routeKey(start, destination, targetBuilding, isIndoor, marker) {
+    const { floor, name } = marker || {};
+    return `${start.lat},${start.lng}|${destination.lat},${destination.lng}|${targetBuilding || ""}|${isIndoor}|${floor || ""}|${name || ""}|${routeProfile()}`;
+  }
+
+  function requestRoute(start, destination, targetBuilding, isIndoor, marker) {
+    const key = routeKey(start, destination, targetBuilding, isIndoor, marker);
+    if (prefetched && prefetched.key === key) return prefetched.request;
+
+    return fetchServerRoute(start, destination, targetBuilding, isIndoor, marker).catch(err => {
+        console.warn("Server routing unavailable, routing locally:", err);
+        const localDestination = routeDestination(destination.lat, destination.lng, targetBuilding, isIndoor);
+        return localRoute(start, localDestination, targetBuilding);
+    });
+  }
+
+  // Start fetching a route from the current location without drawing it
+  // marker is the selected indoor marker's { floor, name }, if known
+  function prefetchRoute(toLat, toLng, targetBuilding = null, isIndoor = false, marker = null) {
+    if (!window.userLocation) return;
+
+    const start = { lat: window.userLocation.latitude, lng: window.userLocation.longitude };
+    const destination = { lat: toLat, lng: toLng };
+    const request = requestRoute(start, destination, targetBuilding, isIndoor, marker);
+    prefetched = { key: routeKey(start, destination, targetBuilding, isIndoor, marker), request };
   }
 
-  function createRoute(toLat, toLng, targetBuilding = null, isIndoor = false, indoorCategory = null) {
+  async function createRoute(toLat, toLng, targetBuilding = null, isIndoor = false, indoorCategory = null, marker = null) {
     console.log("=== CREATE ROUTE ===");
     console.log("Destination:", toLat, toLng);
     console.log("Target building:", targetBuilding);
@@ -159,37 +260,15 @@ function getBuildingCenter(buildingName) {
         return;
     }
 
-    // If it's an indoor location, route to building center first
-    let finalDestination = { lat: toLat, lng: toLng };
-    let displayName = targetBuilding || "Destination";
-    
-    if (isIndoor && targetBuilding) {
-        // Get building center coordinates
-        const buildingCenter = getBuildingCenter(targetBuilding);
-        if (buildingCenter) {
-            console.log(`🏢 Indoor location detected, routing to ${targetBuilding} center first`);
-            finalDestination = buildingCenter;
-            displayName = `${targetBuilding} (Building Entrance)`;
-        }
-    }
+    const start = { lat: window.userLocation.latitude, lng: window.userLocation.longitude };
+    const route = await requestRoute(start, { lat: toLat, lng: toLng }, targetBuilding, isIndoor, marker);
 
-    const startNode = snapToNearestNode(window.userLocation.latitude, window.userLocation.longitude);
-    const endNode = snapToNearestNode(finalDestination.lat, finalDestination.lng, targetBuilding);
-    
-    console.log("Snapped start/end nodes:", startNode, endNode);
-
-    if (!startNode || !endNode) {
-        alert("No route found: could not snap to nodes.");
-        return;
-    }
-
-    const nodePath = aStar(startNode, endNode);
-    if (!nodePath) {
+    if (!route) {
         alert("No path found between selected points.");
         return;
     }
 
-    drawRoute(nodePath);
+    drawRoute(route.path, route.floors);
     
     // Store original destination for info display
     window.currentDestination = {
@@ -197,7 +276,8 @@ function getBuildingCenter(buildingName) {
         lng: toLng,
         name: targetBuilding || "Destination",
         isIndoor: isIndoor,
-        building: targetBuilding
+        building: targetBuilding,
+        marker: marker
     };
     
     return currentRouteLayer;
@@ -282,6 +362,7 @@ window.showRouteInfoPopup = function(routeLayer, locationName) {
 
   return {
     createRoute,
+    prefetchRoute,
     userRemoveRoute
   };
 }
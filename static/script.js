@@ -11,33 +11,32 @@ var map = L.map('map', {
 
 let campusGeoJSON = null;
 
-fetch("static/newcampus.geojson")
-  
-.then(response => response.json())
-  
-  .then(data => {
-    
-    campusGeoJSON = data;
-    console.log("Loaded GeoJSON!");
-    console.log("First coordinate:", campusGeoJSON.features[0].geometry.coordinates[0]);
-
-    const walkwayLayer = L.geoJSON(campusGeoJSON, {
-      style: {
-        color: "#000000",
-        weight: 2,
-        opacity: 0.1,
-        dashArray: "5, 5",
-        smoothFactor: 1.5
-      }
-    }).addTo(map);
+const walkwayStyle = {
+  color: "#000000",
+  weight: 2,
+  opacity: 0.1,
+  dashArray: "5, 5",
+  smoothFactor: 1.5
+};
 
+// Walkways come from the server's compact graph; the raw GeoJSON is only a fallback
+loadWalkwayGraph()
+  .then(lines => {
+    const walkwayLayer = L.polyline(lines, walkwayStyle).addTo(map);
     map.fitBounds(walkwayLayer.getBounds());
-    
-    if (typeof buildGraphFromGeoJSON === "function") {
-      buildGraphFromGeoJSON();
-    }
   })
-  .catch(error => console.error("Error loading GeoJSON:", error));
+  .catch(error => {
+    console.error("Compact walkway graph failed, loading GeoJSON:", error);
+    return fetch("static/newcampus.geojson")
+      .then(response => response.json())
+      .then(data => {
+        campusGeoJSON = data;
+        const walkwayLayer = L.geoJSON(campusGeoJSON, { style: walkwayStyle }).addTo(map);
+        map.fitBounds(walkwayLayer.getBounds());
+        buildGraphFromGeoJSON();
+      });
+  })
+  .catch(error => console.error("Error loading walkways:", error));
 
 // Add tile layer
 L.tileLayer(
@@ -457,7 +456,7 @@ searchInput.addEventListener("input", () => {
 // Use a flag to prevent double clicks
 let routingInProgress = false;
 
-function handlePathButtonClick(e) {
+async function handlePathButtonClick(e) {
     const btn = e.target.closest(".path-btn") || e.target;
     if (!btn) return;
 
@@ -498,11 +497,12 @@ function handlePathButtonClick(e) {
             return;
         }
 
-        const routeHere = router.createRoute(targetLat, targetLng, targetBuilding, isIndoor);
+        const marker = isIndoor ? { floor: btn.dataset.floor || null, name: locationName } : null;
+        const routeHere = await router.createRoute(targetLat, targetLng, targetBuilding, isIndoor, null, marker);
         if (routeHere) {
             let successMessage = `✅ Route created to ${locationName}!`;
             if (isIndoor && targetBuilding) {
-                successMessage = `✅ Route created to ${targetBuilding}! The path will lead you to the building entrance.`;
+                successMessage = `✅ Route created to ${locationName} in ${targetBuilding}!`;
             }
             alert(successMessage);
             showRouteInfoPopup(routeHere, locationName);
@@ -627,7 +627,8 @@ async function openLocationPopup(mode) {
                 <button class="path-btn" 
                         data-lat="${loc.latitude}" 
                         data-lng="${loc.longitude}"
-                        data-name="${loc.name}">
+                        data-name="${loc.name}"
+                        ${loc.type === "indoor" ? `data-indoor="true" data-building="${buildings[loc.building]?.name || ""}" data-floor="${loc.floor}"` : ""}>
                     Get directions
                 </button>
                 ${mode === "edit" && !loc.code ? 
@@ -1238,12 +1239,29 @@ const outdoorMarkers = L.layerGroup().addTo(map);
 const buildingMarkers = L.layerGroup().addTo(map);
 
 // ---------- LOAD MARKERS ----------
+// Only the markers in view are fetched; below zoom 18 the server groups them into clusters
+let markerRequest = 0;
+
 async function loadMarkers() {
-    const response = await fetch("/api/markers");
+    // Fetch a bit more than the view so small pans don't show empty edges
+    const bounds = map.getBounds().pad(0.25);
+    const params = new URLSearchParams({
+        bbox: [bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()]
+            .map(v => v.toFixed(6)).join(","),
+        zoom: map.getZoom()
+    });
+
+    const request = ++markerRequest;
+    const response = await fetch(`/api/markers?${params}`);
     const data = await response.json();
-    addMarkersToMap(data);
+    if (request !== markerRequest) return; // the map moved again while this was loading
+
+    addMarkersToMap(data.markers);
+    addClustersToMap(data.clusters);
 }
 
+map.on("moveend", loadMarkers);
+
 // ---------- ADD MARKERS ----------
 function addMarkersToMap(data) {
     outdoorMarkers.clearLayers();
@@ -1278,6 +1296,21 @@ function addMarkersToMap(data) {
     });
 }
 
+// ---------- ADD CLUSTERS ----------
+function addClustersToMap(clusters) {
+    clusters.forEach(c => {
+        L.marker([c.latitude, c.longitude], {
+            icon: L.divIcon({
+                className: "marker-cluster",
+                html: `<div>${c.count}</div>`,
+                iconSize: [36, 36]
+            })
+        })
+        .on("click", () => map.fitBounds(c.bounds, { padding: [40, 40] }))
+        .addTo(outdoorMarkers);
+    });
+}
+
 const darkModeToggle = document.getElementById('darkModeFab');
 
 // Toggle on click
@@ -0,0 +1,75 @@
+"""Exporting the markers and importing the file back must leave the database exactly as it was."""
+import io, os, shutil, sqlite3
+import pytest
+import app
+
+
+REAL_DB = os.path.join(os.path.dirname(__file__), "..", "instance", "cyberpath.db")
+TABLES = {
+    "marker": "id, name, latitude, longitude, description, category_id",
+    "indoor_marker": "id, building, floor, name, latitude, longitude, description, category_id",
+}
+
+
+def make_client(path):
+    flask_app = app.create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}",
+                                "EMAIL_OUTBOX_WORKER": False, "LOG_LEVEL": "WARNING"})
+    with flask_app.app_context():
+        app.init_db()
+    client = flask_app.test_client()
+    with client.session_transaction() as session:
+        session["admin_logged_in"] = True
+    return client
+
+
+def snapshot(path):
+    with sqlite3.connect(path) as connection:
+        return {table: connection.execute(f"SELECT {columns} FROM {table} ORDER BY id").fetchall()
+                for table, columns in TABLES.items()}
+
+
+@pytest.fixture
+def real_db(tmp_path):
+    path = tmp_path / "real.db"
+    shutil.copy(REAL_DB, path)
+    return path
+
+
+def export(client, fmt):
+    response = client.get(f"/api/admin/markers/export?format={fmt}")
+    assert response.status_code == 200
+    return response.data
+
+
+def import_file(client, data, fmt):
+    response = client.post("/api/admin/markers/import",
+                           data={"file": (io.BytesIO(data), f"markers.{fmt}")},
+                           content_type="multipart/form-data")
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+@pytest.mark.parametrize("fmt", ["csv", "geojson"])
+def test_real_db_imports_back_unchanged(real_db, fmt):
+    client = make_client(real_db)
+    before = snapshot(real_db)
+    assert any(row[-1] is None for row in before["indoor_marker"])  # uncategorized indoor markers
+
+    result = import_file(client, export(client, fmt), fmt)
+
+    assert result["inserted"] == 0
+    assert result["updated"] == sum(len(rows) for rows in before.values())
+    assert snapshot(real_db) == before
+
+
+@pytest.mark.parametrize("fmt", ["csv", "geojson"])
+def test_real_db_imports_into_empty_db(real_db, tmp_path, fmt):
+    data = export(make_client(real_db), fmt)
+    empty = tmp_path / "empty.db"
+    client = make_client(empty)
+
+    result = import_file(client, data, fmt)
+
+    expected = snapshot(real_db)
+    assert result["inserted"] == sum(len(rows) for rows in expected.values())
+    assert snapshot(empty) == expected
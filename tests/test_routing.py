@@ -0,0 +1,47 @@
+"""Admin walkway changes reweight routes, but the distances reported must stay in walking meters."""
+import os
+import pytest
+from routing import WalkwayGraph
+
+
+WALKWAY_GEOJSON = os.path.join(os.path.dirname(__file__), "..", "static", "newcampus.geojson")
+START = (2.9275, 101.6425)
+END = (2.92863, 101.64111)
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return WalkwayGraph.load(WALKWAY_GEOJSON)
+
+
+def route_fid(graph, route):
+    """A GeoJSON fid of one of the edges the route walks along"""
+    nodes = [graph.index.nearest(lat, lng)[0] for lat, lng in route["path"]]
+    for a, b in zip(nodes, nodes[1:]):
+        for i in range(graph.offsets[a], graph.offsets[a + 1]):
+            if graph.targets[i] == b and graph.edge_fids[i] in graph.feature_ids:
+                return graph.edge_fids[i]
+    pytest.fail("route has no GeoJSON edges")
+
+
+@pytest.mark.parametrize("profile", ["default", "step_free"])
+def test_cost_change_keeps_distance_in_meters(graph, profile):
+    before = graph.route(*START, *END, profile=profile)
+    changed = graph.with_changes([{"kind": "cost", "fid": route_fid(graph, before), "factor": 1.01}])
+
+    after = changed.route(*START, *END, profile=profile)
+
+    assert after["path"] == before["path"]
+    assert after["cost"] > before["cost"]
+    assert after["distance"] == pytest.approx(before["distance"])
+
+
+def test_cost_change_keeps_distances_from_in_meters(graph):
+    before = graph.route(*START, *END)
+    goal = graph.snap(*END)
+    changed = graph.with_changes([{"kind": "cost", "fid": route_fid(graph, before), "factor": 1.01}])
+
+    cost, meters = changed.distances_from(*START, {goal})[goal]
+
+    assert cost > before["distance"]
+    assert meters == pytest.approx(before["distance"])